@@ -0,0 +1,128 @@
+"""
+Native balance service shared by the wallet screens.
+
+All balances a screen needs are fetched in one JSON-RPC batch together
+with ``eth_blockNumber``; each result is cached with the block it was read
+at, so re-rendering a menu within the same block costs no RPC call.
+
+While a block subscriber is live, entries are only dropped when a block
+touches their address, and otherwise stay valid for BALANCE_TRACKED_TTL.
+The subscriber also reports the block of every change, and an entry read
+at an earlier block is never served, even if it was stored after the
+change was processed.
+"""
+import logging
+import time
+
+from web3 import Web3
+
+import clients
+from cache import SingleFlight
+from config import BALANCE_CACHE_TTL, BALANCE_TRACKED_TTL
+from metrics import track_cache
+
+logger = logging.getLogger(__name__)
+
+
+class BalanceService:
+    """Batched, block-tagged cache of native balances keyed by address."""
+
+    def __init__(self, ttl=BALANCE_CACHE_TTL, tracked_ttl=BALANCE_TRACKED_TTL):
+        self.ttl = ttl
+        self.tracked_ttl = tracked_ttl
+        self.tracker = None
+        self.head_block = 0
+        self._cache = {}
+        # address -> last block that changed its balance; entries read before it are stale
+        self._changed_at = {}
+        # Entries read before this block are stale (blocks were skipped)
+        self._min_block = 0
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _cached(self, address):
+        entry = self._cache.get(address)
+        if entry is None:
+            return None
+        block, balance, fetched_at = entry
+        if block < max(self._min_block, self._changed_at.get(address, 0)):
+            return None
+        ttl = self.tracked_ttl if self.tracker is not None and self.tracker.live else self.ttl
+        if time.monotonic() - fetched_at > ttl:
+            return None
+        return balance
+
+    async def get_balances(self, addresses):
+        """Return ``{address: balance in wei}``; unreadable balances map to None."""
+        addresses = [Web3.to_checksum_address(a) for a in addresses]
+        balances = {}
+        missing = []
+        for address in addresses:
+            balance = self._cached(address)
+            if balance is None:
+                missing.append(address)
+            else:
+                balances[address] = balance
+        self.hits += len(addresses) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            key = tuple(sorted(set(missing)))
+            try:
+                balances.update(await self._flight.do(key, lambda: self._fetch(key)))
+            except Exception as e:
+                logger.error(f"Error fetching balances: {str(e)}")
+                for address in missing:
+                    balances[address] = None
+        return balances
+
+    async def _fetch(self, addresses):
+        calls = [("eth_blockNumber", [])]
+        calls += [("eth_getBalance", [address, "latest"]) for address in addresses]
+        results = await clients.rpc_batch(calls)
+
+        # Balances are read at "latest", so at this block or a later one
+        block = results[0]
+        block = 0 if isinstance(block, clients.RPCError) else int(block, 16)
+        self.head_block = max(self.head_block, block)
+
+        now = time.monotonic()
+        balances = {}
+        for address, result in zip(addresses, results[1:]):
+            if isinstance(result, clients.RPCError):
+                balances[address] = None
+                continue
+            balance = int(result, 16)
+            self._cache[address] = (block, balance, now)
+            balances[address] = balance
+        return balances
+
+    def invalidate(self, address, block=None):
+        """Drop the cached balance of an address, changed at ``block`` if known."""
+        address = Web3.to_checksum_address(address)
+        self._cache.pop(address, None)
+        if block is not None:
+            self._changed_at[address] = max(block, self._changed_at.get(address, 0))
+
+    def clear(self, block=None):
+        """Drop every cached balance; with ``block``, entries read before it are stale too."""
+        self._cache.clear()
+        if block is not None:
+            self._min_block = max(self._min_block, block)
+            # Covered by the new minimum
+            self._changed_at.clear()
+
+
+def format_balance(balance, decimals=4):
+    """Format a wei balance for display."""
+    if balance is None:
+        return "N/A"
+    return f"{Web3.from_wei(balance, 'ether'):.{decimals}f}"
+
+
+balance_service = BalanceService()
+track_cache("balances", balance_service)
@@ -0,0 +1,141 @@
+"""
+Benchmark a token lookup with per-call clients versus the shared client pool.
+
+Starts a local mock JSON-RPC / Kuru server that charges an artificial
+handshake delay on every new TCP connection, then compares:
+
+* per-call: a fresh aiohttp session for the RPC and for every Kuru request,
+  which is what fetch_token_info used to do
+* shared:   the pooled session and JSON-RPC client from clients.py
+
+Usage:
+    python benchmarks/bench_client_pool.py [--lookups 50] [--handshake-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+PORT = _free_port()
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+os.environ["MONAD_RPC_URL"] = f"http://127.0.0.1:{PORT}/rpc"
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+import clients  # noqa: E402
+
+TOKEN = "0x742d35Cc6634C0532925a3b844Bc454e4438f44e"
+UINT_RESULT = "0x" + "0" * 62 + "12"
+STRING_RESULT = (
+    "0x" + "0" * 62 + "20" + "0" * 63 + "4" + "54455354" + "0" * 56
+)
+
+
+def make_app(handshake_delay):
+    seen_transports = set()
+
+    @web.middleware
+    async def handshake(request, handler):
+        # Charge the simulated TCP/TLS setup cost once per connection
+        transport = id(request.transport)
+        if transport not in seen_transports:
+            seen_transports.add(transport)
+            await asyncio.sleep(handshake_delay)
+        return await handler(request)
+
+    async def rpc(request):
+        payload = await request.json()
+        calls = payload if isinstance(payload, list) else [payload]
+        results = []
+        for call in calls:
+            data = call["params"][0].get("data", "") if call["method"] == "eth_call" else ""
+            result = STRING_RESULT if data[:10] in ("0x06fdde03", "0x95d89b41") else UINT_RESULT
+            if call["method"] == "eth_chainId":
+                result = "0x1"
+            results.append({"jsonrpc": "2.0", "id": call["id"], "result": result})
+        return web.json_response(results if isinstance(payload, list) else results[0])
+
+    async def kuru(request):
+        return web.json_response({"price": "0.001", "liquidity": "1000"})
+
+    app = web.Application(middlewares=[handshake])
+    app.router.add_post("/rpc", rpc)
+    app.router.add_get("/v1/{tail:.*}", kuru)
+    return app
+
+
+async def lookup_per_call(base_url):
+    async with aiohttp.ClientSession() as session:
+        for i, selector in enumerate(("0x06fdde03", "0x95d89b41", "0x313ce567", "0x18160ddd")):
+            payload = {
+                "jsonrpc": "2.0",
+                "id": i,
+                "method": "eth_call",
+                "params": [{"to": TOKEN, "data": selector}, "latest"]
+            }
+            async with session.post(os.environ["MONAD_RPC_URL"], json=payload) as response:
+                await response.json()
+    for path in ("tokens", "pairs", "tokens/social"):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{base_url}/v1/{path}/{TOKEN}") as response:
+                await response.json()
+
+
+async def lookup_shared(base_url):
+    for selector in ("0x06fdde03", "0x95d89b41", "0x313ce567", "0x18160ddd"):
+        await clients.rpc_call("eth_call", [{"to": TOKEN, "data": selector}, "latest"])
+    session = clients.get_session()
+    for path in ("tokens", "pairs", "tokens/social"):
+        async with session.get(f"{base_url}/v1/{path}/{TOKEN}") as response:
+            await response.json()
+
+
+async def measure(name, lookup, base_url, lookups):
+    timings = []
+    for _ in range(lookups):
+        start = time.perf_counter()
+        await lookup(base_url)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(
+        f"{name:>9}: mean {statistics.mean(timings):7.2f} ms  "
+        f"p50 {timings[len(timings) // 2]:7.2f} ms  "
+        f"p95 {timings[int(len(timings) * 0.95) - 1]:7.2f} ms"
+    )
+    return statistics.mean(timings)
+
+
+async def main(lookups, handshake_ms):
+    runner = web.AppRunner(make_app(handshake_ms / 1000))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    base_url = f"http://127.0.0.1:{PORT}"
+
+    try:
+        per_call = await measure("per-call", lookup_per_call, base_url, lookups)
+        shared = await measure("shared", lookup_shared, base_url, lookups)
+        print(f"speedup: {per_call / shared:.1f}x")
+    finally:
+        await clients.close()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lookups", type=int, default=50)
+    parser.add_argument("--handshake-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.lookups, args.handshake_ms))
@@ -0,0 +1,128 @@
+"""
+Load-test the webhook ingestion path by replaying Telegram updates.
+
+Updates are read from a JSONL file (one recorded update per line) or
+synthesized across a number of chats, then POSTed concurrently to the
+webhook endpoint. Without --url a local WebhookServer is started whose
+handler simulates --work-ms of processing and checks that every chat's
+updates are processed in order.
+
+Usage:
+    python benchmarks/replay_updates.py [--updates recorded.jsonl] [--count 5000]
+                                        [--chats 200] [--concurrency 100]
+                                        [--url URL --secret WEBHOOK_SECRET]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+
+import aiohttp  # noqa: E402
+from telegram import Bot  # noqa: E402
+
+from webhook import SECRET_HEADER, WebhookServer  # noqa: E402
+
+
+def synthesize_updates(count, chats):
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = 1000 + update_id % chats
+        updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+                "text": "0x742d35Cc6634C0532925a3b844Bc454e4438f44e"
+            }
+        })
+    return updates
+
+
+def load_updates(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def replay(url, updates, concurrency, secret):
+    statuses = Counter()
+    latencies = []
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async def sender(session):
+        while not queue.empty():
+            update = queue.get_nowait()
+            start = time.perf_counter()
+            async with session.post(url, json=update, headers={SECRET_HEADER: secret}) as response:
+                statuses[response.status] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*[sender(session) for _ in range(concurrency)])
+    return statuses, latencies
+
+
+async def main(args):
+    updates = load_updates(args.updates) if args.updates else synthesize_updates(args.count, args.chats)
+
+    server = None
+    processed = defaultdict(list)
+    url = args.url
+    if url is None:
+        async def process_update(update):
+            await asyncio.sleep(args.work_ms / 1000)
+            processed[update.effective_chat.id if update.effective_chat else 0].append(update.update_id)
+
+        server = WebhookServer(
+            process_update,
+            Bot(os.environ["TELEGRAM_BOT_TOKEN"]),
+            listen="127.0.0.1",
+            port=args.port,
+            path="/telegram",
+            secret_token=args.secret
+        )
+        await server.start()
+        url = f"http://127.0.0.1:{args.port}/telegram"
+
+    start = time.perf_counter()
+    statuses, latencies = await replay(url, updates, args.concurrency, args.secret)
+    accepted = time.perf_counter() - start
+
+    if server is not None:
+        await server.stop()
+    total = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"updates:     {len(updates)} ({dict(statuses)})")
+    print(f"ingest:      {len(updates) / accepted:8.0f} updates/s")
+    print(f"latency:     p50 {latencies[len(latencies) // 2]:.2f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms  "
+          f"mean {statistics.mean(latencies):.2f} ms")
+    if server is not None:
+        out_of_order = sum(1 for ids in processed.values() if ids != sorted(ids))
+        print(f"processed:   {sum(len(ids) for ids in processed.values()) / total:8.0f} updates/s")
+        print(f"rejected:    {server.rejected}")
+        print(f"chats out of order: {out_of_order}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--updates", help="JSONL file of recorded updates")
+    parser.add_argument("--count", type=int, default=5000, help="updates to synthesize")
+    parser.add_argument("--chats", type=int, default=200, help="distinct chats to synthesize")
+    parser.add_argument("--concurrency", type=int, default=100, help="concurrent senders")
+    parser.add_argument("--work-ms", type=float, default=2.0, help="simulated handler time")
+    parser.add_argument("--port", type=int, default=18443, help="port of the local server")
+    parser.add_argument("--url", help="replay against an already running webhook instead")
+    parser.add_argument("--secret", default="replay-secret", help="webhook secret token")
+    asyncio.run(main(parser.parse_args()))
@@ -1,17 +1,19 @@
 import logging
-import json
 import os
-import aiohttp
 import asyncio
 import requests
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
 from telegram.ext import (
-    Updater,
+    Application,
+    ApplicationHandlerStop,
     CommandHandler,
-    CallbackContext,
+    ContextTypes,
     CallbackQueryHandler,
     MessageHandler,
-    Filters
+    TypeHandler,
+    filters
 )
 from web3 import Web3
 from eth_account import Account
@@ -21,9 +23,78 @@ from config import (
     MONAD_RPC_URL, 
     EXPLORER_URL,
     CHAIN_ID,
-    NATIVE_SYMBOL
+    NATIVE_SYMBOL,
+    DATA_DIR,
+    USERS_FILE,
+    USERS_DB_FILE,
+    ORDERS_DB_FILE,
+    PORTFOLIO_DB_FILE,
+    PRICES_DB_FILE,
+    BLOCKS_DB_FILE,
+    STATE_DB_FILE,
+    STATE_FLUSH_INTERVAL,
+    USER_STORE_BACKEND,
+    USER_STORE_FLUSH_MS,
+    ORDERS_PER_PAGE,
+    CONCURRENT_UPDATES,
+    BOT_MODE,
+    SHARD_COUNT,
+    SHARD_INDEX,
+    SHARD_LISTEN,
+    SHARD_PORT,
+    SHARD_PATH,
+    SHARD_SECRET,
+    BLOCK_SUBSCRIBER_ENABLED,
+    DEFAULT_SLIPPAGE,
+    DEFAULT_GAS_PRICE,
+    BUY_AMOUNTS,
+    SELL_PERCENTAGES,
+    CHART_INTERVALS,
+    DEFAULT_CHART_INTERVAL,
+    METRICS_ENABLED,
+    METRICS_LISTEN,
+    METRICS_PORT,
+    MAX_REQUESTS_PER_MINUTE,
+    MAX_TRADES_PER_MINUTE,
+    REQUEST_BURST,
+    TRADE_BURST
+)
+from storage import create_user_store, SqliteStatePersistence
+import clients
+from token_info import (
+    fetch_token_info,
+    fetch_token_prices,
+    get_token_metadata,
+    get_many_token_metadata,
+    invalidate_token,
+    clear_market_data
+)
+from webhook import ChatOrderedUpdateProcessor, WebhookServer, run_webhook
+from sharding import shard_for
+from router import CallbackRouter
+from balances import balance_service, format_balance
+from subscriber import AddressIndex, BlockRelay, BlockSubscriber, SharedAddressIndex, SqliteBlockStore
+from transactions import TransactionError, send_native, send_erc20, wait_for_receipt
+from trading import TradeError, snipe_engine
+from orders import OrderEngine, SqliteOrderStore, ACTIVE, EXECUTING, FILLED
+from price_feed import PriceFeed, SqlitePriceExchange
+from charts import ChartCache
+from portfolio import HoldingsService, SqliteScanStore
+from metrics import registry, queue_depth, start_metrics_server, timed, track_cache
+from ratelimit import RateLimiter
+from outbound import BACKGROUND, OutboundLimiter
+from keyboards import (
+    CachedKeyboard,
+    KeyboardCache,
+    wallet_buttons,
+    MAIN_MENU_KEYBOARD,
+    WALLET_MENU_KEYBOARD,
+    MANAGE_ORDERS_KEYBOARD,
+    SLIPPAGE_KEYBOARD,
+    GAS_KEYBOARD
 )
 import time
+from decimal import Decimal
 
 # Set up logging
 logging.basicConfig(
@@ -32,69 +103,136 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+handler_latency = registry.histogram(
+    "handler_latency_seconds", "Command and text handler latency", ["handler", "state"]
+)
+
+# Per-user budgets, checked before any handler runs
+request_limiter = RateLimiter("requests", MAX_REQUESTS_PER_MINUTE / 60, REQUEST_BURST)
+trade_limiter = RateLimiter("trades", MAX_TRADES_PER_MINUTE / 60, TRADE_BURST)
+rate_limit_buckets = registry.gauge("rate_limit_buckets", "Users with a partly spent rate limit", ["limit"])
+rate_limit_buckets.labels("requests").set_function(lambda: len(request_limiter))
+rate_limit_buckets.labels("trades").set_function(lambda: len(trade_limiter))
+
 # Initialize Web3
 w3 = Web3(Web3.HTTPProvider(MONAD_RPC_URL))
 
 # User data storage
-USERS_FILE = "data/users.json"
-os.makedirs("data", exist_ok=True)
+os.makedirs(DATA_DIR, exist_ok=True)
+user_store = create_user_store(
+    USER_STORE_BACKEND,
+    USERS_FILE,
+    USERS_DB_FILE,
+    flush_interval=USER_STORE_FLUSH_MS / 1000
+)
+
+def owns_user(user_id):
+    """Whether this process serves a user; always true unless sharded."""
+    return shard_for(user_id) == SHARD_INDEX
 
 def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    return {user_id: user for user_id, user in user_store.load_all().items() if owns_user(user_id)}
 
-def save_users(users):
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f)
+def save_user(user_id):
+    """Queue a single user's record to be persisted after it has been modified."""
+    user_store.save(user_id, users[user_id])
+    addresses = [wallet["address"] for wallet in users[user_id]["wallets"]]
+    address_index.set_user(user_id, addresses)
+    if block_store is not None:
+        block_store.set_user(SHARD_INDEX, user_id, addresses)
+    wallet_keyboards.invalidate(user_id)
+
+def flush_users():
+    """Write pending user changes to disk; called on shutdown."""
+    user_store.close()
 
 users = load_users()
+# Keyboards listing a user's wallets; invalidated by save_user
+wallet_keyboards = KeyboardCache()
+
+# Wallet address -> user ids, used to match on-chain activity to users
+address_index = AddressIndex()
+for _user_id, _user in users.items():
+    address_index.set_user(_user_id, [wallet["address"] for wallet in _user["wallets"]])
+
+if SHARD_COUNT > 1:
+    # Shard 0 follows the chain for every shard; each worker reads its own events back
+    block_store = SqliteBlockStore(BLOCKS_DB_FILE)
+    block_store.set_shard(SHARD_INDEX, {
+        _user_id: [wallet["address"] for wallet in _user["wallets"]] for _user_id, _user in users.items()
+    })
+    block_subscriber = BlockRelay(block_store, SHARD_INDEX)
+    if SHARD_INDEX == 0:
+        shared_index = SharedAddressIndex(block_store)
+        shared_index.refresh()
+        chain_follower = BlockSubscriber(shared_index)
+        chain_follower.subscribe(shared_index.publish)
+    else:
+        chain_follower = None
+else:
+    block_store = None
+    block_subscriber = chain_follower = BlockSubscriber(address_index)
+
+def on_block_events(events):
+    """Invalidate cached balances, token cards and trade templates touched by new blocks.
+
+    Only transfers involving the bot's wallets count; other trades of a token
+    are left to the market data and template TTLs.
+    """
+    if events.gap:
+        balance_service.clear(events.block)
+        clear_market_data()
+        snipe_engine.invalidate_all()
+        return
+    for address in events.native:
+        balance_service.invalidate(address, events.block)
+    for token in {token for _, token in events.token_transfers}:
+        invalidate_token(token)
+        snipe_engine.invalidate_token(token)
+
+block_subscriber.subscribe(on_block_events)
+
+holdings_service = HoldingsService(address_index, SqliteScanStore(PORTFOLIO_DB_FILE))
+block_subscriber.subscribe(holdings_service.on_block)
+
+async def execute_order(order):
+    """Trade a triggered limit order through the snipe engine."""
+    wallets = users.get(order["user_id"], {}).get("wallets", [])
+    wallet = next((w for w in wallets if w["address"] == order["wallet"]), None)
+    if wallet is None:
+        raise TradeError("The order's wallet no longer exists")
+    template = await snipe_engine.prepare(
+        order["user_id"], order["type"], wallet, order["token"],
+        gas_price_wei(order["gas_price"]), order["slippage"]
+    )
+    started = time.perf_counter()
+    if order["type"] == "buy":
+        tx_hash, _ = await snipe_engine.buy(template, Web3.to_wei(Decimal(order["amount"]), 'ether'), started)
+    else:
+        tx_hash, _ = await snipe_engine.sell(template, int(order["amount"]), started)
+    return tx_hash
+
+# Limit orders live outside user_data so they trigger while the user is away
+order_store = SqliteOrderStore(ORDERS_DB_FILE)
+order_engine = OrderEngine(order_store, execute_order, confirm=wait_for_receipt)
+
+# One poller prices every token that is viewed, held or has open orders
+# Sharded workers each poll a part of the tokens and share the prices
+price_exchange = SqlitePriceExchange(PRICES_DB_FILE, SHARD_INDEX, SHARD_COUNT) if SHARD_COUNT > 1 else None
+price_feed = PriceFeed(fetch_token_prices, exchange=price_exchange)
+price_feed.add_source(order_engine.tokens)
+price_feed.add_source(holdings_service.tokens)
+price_feed.subscribe(order_engine.on_price)
+chart_cache = ChartCache(price_feed)
+track_cache("charts", chart_cache)
 
 def get_main_menu_keyboard():
-    """Create the main menu inline keyboard."""
-    keyboard = [
-        [
-            InlineKeyboardButton("🛒 Buy a Token", callback_data="buy_token"),
-            InlineKeyboardButton("💰 Sell a Token", callback_data="sell_token")
-        ],
-        [
-            InlineKeyboardButton("👛 Wallets", callback_data="wallets"),
-            InlineKeyboardButton("📊 Portfolio", callback_data="portfolio")
-        ],
-        [
-            InlineKeyboardButton("👥 Referral", callback_data="referral"),
-            InlineKeyboardButton("📤 Withdraw", callback_data="withdraw")
-        ],
-        [
-            InlineKeyboardButton("📋 Manage Orders", callback_data="manage_orders"),
-            InlineKeyboardButton("⚙️ Config", callback_data="config")
-        ],
-        [
-            InlineKeyboardButton("📖 Trading Bot Guide", callback_data="guide")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    """Return the main menu inline keyboard."""
+    return MAIN_MENU_KEYBOARD
 
 def get_wallet_menu_keyboard():
-    """Create the wallet management inline keyboard."""
-    keyboard = [
-        [
-            InlineKeyboardButton("➕ New Wallet", callback_data="new_wallet"),
-            InlineKeyboardButton("➕ New X Wallets", callback_data="new_x_wallets")
-        ],
-        [
-            InlineKeyboardButton("🔑 Import Wallet", callback_data="import_wallet"),
-            InlineKeyboardButton("🗑️ Delete Wallet", callback_data="delete_wallet")
-        ],
-        [
-            InlineKeyboardButton("👁️ Show Private Key", callback_data="show_private_key")
-        ],
-        [
-            InlineKeyboardButton("⬅️ Main Menu", callback_data="main_menu")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    """Return the wallet management inline keyboard."""
+    return WALLET_MENU_KEYBOARD
 
 def get_withdraw_menu_keyboard(selected_wallet=None):
     """Create the withdraw menu keyboard."""
@@ -110,20 +248,23 @@ def get_withdraw_menu_keyboard(selected_wallet=None):
     return InlineKeyboardMarkup(keyboard)
 
 def get_wallet_selection_keyboard(user_id: str, action: str):
-    """Create keyboard for wallet selection."""
-    keyboard = []
-    if user_id in users and users[user_id]["wallets"]:
-        for i, wallet in enumerate(users[user_id]["wallets"]):
-            address = wallet["address"]
-            short_address = f"{address[:6]}...{address[-4:]}"
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"💼 {short_address}",
-                    callback_data=f"select_wallet_{action}_{i}"
-                )
-            ])
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="main_menu")])
-    return InlineKeyboardMarkup(keyboard)
+    """Return the keyboard for wallet selection."""
+    def build():
+        keyboard = wallet_buttons(users.get(user_id, {}).get("wallets", []), "💼", f"select_wallet_{action}_")
+        keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="main_menu")])
+        return CachedKeyboard(keyboard)
+    return wallet_keyboards.get(user_id, ("select", action), build)
+
+async def delete_message_job(context: ContextTypes.DEFAULT_TYPE):
+    """Delete a message scheduled for removal, e.g. one showing a private key."""
+    job = context.job
+    await context.bot.delete_message(chat_id=job.chat_id, message_id=job.data)
+
+async def get_wallet_balances(user_id: str):
+    """Fetch the formatted balances of all of a user's wallets in one batch."""
+    wallets = users.get(user_id, {}).get("wallets", [])
+    balances = await balance_service.get_balances([wallet["address"] for wallet in wallets])
+    return [format_balance(balances.get(wallet["address"])) for wallet in wallets]
 
 def generate_new_wallet():
     """Generate a new wallet with private key."""
@@ -135,7 +276,24 @@ def generate_new_wallet():
         "encrypted_key": "encrypted_" + private_key  # Use proper encryption in production
     }
 
-def start(update: Update, context: CallbackContext):
+async def enforce_rate_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Drop updates of users over MAX_REQUESTS_PER_MINUTE before any handler runs."""
+    user = update.effective_user
+    if user is None or request_limiter.allow(user.id):
+        return
+    # Tell the user once per burst; further updates are dropped silently
+    if request_limiter.rejections(user.id) == 1:
+        text = f"⏳ Too many requests. Please wait {request_limiter.retry_after(user.id):.0f}s."
+        if update.callback_query:
+            context.application.create_task(update.callback_query.answer(text))
+        elif update.effective_message:
+            context.application.create_task(update.effective_message.reply_text(text))
+    elif update.callback_query:
+        context.application.create_task(update.callback_query.answer())
+    raise ApplicationHandlerStop
+
+@timed(handler_latency, ("start", ""))
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send welcome message and main menu when the command /start is issued."""
     user_id = str(update.effective_user.id)
     username = update.effective_user.username or "Anonymous"
@@ -154,7 +312,7 @@ def start(update: Update, context: CallbackContext):
                 "gas_settings": "standard"
             }
         }
-        save_users(users)
+        save_user(user_id)
         
         # Send private key securely
         private_key_message = (
@@ -166,25 +324,28 @@ def start(update: Update, context: CallbackContext):
             "• Store it safely\n"
             "• We will delete this message in 60 seconds"
         )
-        key_msg = context.bot.send_message(
+        key_msg = await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=private_key_message,
             parse_mode='Markdown'
         )
         # Delete private key message after 60 seconds
         context.job_queue.run_once(
-            lambda ctx: key_msg.delete(),
-            60
+            delete_message_job,
+            60,
+            chat_id=key_msg.chat_id,
+            data=key_msg.message_id
         )
     
     # Get user's primary wallet address
     primary_wallet = users[user_id]["wallets"][0]["address"]
+    balances = await get_wallet_balances(user_id)
     
     welcome_text = (
         "Welcome to Monad Sniper Bot! 🚀\n\n"
         "Trade tokens effortlessly on the Monad Blockchain—fast, secure, and reliable.\n\n"
         f"🏦 Your Wallet:\n`{primary_wallet}`\n\n"
-        "💰 Balance: 0 $MON\n\n"
+        f"💰 Balance: {balances[0]} ${NATIVE_SYMBOL}\n\n"
         "More blockchain support coming soon...\n\n"
         "Bonus: Refer friends and earn UP TO 50% of Platform Revenue!"
     )
@@ -192,13 +353,13 @@ def start(update: Update, context: CallbackContext):
     if is_new_user:
         welcome_text += "\n\n⚠️ New wallet generated! Check above message for private key!"
     
-    update.message.reply_text(
+    await update.message.reply_text(
         welcome_text,
         parse_mode='Markdown',
         reply_markup=get_main_menu_keyboard()
     )
 
-def show_wallets(update: Update, context: CallbackContext):
+async def show_wallets(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show wallet management interface."""
     query = update.callback_query
     user_id = str(query.from_user.id)
@@ -206,8 +367,8 @@ def show_wallets(update: Update, context: CallbackContext):
     text = "👛 Wallets Management\n\n"
     if user_id in users and users[user_id]["wallets"]:
         text += "Connected Wallets:\n"
-        for i, wallet in enumerate(users[user_id]["wallets"], 1):
-            balance = "0.0"  # You can add balance fetching here
+        balances = await get_wallet_balances(user_id)
+        for i, (wallet, balance) in enumerate(zip(users[user_id]["wallets"], balances), 1):
             text += f"{i}. `{wallet['address'][:6]}...{wallet['address'][-4:]}`\n"
             text += f"   Balance: {balance} {NATIVE_SYMBOL}\n\n"
     else:
@@ -215,13 +376,13 @@ def show_wallets(update: Update, context: CallbackContext):
     
     text += "Choose an option below:"
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         parse_mode='Markdown',
         reply_markup=get_wallet_menu_keyboard()
     )
 
-def handle_new_wallet(update: Update, context: CallbackContext):
+async def handle_new_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle new wallet creation."""
     query = update.callback_query
     user_id = str(query.from_user.id)
@@ -240,7 +401,7 @@ def handle_new_wallet(update: Update, context: CallbackContext):
         }
     
     users[user_id]["wallets"].append(new_wallet)
-    save_users(users)
+    save_user(user_id)
     
     # Send private key securely
     private_key_message = (
@@ -254,7 +415,7 @@ def handle_new_wallet(update: Update, context: CallbackContext):
         "• We will delete this message in 60 seconds"
     )
     
-    key_msg = context.bot.send_message(
+    key_msg = await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text=private_key_message,
         parse_mode='Markdown'
@@ -262,14 +423,16 @@ def handle_new_wallet(update: Update, context: CallbackContext):
     
     # Delete private key message after 60 seconds
     context.job_queue.run_once(
-        lambda ctx: key_msg.delete(),
-        60
+        delete_message_job,
+        60,
+        chat_id=key_msg.chat_id,
+        data=key_msg.message_id
     )
     
     # Update the wallet list display
-    show_wallets(update, context)
+    await show_wallets(update, context)
 
-def handle_new_x_wallets(update: Update, context: CallbackContext):
+async def handle_new_x_wallets(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle creation of multiple wallets."""
     query = update.callback_query
     
@@ -279,7 +442,7 @@ def handle_new_x_wallets(update: Update, context: CallbackContext):
         "Reply with a number between 1 and 10."
     )
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         reply_markup=InlineKeyboardMarkup([[
             InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -289,7 +452,7 @@ def handle_new_x_wallets(update: Update, context: CallbackContext):
     # Set the next state to handle the number input
     context.user_data['waiting_for'] = 'num_wallets'
 
-def handle_import_wallet(update: Update, context: CallbackContext):
+async def handle_import_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle wallet import."""
     query = update.callback_query
     
@@ -299,7 +462,7 @@ def handle_import_wallet(update: Update, context: CallbackContext):
         "Reply with your private key or click Back to cancel."
     )
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         reply_markup=InlineKeyboardMarkup([[
             InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -309,13 +472,13 @@ def handle_import_wallet(update: Update, context: CallbackContext):
     # Set the next state to handle the private key input
     context.user_data['waiting_for'] = 'private_key'
 
-def handle_delete_wallet(update: Update, context: CallbackContext):
+async def handle_delete_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle wallet deletion."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
     if user_id not in users or not users[user_id]["wallets"]:
-        query.message.edit_text(
+        await query.message.edit_text(
             "You don't have any wallets to delete.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -323,35 +486,26 @@ def handle_delete_wallet(update: Update, context: CallbackContext):
         )
         return
     
-    # Create keyboard with all user's wallets
-    keyboard = []
-    for i, wallet in enumerate(users[user_id]["wallets"]):
-        address = wallet["address"]
-        short_address = f"{address[:6]}...{address[-4:]}"
-        keyboard.append([
-            InlineKeyboardButton(
-                f"💼 {short_address}",
-                callback_data=f"confirm_delete_{i}"
-            )
-        ])
-    
-    # Add back button
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="wallets")])
+    # Keyboard with all user's wallets
+    def build():
+        keyboard = wallet_buttons(users[user_id]["wallets"], "💼", "confirm_delete_")
+        keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="wallets")])
+        return CachedKeyboard(keyboard)
     
-    query.message.edit_text(
+    await query.message.edit_text(
         "Select a wallet to delete:\n\n"
         "⚠️ Warning: This action cannot be undone!\n"
         "Make sure you have backed up any important wallets.",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=wallet_keyboards.get(user_id, "delete", build)
     )
 
-def confirm_delete_wallet(update: Update, context: CallbackContext, wallet_index: int):
+async def confirm_delete_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet_index: int):
     """Confirm and process wallet deletion."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
     if user_id not in users or wallet_index >= len(users[user_id]["wallets"]):
-        query.message.edit_text(
+        await query.message.edit_text(
             "Invalid wallet selection.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -372,7 +526,7 @@ def confirm_delete_wallet(update: Update, context: CallbackContext, wallet_index
         ]
     ]
     
-    query.message.edit_text(
+    await query.message.edit_text(
         f"Are you sure you want to delete wallet:\n\n"
         f"`{short_address}`?\n\n"
         "⚠️ This action cannot be undone!",
@@ -380,13 +534,13 @@ def confirm_delete_wallet(update: Update, context: CallbackContext, wallet_index
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-def execute_delete_wallet(update: Update, context: CallbackContext, wallet_index: int):
+async def execute_delete_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet_index: int):
     """Execute the wallet deletion."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
     if user_id not in users or wallet_index >= len(users[user_id]["wallets"]):
-        query.message.edit_text(
+        await query.message.edit_text(
             "Invalid wallet selection.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -396,12 +550,15 @@ def execute_delete_wallet(update: Update, context: CallbackContext, wallet_index
     
     # Remove the wallet
     deleted_wallet = users[user_id]["wallets"].pop(wallet_index)
-    save_users(users)
+    save_user(user_id)
+    # Wallet indexes shifted; drop trading selections that may now point elsewhere
+    context.user_data.pop('selected_trading_wallet', None)
+    context.user_data.pop('selected_trading_wallets', None)
     
     # Show success message
     address = deleted_wallet["address"]
     short_address = f"{address[:6]}...{address[-4:]}"
-    query.message.edit_text(
+    await query.message.edit_text(
         f"✅ Successfully deleted wallet:\n`{short_address}`",
         parse_mode='Markdown',
         reply_markup=InlineKeyboardMarkup([[
@@ -409,13 +566,13 @@ def execute_delete_wallet(update: Update, context: CallbackContext, wallet_index
         ]])
     )
 
-def handle_show_private_key(update: Update, context: CallbackContext):
+async def handle_show_private_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle showing private key."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
     if user_id not in users or not users[user_id]["wallets"]:
-        query.message.edit_text(
+        await query.message.edit_text(
             "You don't have any wallets.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -423,37 +580,28 @@ def handle_show_private_key(update: Update, context: CallbackContext):
         )
         return
     
-    # Create keyboard with all user's wallets
-    keyboard = []
-    for i, wallet in enumerate(users[user_id]["wallets"]):
-        address = wallet["address"]
-        short_address = f"{address[:6]}...{address[-4:]}"
-        keyboard.append([
-            InlineKeyboardButton(
-                f"🔑 {short_address}",
-                callback_data=f"confirm_show_key_{i}"
-            )
-        ])
-    
-    # Add back button
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="wallets")])
+    # Keyboard with all user's wallets
+    def build():
+        keyboard = wallet_buttons(users[user_id]["wallets"], "🔑", "confirm_show_key_")
+        keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="wallets")])
+        return CachedKeyboard(keyboard)
     
-    query.message.edit_text(
+    await query.message.edit_text(
         "Select a wallet to view its private key:\n\n"
         "⚠️ Warning:\n"
         "• Never share your private key with anyone\n"
         "• The key will be shown for 60 seconds only\n"
         "• Make sure no one can see your screen",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=wallet_keyboards.get(user_id, "show_key", build)
     )
 
-def confirm_show_private_key(update: Update, context: CallbackContext, wallet_index: int):
+async def confirm_show_private_key(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet_index: int):
     """Show confirmation before displaying private key."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
     if user_id not in users or wallet_index >= len(users[user_id]["wallets"]):
-        query.message.edit_text(
+        await query.message.edit_text(
             "Invalid wallet selection.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -474,7 +622,7 @@ def confirm_show_private_key(update: Update, context: CallbackContext, wallet_in
         ]
     ]
     
-    query.message.edit_text(
+    await query.message.edit_text(
         f"Are you sure you want to view the private key for:\n\n"
         f"`{short_address}`?\n\n"
         "⚠️ Warning:\n"
@@ -485,13 +633,13 @@ def confirm_show_private_key(update: Update, context: CallbackContext, wallet_in
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-def execute_show_private_key(update: Update, context: CallbackContext, wallet_index: int):
+async def execute_show_private_key(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet_index: int):
     """Show the private key with security measures."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
     if user_id not in users or wallet_index >= len(users[user_id]["wallets"]):
-        query.message.edit_text(
+        await query.message.edit_text(
             "Invalid wallet selection.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -516,14 +664,14 @@ def execute_show_private_key(update: Update, context: CallbackContext, wallet_in
     )
     
     # Send private key message
-    key_msg = context.bot.send_message(
+    key_msg = await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text=key_message,
         parse_mode='Markdown'
     )
     
     # Return to wallet menu
-    query.message.edit_text(
+    await query.message.edit_text(
         "✅ Private key has been sent in a separate message.\n"
         "It will be automatically deleted in 60 seconds.",
         reply_markup=InlineKeyboardMarkup([[
@@ -533,17 +681,19 @@ def execute_show_private_key(update: Update, context: CallbackContext, wallet_in
     
     # Delete private key message after 60 seconds
     context.job_queue.run_once(
-        lambda ctx: key_msg.delete(),
-        60
+        delete_message_job,
+        60,
+        chat_id=key_msg.chat_id,
+        data=key_msg.message_id
     )
 
-def handle_withdraw(update: Update, context: CallbackContext):
+async def handle_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the withdraw command."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
     if user_id not in users or not users[user_id]["wallets"]:
-        query.message.edit_text(
+        await query.message.edit_text(
             "You need to create or import a wallet first!",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="main_menu")
@@ -556,18 +706,18 @@ def handle_withdraw(update: Update, context: CallbackContext):
         "Choose a wallet to withdraw from:"
     )
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         reply_markup=get_wallet_selection_keyboard(user_id, "withdraw")
     )
 
-def handle_wallet_selection_for_withdraw(update: Update, context: CallbackContext, wallet_index: int):
+async def handle_wallet_selection_for_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet_index: int):
     """Handle wallet selection for withdrawal."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
     if user_id not in users or wallet_index >= len(users[user_id]["wallets"]):
-        query.message.edit_text(
+        await query.message.edit_text(
             "Invalid wallet selection.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="withdraw")
@@ -588,19 +738,19 @@ def handle_wallet_selection_for_withdraw(update: Update, context: CallbackContex
         "Choose what to withdraw:"
     )
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         reply_markup=get_withdraw_menu_keyboard(selected_wallet=True)
     )
 
-def handle_mon_withdrawal(update: Update, context: CallbackContext):
+async def handle_mon_withdrawal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle $MON withdrawal."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     wallet_index = context.user_data.get('selected_wallet_index')
     
     if wallet_index is None or user_id not in users or wallet_index >= len(users[user_id]["wallets"]):
-        query.message.edit_text(
+        await query.message.edit_text(
             "Please select a wallet first.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="withdraw")
@@ -620,7 +770,7 @@ def handle_mon_withdrawal(update: Update, context: CallbackContext):
     # Add back button
     keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="withdraw")]]
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         parse_mode='Markdown',
         reply_markup=InlineKeyboardMarkup(keyboard)
@@ -629,14 +779,14 @@ def handle_mon_withdrawal(update: Update, context: CallbackContext):
     # Set state to wait for amount
     context.user_data['waiting_for'] = 'withdrawal_amount'
 
-def handle_token_withdrawal(update: Update, context: CallbackContext):
+async def handle_token_withdrawal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle token withdrawal."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     wallet_index = context.user_data.get('selected_wallet_index')
     
     if wallet_index is None or user_id not in users or wallet_index >= len(users[user_id]["wallets"]):
-        query.message.edit_text(
+        await query.message.edit_text(
             "Please select a wallet first.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="withdraw")
@@ -656,7 +806,7 @@ def handle_token_withdrawal(update: Update, context: CallbackContext):
     # Add back button
     keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="withdraw")]]
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         parse_mode='Markdown',
         reply_markup=InlineKeyboardMarkup(keyboard)
@@ -665,46 +815,55 @@ def handle_token_withdrawal(update: Update, context: CallbackContext):
     # Set state to wait for token address
     context.user_data['waiting_for'] = 'token_address'
 
-def handle_text_input(update: Update, context: CallbackContext):
+async def track_transaction(message, tx_hash, sender, summary):
+    """Edit a transaction's status message once it is mined."""
+    try:
+        status = "✅ Confirmed" if await wait_for_receipt(tx_hash) else "❌ Failed (reverted)"
+    except TransactionError:
+        status = "⚠️ Not confirmed yet, check the explorer"
+    balance_service.invalidate(sender)
+    try:
+        await message.get_bot().edit_message_text(
+            f"{summary}\n\nStatus: {status}\n{EXPLORER_URL}/tx/{tx_hash}",
+            chat_id=message.chat_id,
+            message_id=message.message_id,
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu")
+            ]]),
+            rate_limit_args=BACKGROUND
+        )
+    except Exception as e:
+        logger.error(f"Error updating transaction status: {str(e)}")
+
+async def submit_withdrawal(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet, summary, send):
+    """Broadcast a withdrawal and track its receipt in the background."""
+    status_msg = await update.message.reply_text(f"{summary}\n\nStatus: ⏳ Submitting...")
+    try:
+        tx_hash = await send()
+    except Exception as e:
+        logger.error(f"Error submitting withdrawal: {str(e)}")
+        await status_msg.edit_text(
+            f"{summary}\n\nStatus: ❌ Failed: {str(e)}",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu")
+            ]])
+        )
+        return
+
+    await status_msg.edit_text(f"{summary}\n\nStatus: ⏳ Pending\n{EXPLORER_URL}/tx/{tx_hash}")
+    context.application.create_task(track_transaction(status_msg, tx_hash, wallet["address"], summary))
+
+# Input states that expect an address or key, so a pasted 0x... value is not a token lookup
+ADDRESS_INPUT_STATES = {'private_key', 'withdrawal_address', 'token_address', 'token_destination_address'}
+
+@timed(handler_latency, lambda update, context: ("text_input", context.user_data.get('waiting_for') or "none"))
+async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text input for wallet operations and token contract addresses."""
     # Check if the text looks like a token contract address
     text = update.message.text.strip()
-    if text.startswith("0x") and len(text) >= 40:  # Basic check for contract address format
-        # Show loading message
-        loading_msg = update.message.reply_text("⏳ Fetching token information...")
-        
-        # Create asyncio event loop and run token info fetch
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        token_data = loop.run_until_complete(fetch_token_info(text))
-        loop.close()
-        
-        if not token_data:
-            loading_msg.edit_text(
-                "❌ Error fetching token information.\n\n"
-                "This could be due to:\n"
-                "• Invalid token contract\n"
-                "• Contract not verified\n"
-                "• Network issues\n"
-                "• Token not listed on Kuru DEX"
-            )
-            return
-        
-        # Check if user has selected a wallet
-        user_id = str(update.effective_user.id)
-        has_selected_wallet = (
-            user_id in users and 
-            users[user_id]["wallets"] and 
-            context.user_data.get('selected_trading_wallet') is not None
-        )
-        
-        # Format and display token info
-        text = format_token_info(token_data)
-        loading_msg.edit_text(
-            text,
-            parse_mode='Markdown',
-            reply_markup=get_token_info_keyboard(has_selected_wallet)
-        )
+    if (text.startswith("0x") and len(text) >= 40  # Basic check for contract address format
+            and context.user_data.get('waiting_for') not in ADDRESS_INPUT_STATES):
+        await handle_token_info(update, context, text)
         return
 
     if 'waiting_for' not in context.user_data:
@@ -732,7 +891,7 @@ def handle_text_input(update: Update, context: CallbackContext):
                         }
                     users[user_id]["wallets"].append(new_wallet)
                 
-                save_users(users)
+                save_user(user_id)
                 
                 # Send wallet info
                 wallet_info = "🔐 Your New Wallets:\n\n"
@@ -742,24 +901,26 @@ def handle_text_input(update: Update, context: CallbackContext):
                 
                 wallet_info += "⚠️ WARNING: Save these keys securely! Message will be deleted in 60 seconds."
                 
-                key_msg = update.message.reply_text(
+                key_msg = await update.message.reply_text(
                     wallet_info,
                     parse_mode='Markdown'
                 )
                 
                 # Delete private key message after 60 seconds
                 context.job_queue.run_once(
-                    lambda ctx: key_msg.delete(),
-                    60
+                    delete_message_job,
+                    60,
+                    chat_id=key_msg.chat_id,
+                    data=key_msg.message_id
                 )
                 
                 # Show updated wallet list
-                update.message.reply_text(
+                await update.message.reply_text(
                     "Select an option:",
                     reply_markup=get_wallet_menu_keyboard()
                 )
             else:
-                update.message.reply_text(
+                await update.message.reply_text(
                     "Please enter a number between 1 and 10.",
                     reply_markup=InlineKeyboardMarkup([[
                         InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -768,7 +929,7 @@ def handle_text_input(update: Update, context: CallbackContext):
                 return
                 
         except ValueError:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "Please enter a valid number between 1 and 10.",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -801,18 +962,18 @@ def handle_text_input(update: Update, context: CallbackContext):
                 }
             
             users[user_id]["wallets"].append(new_wallet)
-            save_users(users)
+            save_user(user_id)
             
             # Delete the message containing the private key
-            update.message.delete()
+            await update.message.delete()
             
-            update.message.reply_text(
+            await update.message.reply_text(
                 "✅ Wallet imported successfully!",
                 reply_markup=get_wallet_menu_keyboard()
             )
             
         except Exception as e:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "❌ Invalid private key. Please try again or go back.",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("⬅️ Back", callback_data="wallets")
@@ -835,7 +996,7 @@ def handle_text_input(update: Update, context: CallbackContext):
                 "Example: `0x742d35Cc6634C0532925a3b844Bc454e4438f44e`"
             )
             
-            update.message.reply_text(
+            await update.message.reply_text(
                 text,
                 parse_mode='Markdown',
                 reply_markup=InlineKeyboardMarkup([[
@@ -847,7 +1008,7 @@ def handle_text_input(update: Update, context: CallbackContext):
             context.user_data['waiting_for'] = 'withdrawal_address'
             
         except ValueError:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "❌ Invalid amount. Please enter a valid positive number.",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("⬅️ Back", callback_data="withdraw")
@@ -869,16 +1030,16 @@ def handle_text_input(update: Update, context: CallbackContext):
             if wallet_index is None or user_id not in users or wallet_index >= len(users[user_id]["wallets"]):
                 raise ValueError("Invalid wallet")
             
-            # Here you would implement the actual withdrawal logic
-            # For now, we'll just show a success message
-            update.message.reply_text(
-                f"✅ Withdrawal request submitted!\n\n"
+            wallet = users[user_id]["wallets"][wallet_index]
+            amount_wei = Web3.to_wei(Decimal(str(amount)), 'ether')
+            summary = (
+                f"📤 Withdrawal\n\n"
                 f"Amount: {amount} $MON\n"
-                f"To: {to_address[:6]}...{to_address[-4:]}\n\n"
-                "Transaction is being processed...",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu")
-                ]])
+                f"To: {to_address[:6]}...{to_address[-4:]}"
+            )
+            await submit_withdrawal(
+                update, context, wallet, summary,
+                lambda: send_native(wallet["private_key"], to_address, amount_wei)
             )
             
             # Clear stored data
@@ -886,7 +1047,7 @@ def handle_text_input(update: Update, context: CallbackContext):
                 del context.user_data['withdrawal_amount']
             
         except ValueError as e:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "❌ Invalid address. Please enter a valid Ethereum address.",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("⬅️ Back", callback_data="withdraw")
@@ -909,7 +1070,7 @@ def handle_text_input(update: Update, context: CallbackContext):
                 "Example: `100`"
             )
             
-            update.message.reply_text(
+            await update.message.reply_text(
                 text,
                 parse_mode='Markdown',
                 reply_markup=InlineKeyboardMarkup([[
@@ -921,7 +1082,7 @@ def handle_text_input(update: Update, context: CallbackContext):
             context.user_data['waiting_for'] = 'token_amount'
             
         except ValueError:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "❌ Invalid token address. Please enter a valid contract address.",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("⬅️ Back", callback_data="withdraw")
@@ -944,7 +1105,7 @@ def handle_text_input(update: Update, context: CallbackContext):
                 "Example: `0x742d35Cc6634C0532925a3b844Bc454e4438f44e`"
             )
             
-            update.message.reply_text(
+            await update.message.reply_text(
                 text,
                 parse_mode='Markdown',
                 reply_markup=InlineKeyboardMarkup([[
@@ -956,7 +1117,7 @@ def handle_text_input(update: Update, context: CallbackContext):
             context.user_data['waiting_for'] = 'token_destination_address'
             
         except ValueError:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "❌ Invalid amount. Please enter a valid positive number.",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("⬅️ Back", callback_data="withdraw")
@@ -979,18 +1140,20 @@ def handle_text_input(update: Update, context: CallbackContext):
             if wallet_index is None or user_id not in users or wallet_index >= len(users[user_id]["wallets"]):
                 raise ValueError("Invalid wallet")
             
-            # Here you would implement the actual token withdrawal logic
-            # For now, we'll just show a success message
-            update.message.reply_text(
-                f"✅ Token withdrawal request submitted!\n\n"
+            wallet = users[user_id]["wallets"][wallet_index]
+            summary = (
+                f"📤 Token Withdrawal\n\n"
                 f"Token: {token_address[:6]}...{token_address[-4:]}\n"
                 f"Amount: {amount}\n"
-                f"To: {to_address[:6]}...{to_address[-4:]}\n\n"
-                "Transaction is being processed...",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu")
-                ]])
+                f"To: {to_address[:6]}...{to_address[-4:]}"
             )
+
+            async def send():
+                metadata = await get_token_metadata(token_address)
+                units = int(Decimal(str(amount)) * 10 ** metadata["decimals"])
+                return await send_erc20(wallet["private_key"], token_address, to_address, units)
+
+            await submit_withdrawal(update, context, wallet, summary, send)
             
             # Clear stored data
             for key in ['token_address', 'token_amount']:
@@ -998,7 +1161,7 @@ def handle_text_input(update: Update, context: CallbackContext):
                     del context.user_data[key]
             
         except ValueError as e:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "❌ Invalid address. Please enter a valid Ethereum address.",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("⬅️ Back", callback_data="withdraw")
@@ -1006,55 +1169,118 @@ def handle_text_input(update: Update, context: CallbackContext):
             )
             return
     
-    # Clear the waiting state
-    del context.user_data['waiting_for']
+    elif waiting_for == 'limit_price':
+        try:
+            price = float(text)
+            if price <= 0:
+                raise ValueError("Price must be positive")
+            context.user_data['limit_price'] = price
+            if context.user_data.get('limit_side') == "buy":
+                prompt = f"Enter the amount of ${NATIVE_SYMBOL} to spend:\n\nExample: `1.5`"
+            else:
+                prompt = "Enter the percentage of your balance to sell (1-100):\n\nExample: `50`"
+            await update.message.reply_text(
+                prompt,
+                parse_mode='Markdown',
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("⬅️ Back", callback_data="limit_order")
+                ]])
+            )
+            context.user_data['waiting_for'] = 'limit_amount'
+        except ValueError:
+            await update.message.reply_text(
+                "❌ Invalid price. Please enter a valid positive number.",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("⬅️ Back", callback_data="limit_order")
+                ]])
+            )
+            return
+
+    elif waiting_for == 'limit_amount':
+        try:
+            if context.user_data.get('limit_side') == "buy":
+                amount = str(Decimal(text))
+                if Decimal(amount) <= 0:
+                    raise ValueError("Amount must be positive")
+            else:
+                amount = int(text)
+                if not 1 <= amount <= 100:
+                    raise ValueError("Percentage must be between 1 and 100")
+        except (ValueError, ArithmeticError):
+            await update.message.reply_text(
+                "❌ Invalid amount. Please enter a valid positive number.",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("⬅️ Back", callback_data="limit_order")
+                ]])
+            )
+            return
+
+        try:
+            order = await place_limit_order(update, context, amount)
+        except Exception as e:
+            logger.error(f"Error placing limit order: {str(e)}")
+            await update.message.reply_text(
+                f"❌ Could not place the order: {str(e)}",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("⬅️ Back", callback_data="token_info")
+                ]])
+            )
+        else:
+            await update.message.reply_text(
+                f"✅ Limit {order['type']} placed!\n\n"
+                f"Order #{order['id'][:8]}\n"
+                f"Token: {order['token_symbol']}\n"
+                f"Amount: {format_order_amount(order)}\n"
+                f"Trigger: {order['price']:g} ${NATIVE_SYMBOL}",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("⚙️ Manage Orders", callback_data="manage_orders")
+                ]])
+            )
+        for key in ['limit_side', 'limit_price']:
+            context.user_data.pop(key, None)
+
+    # Clear the waiting state unless the handler moved on to the next step
+    if context.user_data.get('waiting_for') == waiting_for:
+        del context.user_data['waiting_for']
 
 def get_manage_orders_keyboard():
-    """Create the manage orders menu keyboard."""
-    keyboard = [
-        [
-            InlineKeyboardButton("📋 Active Orders", callback_data="active_orders"),
-            InlineKeyboardButton("📜 Order History", callback_data="order_history")
-        ],
-        [
-            InlineKeyboardButton("❌ Cancel Orders", callback_data="cancel_orders")
-        ],
-        [
-            InlineKeyboardButton("⬅️ Main Menu", callback_data="main_menu")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    """Return the manage orders menu keyboard."""
+    return MANAGE_ORDERS_KEYBOARD
+
+def format_order_amount(order):
+    """Describe what an order trades, e.g. ``0.5 $MON`` for buys or ``50%`` for sells."""
+    if order.get("type") == "buy":
+        return f"{order.get('amount', 0)} ${NATIVE_SYMBOL}"
+    return f"{order.get('amount', 0)}%"
 
-def get_order_list_keyboard(orders, action_prefix, page=0, items_per_page=5):
-    """Create keyboard for list of orders with pagination."""
+def get_order_list_keyboard(orders, list_name, action_prefix, has_newer=False, has_older=False):
+    """Create keyboard for one page of orders, paged by order id."""
     keyboard = []
-    start_idx = page * items_per_page
-    end_idx = start_idx + items_per_page
     
     # Add order buttons
-    for i, order in enumerate(orders[start_idx:end_idx], start=start_idx):
+    for order in orders:
         order_type = "Buy" if order.get("type") == "buy" else "Sell"
         token_symbol = order.get("token_symbol", "Unknown")
-        amount = order.get("amount", 0)
+        amount = format_order_amount(order)
         short_id = order.get("id", "")[:8]
         
-        button_text = f"{order_type} {amount} {token_symbol} (#{short_id})"
+        button_text = f"{order_type} {token_symbol} {amount} @ {order.get('price', 0):g} (#{short_id})"
         keyboard.append([
             InlineKeyboardButton(
                 button_text,
-                callback_data=f"{action_prefix}_{i}"
+                callback_data=f"{action_prefix}{order['id']}"
             )
         ])
     
     # Add pagination buttons if needed
     nav_buttons = []
-    if page > 0:
+    if has_newer:
         nav_buttons.append(
-            InlineKeyboardButton("⬅️ Previous", callback_data=f"{action_prefix}_page_{page-1}")
+            InlineKeyboardButton("⬅️ Previous", callback_data=f"{list_name}_before_{orders[0]['id']}")
         )
-    if end_idx < len(orders):
+    if has_older:
         nav_buttons.append(
-            InlineKeyboardButton("➡️ Next", callback_data=f"{action_prefix}_page_{page+1}")
+            InlineKeyboardButton("➡️ Next", callback_data=f"{list_name}_after_{orders[-1]['id']}")
         )
     if nav_buttons:
         keyboard.append(nav_buttons)
@@ -1064,7 +1290,7 @@ def get_order_list_keyboard(orders, action_prefix, page=0, items_per_page=5):
     
     return InlineKeyboardMarkup(keyboard)
 
-def handle_manage_orders(update: Update, context: CallbackContext):
+async def handle_manage_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the manage orders menu."""
     query = update.callback_query
     
@@ -1076,118 +1302,92 @@ def handle_manage_orders(update: Update, context: CallbackContext):
         "Select an option:"
     )
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         reply_markup=get_manage_orders_keyboard()
     )
 
-def handle_active_orders(update: Update, context: CallbackContext):
-    """Show active orders."""
+# Order lists: (closed orders?, title, text when empty, callback prefix of the order buttons)
+ORDER_LISTS = {
+    "active_orders": (False, "📋 Active Orders\n\nSelect an order to view details:", "You have no active orders.", "view_order_"),
+    "order_history": (True, "📜 Order History\n\nSelect an order to view details:", "You have no order history.", "view_order_"),
+    "cancel_orders": (False, "❌ Cancel Orders\n\nSelect an order to cancel:", "You have no active orders to cancel.", "confirm_cancel_"),
+}
+
+async def show_order_list(update: Update, context: ContextTypes.DEFAULT_TYPE, list_name, after=None, before=None):
+    """Show one page of the user's open or closed orders."""
     query = update.callback_query
     user_id = str(query.from_user.id)
-    page = context.user_data.get('active_orders_page', 0)
+    closed, title, empty_text, action_prefix = ORDER_LISTS[list_name]
     
-    # Get active orders from user data
-    # This would normally come from your order tracking system
-    active_orders = context.user_data.get('active_orders', [])
+    orders, has_newer, has_older = order_store.page(user_id, closed, ORDERS_PER_PAGE, after=after, before=before)
+    if not orders and (after or before):
+        # The page boundary moved (e.g. an order was filled); start over
+        orders, has_newer, has_older = order_store.page(user_id, closed, ORDERS_PER_PAGE)
     
-    if not active_orders:
-        query.message.edit_text(
-            "You have no active orders.",
+    if not orders:
+        await query.message.edit_text(
+            empty_text,
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="manage_orders")
             ]])
         )
         return
     
-    text = (
-        "📋 Active Orders\n\n"
-        "Select an order to view details:"
-    )
-    
-    query.message.edit_text(
-        text,
-        reply_markup=get_order_list_keyboard(active_orders, "view_active", page)
+    await query.message.edit_text(
+        title,
+        reply_markup=get_order_list_keyboard(orders, list_name, action_prefix, has_newer, has_older)
     )
 
-def handle_order_history(update: Update, context: CallbackContext):
+async def handle_active_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show active orders."""
+    await show_order_list(update, context, "active_orders")
+
+async def handle_order_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show order history."""
-    query = update.callback_query
-    user_id = str(query.from_user.id)
-    page = context.user_data.get('history_page', 0)
-    
-    # Get order history from user data
-    # This would normally come from your order tracking system
-    order_history = context.user_data.get('order_history', [])
-    
-    if not order_history:
-        query.message.edit_text(
-            "You have no order history.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("⬅️ Back", callback_data="manage_orders")
-            ]])
-        )
-        return
-    
-    text = (
-        "📜 Order History\n\n"
-        "Select an order to view details:"
-    )
-    
-    query.message.edit_text(
-        text,
-        reply_markup=get_order_list_keyboard(order_history, "view_history", page)
-    )
+    await show_order_list(update, context, "order_history")
 
-def handle_cancel_orders(update: Update, context: CallbackContext):
+async def handle_cancel_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show orders that can be cancelled."""
+    await show_order_list(update, context, "cancel_orders")
+
+async def view_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id):
+    """Open an order picked from the active or history list."""
     query = update.callback_query
     user_id = str(query.from_user.id)
-    page = context.user_data.get('cancel_page', 0)
-    
-    # Get active orders that can be cancelled
-    # This would normally come from your order tracking system
-    active_orders = context.user_data.get('active_orders', [])
-    
-    if not active_orders:
-        query.message.edit_text(
-            "You have no active orders to cancel.",
+    order = order_engine.active.get(order_id) or order_store.get(order_id)
+    if order is None or order["user_id"] != user_id:
+        await query.message.edit_text(
+            "Error: Order not found.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("⬅️ Back", callback_data="manage_orders")
             ]])
         )
         return
-    
-    text = (
-        "❌ Cancel Orders\n\n"
-        "Select an order to cancel:"
-    )
-    
-    query.message.edit_text(
-        text,
-        reply_markup=get_order_list_keyboard(active_orders, "cancel", page)
-    )
+    await show_order_details(update, context, order, is_active=order["status"] in (ACTIVE, EXECUTING))
 
-def show_order_details(update: Update, context: CallbackContext, order, is_active=True):
+async def show_order_details(update: Update, context: ContextTypes.DEFAULT_TYPE, order, is_active=True):
     """Show details of a specific order."""
     query = update.callback_query
     
     # Format order details
     order_type = "Buy" if order.get("type") == "buy" else "Sell"
-    token_symbol = order.get("token_symbol", "Unknown")
-    amount = order.get("amount", 0)
+    token_symbol = escape_markdown(order.get("token_symbol", "Unknown"))
+    amount = format_order_amount(order)
     price = order.get("price", 0)
     status = order.get("status", "Unknown")
     order_id = order.get("id", "Unknown")
     
     text = (
         f"Order #{order_id[:8]}\n\n"
-        f"Type: {order_type}\n"
+        f"Type: Limit {order_type}\n"
         f"Token: {token_symbol}\n"
         f"Amount: {amount}\n"
-        f"Price: {price} $MON\n"
-        f"Status: {status}\n"
+        f"Price: {price:g} $MON\n"
+        f"Status: {status.title()}\n"
     )
+    if order.get("error"):
+        text += f"Error: {escape_markdown(order['error'])}\n"
     
     # Add transaction hash if available
     tx_hash = order.get("tx_hash")
@@ -1196,7 +1396,7 @@ def show_order_details(update: Update, context: CallbackContext, order, is_activ
     
     # Create keyboard based on order type
     keyboard = []
-    if is_active:
+    if is_active and status == ACTIVE:
         keyboard.append([
             InlineKeyboardButton("❌ Cancel Order", callback_data=f"confirm_cancel_{order_id}")
         ])
@@ -1205,33 +1405,36 @@ def show_order_details(update: Update, context: CallbackContext, order, is_activ
         InlineKeyboardButton("⬅️ Back", callback_data="active_orders" if is_active else "order_history")
     ])
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         parse_mode='Markdown',
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-def handle_order_cancellation(update: Update, context: CallbackContext, order_id):
+async def handle_order_cancellation(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id):
     """Handle the order cancellation process."""
     query = update.callback_query
+    user_id = str(query.from_user.id)
     
-    # Here you would implement the actual order cancellation logic
-    # For now, we'll just show a success message
-    
-    text = (
-        "✅ Order cancellation submitted!\n\n"
-        f"Order #{order_id[:8]} is being cancelled.\n"
-        "This may take a few moments to process."
-    )
+    if order_engine.cancel(user_id, order_id):
+        text = (
+            "✅ Order cancelled!\n\n"
+            f"Order #{order_id[:8]} has been cancelled."
+        )
+    else:
+        text = (
+            "❌ Order could not be cancelled.\n\n"
+            f"Order #{order_id[:8]} has already been filled or cancelled."
+        )
     
-    query.message.edit_text(
+    await query.message.edit_text(
         text,
         reply_markup=InlineKeyboardMarkup([[
             InlineKeyboardButton("⬅️ Back to Orders", callback_data="active_orders")
         ]])
     )
 
-def get_token_info_keyboard(has_selected_wallet=False):
+def get_token_info_keyboard(has_selected_wallet=False, slippage=DEFAULT_SLIPPAGE, gas_price=DEFAULT_GAS_PRICE):
     """Create the token info and trading keyboard."""
     keyboard = []
     
@@ -1254,8 +1457,11 @@ def get_token_info_keyboard(has_selected_wallet=False):
             InlineKeyboardButton("💼 Select wallets", callback_data="select_trading_wallet")
         ])
         keyboard.append([
-            InlineKeyboardButton("⚡ Slippage: 1%", callback_data="set_slippage"),
-            InlineKeyboardButton("⛽ Gas: 750 MIST", callback_data="set_gas")
+            InlineKeyboardButton(f"⚡ Slippage: {slippage:g}%", callback_data="set_slippage"),
+            InlineKeyboardButton(
+                f"⛽ Gas: {gas_price:g} gwei" if gas_price is not None else "⛽ Gas: auto",
+                callback_data="set_gas"
+            )
         ])
         keyboard.append([
             InlineKeyboardButton("🛒 Buy", callback_data="buy_token"),
@@ -1289,201 +1495,14 @@ def format_token_info(token_data):
         f"🌐 Social Links:\n{token_data.get('socials', 'No social links available')}"
     )
 
-async def fetch_token_info(token_address):
-    """Fetch token information from Monad blockchain and Kuru DEX."""
-    try:
-        # Initialize Web3 connection to Monad
-        w3 = Web3(Web3.HTTPProvider(MONAD_RPC_URL))
-        
-        # Load token contract ABI - standard ERC20 ABI
-        token_abi = [
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "name",
-                "outputs": [{"name": "", "type": "string"}],
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "symbol",
-                "outputs": [{"name": "", "type": "string"}],
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "decimals",
-                "outputs": [{"name": "", "type": "uint8"}],
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "totalSupply",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "type": "function"
-            }
-        ]
-        
-        # Create contract instance
-        token_contract = w3.eth.contract(address=token_address, abi=token_abi)
-        
-        # Fetch basic token info from contract
-        token_name = token_contract.functions.name().call()
-        token_symbol = token_contract.functions.symbol().call()
-        token_decimals = token_contract.functions.decimals().call()
-        total_supply = token_contract.functions.totalSupply().call()
-        
-        # Fetch price and liquidity info from Kuru DEX API
-        kuru_api_url = "https://api.kuru.io"  # Changed from testnet to mainnet
-        
-        async with aiohttp.ClientSession() as session:
-            # Get token info
-            token_info_url = f"{kuru_api_url}/v1/tokens/{token_address}"
-            async with session.get(token_info_url) as response:
-                if response.status == 200:
-                    token_data = await response.json()
-                    price = token_data.get('price', '0')
-                    liquidity = token_data.get('liquidity', '0')
-                    pair_created_at = token_data.get('pairCreatedAt')
-                else:
-                    price = "0"
-                    liquidity = "0"
-                    pair_created_at = None
-            
-            # Get pair info
-            pair_info_url = f"{kuru_api_url}/v1/pairs/{token_address}"
-            async with session.get(pair_info_url) as response:
-                if response.status == 200:
-                    pair_data = await response.json()
-                    lp_info = pair_data.get('lpInfo', {})
-                    total_lp = lp_info.get('totalSupply', '0')
-                    burned_lp = lp_info.get('burnedAmount', '0')
-                    token0_reserve = pair_data.get('reserve0', '0')
-                    token1_reserve = pair_data.get('reserve1', '0')
-                else:
-                    total_lp = "0"
-                    burned_lp = "0"
-                    token0_reserve = "0"
-                    token1_reserve = "0"
-        
-        # Calculate pair age if available
-        if pair_created_at:
-            current_time = int(time.time())
-            pair_age = current_time - int(pair_created_at)
-            days = pair_age // (24 * 3600)
-            hours = (pair_age % (24 * 3600)) // 3600
-            pair_age_str = f"{days} days, {hours} hours"
-        else:
-            pair_age_str = "Unknown"
-        
-        # Calculate LP burned percentage
-        try:
-            total_lp = float(total_lp)
-            burned_lp = float(burned_lp)
-            if total_lp > 0:
-                burn_percentage = (burned_lp * 100) / total_lp
-                lp_burned = f"{burn_percentage:.2f}%"
-            else:
-                lp_burned = "0%"
-        except:
-            lp_burned = "Unknown"
-        
-        # Format liquidity tokens
-        try:
-            token0_amount = w3.from_wei(int(token0_reserve), 'ether')
-            token1_amount = w3.from_wei(int(token1_reserve), 'ether')
-            liquidity_tokens = f"({token0_amount:.2f} MON + {token1_amount:.2f} {token_symbol})"
-        except:
-            liquidity_tokens = "Unknown"
-        
-        # Check security features
-        is_mintable = False
-        can_blacklist = False
-        is_modifiable = False
-        
-        try:
-            # Check if contract has mint function
-            mint_function = token_contract.functions.mint
-            is_mintable = True
-        except:
-            pass
-            
-        try:
-            # Check if contract has blacklist function
-            blacklist_function = token_contract.functions.blacklist
-            can_blacklist = True
-        except:
-            pass
-            
-        try:
-            # Check if contract has upgrade/modify function
-            upgrade_function = token_contract.functions.upgrade
-            is_modifiable = True
-        except:
-            pass
-        
-        # Format the token data
-        token_data = {
-            "name": token_name,
-            "symbol": token_symbol,
-            "address": token_address,
-            "chain": "Monad",
-            "exchange": "Kuru DEX",
-            "price": f"{float(price):.8f}",
-            "base_currency": "MON",
-            "market_cap": f"{float(price) * float(total_supply) / (10 ** token_decimals):.2f}",
-            "liquidity": liquidity,
-            "liquidity_tokens": liquidity_tokens,
-            "lp_burned": lp_burned,
-            "pair_age": pair_age_str,
-            "security_mintable": "⚠️ Token is mintable!" if is_mintable else "✅ Token is not mintable",
-            "security_blacklist": "⚠️ Can be blacklisted!" if can_blacklist else "✅ Cannot be blacklisted",
-            "security_modifiable": "⚠️ Contract is modifiable!" if is_modifiable else "✅ Contract is not modifiable",
-            "socials": await fetch_token_socials(token_address, kuru_api_url)
-        }
-        
-        return token_data
-        
-    except Exception as e:
-        logger.error(f"Error fetching token info: {str(e)}")
-        return None
-
-async def fetch_token_socials(token_address, kuru_api_url):
-    """Fetch token social links from Kuru DEX."""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # Get token social info from Kuru API
-            social_url = f"{kuru_api_url}/v1/tokens/{token_address}/social"
-            async with session.get(social_url) as response:
-                if response.status == 200:
-                    social_data = await response.json()
-                    socials = []
-                    
-                    if social_data.get('website'):
-                        socials.append(f"🌐 Website: {social_data['website']}")
-                    if social_data.get('telegram'):
-                        socials.append(f"📱 Telegram: {social_data['telegram']}")
-                    if social_data.get('twitter'):
-                        socials.append(f"🐦 Twitter: {social_data['twitter']}")
-                    if social_data.get('discord'):
-                        socials.append(f"💬 Discord: {social_data['discord']}")
-                        
-                    return "\n".join(socials) if socials else "No social links available"
-                    
-                return "Social links not available"
-                
-    except Exception as e:
-        logger.error(f"Error fetching social links: {str(e)}")
-        return "Error fetching social links"
-
-async def handle_token_info(update: Update, context: CallbackContext, token_address=None):
+async def handle_token_info(update: Update, context: ContextTypes.DEFAULT_TYPE, token_address=None):
     """Display token information and trading interface."""
     query = update.callback_query
     user_id = str(query.from_user.id if query else update.effective_user.id)
     
+    # Callbacks from the token card refer to the last token the user viewed
+    token_address = token_address or context.user_data.get('current_token')
+    
     if token_address:
         # Show loading message
         loading_message = "⏳ Fetching token information..."
@@ -1514,6 +1533,9 @@ async def handle_token_info(update: Update, context: CallbackContext, token_addr
             else:
                 await msg.edit_text(error_text)
             return
+        
+        context.user_data['current_token'] = token_data['address']
+        price_feed.watch(token_data['address'])
     else:
         # Use example data for testing
         token_data = {
@@ -1542,6 +1564,12 @@ async def handle_token_info(update: Update, context: CallbackContext, token_addr
         context.user_data.get('selected_trading_wallet') is not None
     )
     
+    if has_selected_wallet and context.user_data.get('current_token'):
+        # Prepare the buy ahead of the click
+        context.application.create_task(warm_trade(update, context, "buy"))
+    slippage, gas_price = get_trade_settings(user_id, context)
+    reply_markup = get_token_info_keyboard(has_selected_wallet, slippage, gas_price)
+    
     # Format and send token info
     text = format_token_info(token_data)
     
@@ -1549,29 +1577,29 @@ async def handle_token_info(update: Update, context: CallbackContext, token_addr
         await query.message.edit_text(
             text,
             parse_mode='Markdown',
-            reply_markup=get_token_info_keyboard(has_selected_wallet)
+            reply_markup=reply_markup
         )
     else:
         if 'msg' in locals():
             await msg.edit_text(
                 text,
                 parse_mode='Markdown',
-                reply_markup=get_token_info_keyboard(has_selected_wallet)
+                reply_markup=reply_markup
             )
         else:
             await update.message.reply_text(
                 text,
                 parse_mode='Markdown',
-                reply_markup=get_token_info_keyboard(has_selected_wallet)
+                reply_markup=reply_markup
             )
 
-def handle_select_trading_wallet(update: Update, context: CallbackContext):
+async def handle_select_trading_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle wallet selection for trading."""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
     if user_id not in users or not users[user_id]["wallets"]:
-        query.message.edit_text(
+        await query.message.edit_text(
             "You need to create or import a wallet first!",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("👛 Manage Wallets", callback_data="wallets")
@@ -1579,187 +1607,419 @@ def handle_select_trading_wallet(update: Update, context: CallbackContext):
         )
         return
     
-    # Create keyboard with user's wallets
+    # Create keyboard with user's wallets; the checkbox adds a wallet to multi-wallet buys
     keyboard = []
-    for i, wallet in enumerate(users[user_id]["wallets"]):
+    selected = context.user_data.get('selected_trading_wallets', [])
+    balances = await get_wallet_balances(user_id)
+    for i, (wallet, balance) in enumerate(zip(users[user_id]["wallets"], balances)):
         address = wallet["address"]
         short_address = f"{address[:6]}...{address[-4:]}"
-        balance = "0.00"  # You would fetch the actual balance here
         keyboard.append([
             InlineKeyboardButton(
-                f"💼 {short_address} ({balance} SUI)",
+                f"💼 {short_address} ({balance} {NATIVE_SYMBOL})",
                 callback_data=f"select_trade_wallet_{i}"
-            )
+            ),
+            InlineKeyboardButton("✅" if i in selected else "⬜", callback_data=f"toggle_trade_wallet_{i}")
         ])
     
     keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="token_info")])
     
-    query.message.edit_text(
-        "Select a wallet to trade with:",
+    text = "Select a wallet to trade with:"
+    if selected:
+        text += f"\n\nBuys use all {len(selected)} checked wallets."
+    await query.message.edit_text(
+        text,
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-def handle_set_slippage(update: Update, context: CallbackContext):
+async def handle_set_slippage(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle slippage setting."""
     query = update.callback_query
-    
-    # Create slippage options
+    await query.message.edit_text(
+        "Select slippage tolerance:",
+        reply_markup=SLIPPAGE_KEYBOARD
+    )
+
+async def handle_set_gas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle gas price setting."""
+    query = update.callback_query
+    await query.message.edit_text(
+        "Select gas price (in gwei):",
+        reply_markup=GAS_KEYBOARD
+    )
+
+async def select_trade_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet_index: int):
+    """Remember the wallet chosen for trading and return to the token card."""
+    context.user_data['selected_trading_wallet'] = wallet_index
+    context.user_data.pop('selected_trading_wallets', None)
+    await handle_token_info(update, context)
+
+async def toggle_trade_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet_index: int):
+    """Add a wallet to or remove it from the multi-wallet buy selection."""
+    selected = set(context.user_data.get('selected_trading_wallets', []))
+    selected ^= {wallet_index}
+    context.user_data['selected_trading_wallets'] = sorted(selected)
+    if selected and context.user_data.get('selected_trading_wallet') not in selected:
+        # Sells and the token card use the first checked wallet
+        context.user_data['selected_trading_wallet'] = min(selected)
+    await handle_select_trading_wallet(update, context)
+
+async def select_gas(update: Update, context: ContextTypes.DEFAULT_TYPE, gas_price: str):
+    """Store the chosen gas price and return to the token card."""
+    if gas_price == "auto":
+        context.user_data.pop('gas_price', None)
+    elif gas_price != "custom":
+        context.user_data['gas_price'] = float(gas_price)
+    await handle_token_info(update, context)
+
+def gas_price_wei(gas_price):
+    """Convert a gas price setting in gwei to wei, keeping None (network price) as is."""
+    return None if gas_price is None else Web3.to_wei(gas_price, 'gwei')
+
+def get_trade_settings(user_id, context):
+    """Return the ``(slippage %, gas price in gwei or None for the network price)`` used for the user's trades."""
+    settings = users.get(user_id, {}).get("settings", {})
+    slippage = context.user_data.get('slippage', settings.get("slippage", DEFAULT_SLIPPAGE))
+    gas_price = context.user_data.get('gas_price', DEFAULT_GAS_PRICE)
+    return slippage, gas_price
+
+async def prepare_trade(update: Update, context: ContextTypes.DEFAULT_TYPE, side):
+    """Return the prepared templates for the current token, one per trading wallet.
+
+    Buys use every checked wallet; sells use the selected trading wallet only.
+    """
+    user_id = str(update.effective_user.id)
+    wallets = users.get(user_id, {}).get("wallets", [])
+    indexes = context.user_data.get('selected_trading_wallets') if side == "buy" else None
+    if not indexes:
+        indexes = [context.user_data.get('selected_trading_wallet')]
+    token_address = context.user_data.get('current_token')
+    if token_address is None or any(i is None or i >= len(wallets) for i in indexes):
+        raise TradeError("Select a token and a trading wallet first")
+    slippage, gas_price = get_trade_settings(user_id, context)
+    return await snipe_engine.prepare_many(
+        user_id, side, [wallets[i] for i in indexes], token_address, gas_price_wei(gas_price), slippage
+    )
+
+async def warm_trade(update: Update, context: ContextTypes.DEFAULT_TYPE, side):
+    """Prepare a trade in the background so the click only signs and sends."""
+    try:
+        await prepare_trade(update, context, side)
+    except Exception as e:
+        logger.error(f"Error preparing {side}: {str(e)}")
+
+async def require_trade_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Return True if a token and a trading wallet are selected, otherwise say what is missing."""
+    if context.user_data.get('current_token') and context.user_data.get('selected_trading_wallet') is not None:
+        return True
+    await update.callback_query.message.edit_text(
+        "Paste a token contract address and select a wallet to trade with first.",
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("⬅️ Back", callback_data="main_menu")
+        ]])
+    )
+    return False
+
+async def handle_buy_token(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the buy amounts for the current token."""
+    query = update.callback_query
+    if not await require_trade_selection(update, context):
+        return
+    context.application.create_task(warm_trade(update, context, "buy"))
     keyboard = [
         [
-            InlineKeyboardButton("0.5%", callback_data="set_slippage_0.5"),
-            InlineKeyboardButton("1%", callback_data="set_slippage_1"),
-            InlineKeyboardButton("2%", callback_data="set_slippage_2")
-        ],
-        [
-            InlineKeyboardButton("3%", callback_data="set_slippage_3"),
-            InlineKeyboardButton("5%", callback_data="set_slippage_5"),
-            InlineKeyboardButton("Custom", callback_data="set_slippage_custom")
+            InlineKeyboardButton(f"{amount} {NATIVE_SYMBOL}", callback_data=f"buy_amount_{amount}")
+            for amount in BUY_AMOUNTS
         ],
         [InlineKeyboardButton("⬅️ Back", callback_data="token_info")]
     ]
-    
-    query.message.edit_text(
-        "Select slippage tolerance:",
+    await query.message.edit_text(
+        f"🛒 Buy\n\nChoose the amount of ${NATIVE_SYMBOL} to spend:",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-def handle_set_gas(update: Update, context: CallbackContext):
-    """Handle gas price setting."""
+async def handle_sell_token(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the sell percentages for the current token."""
     query = update.callback_query
-    
-    # Create gas options
+    if not await require_trade_selection(update, context):
+        return
+    context.application.create_task(warm_trade(update, context, "sell"))
     keyboard = [
         [
-            InlineKeyboardButton("Standard (750)", callback_data="set_gas_750"),
-            InlineKeyboardButton("Fast (1000)", callback_data="set_gas_1000")
+            InlineKeyboardButton(f"{percentage}%", callback_data=f"sell_percent_{percentage}")
+            for percentage in SELL_PERCENTAGES
         ],
+        [InlineKeyboardButton("⬅️ Back", callback_data="token_info")]
+    ]
+    await query.message.edit_text(
+        "💰 Sell\n\nChoose how much of your balance to sell:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def execute_trade(update: Update, context: ContextTypes.DEFAULT_TYPE, side, size):
+    """Sign and broadcast a prepared trade, then track its receipt."""
+    started = time.perf_counter()
+    query = update.callback_query
+    if not trade_limiter.allow(query.from_user.id):
+        await query.message.edit_text(
+            f"⏳ Trade limit of {MAX_TRADES_PER_MINUTE} per minute reached. "
+            f"Try again in {trade_limiter.retry_after(query.from_user.id):.0f}s.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("⬅️ Back", callback_data="token_info")
+            ]])
+        )
+        return
+    try:
+        templates = await prepare_trade(update, context, side)
+        template = templates[0]
+        if side == "buy" and len(templates) > 1:
+            results = await snipe_engine.buy_many(templates, Web3.to_wei(Decimal(size), 'ether'), started)
+        elif side == "buy":
+            tx_hash, expected = await snipe_engine.buy(template, Web3.to_wei(Decimal(size), 'ether'), started)
+        else:
+            tx_hash, expected = await snipe_engine.sell(template, int(size), started)
+    except Exception as e:
+        logger.error(f"Error executing {side}: {str(e)}")
+        await query.message.edit_text(
+            f"❌ {side.title()} failed: {str(e)}",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("⬅️ Back", callback_data="token_info")
+            ]])
+        )
+        return
+
+    if side == "buy" and len(templates) > 1:
+        await report_multi_buy(update, context, templates, results, size)
+        return
+
+    if side == "buy":
+        metadata = await get_token_metadata(template.token)
+        summary = (
+            f"🛒 Buy\n\n"
+            f"Spent: {size} ${NATIVE_SYMBOL}\n"
+            f"Expected: {expected / 10 ** metadata['decimals']:.4f} ${metadata['symbol']}"
+        )
+    else:
+        summary = (
+            f"💰 Sell\n\n"
+            f"Sold: {size}% of balance\n"
+            f"Expected: {format_balance(expected)} ${NATIVE_SYMBOL}"
+        )
+    await query.message.edit_text(f"{summary}\n\nStatus: ⏳ Pending\n{EXPLORER_URL}/tx/{tx_hash}")
+    context.application.create_task(track_transaction(query.message, tx_hash, template.account.address, summary))
+
+def format_multi_buy(templates, statuses, header):
+    """Render one status line per wallet of a multi-wallet buy."""
+    lines = [header, ""]
+    for template, status in zip(templates, statuses):
+        address = template.account.address
+        lines.append(f"💼 {address[:6]}...{address[-4:]}: {status}")
+    return "\n".join(lines)
+
+async def report_multi_buy(update: Update, context: ContextTypes.DEFAULT_TYPE, templates, results, size):
+    """Show the per-wallet outcome of a multi-wallet buy and track all receipts in one message."""
+    query = update.callback_query
+    metadata = await get_token_metadata(templates[0].token)
+    header = f"🛒 Buy with {len(templates)} wallets\n\nSpent: {size} ${NATIVE_SYMBOL} each"
+
+    statuses = []
+    pending = []
+    for i, (tx_hash, expected) in enumerate(results):
+        if isinstance(tx_hash, Exception):
+            statuses.append(f"❌ {str(tx_hash)}")
+        else:
+            statuses.append(f"⏳ ~{expected / 10 ** metadata['decimals']:.4f} ${metadata['symbol']}")
+            pending.append((i, tx_hash))
+    await query.message.edit_text(format_multi_buy(templates, statuses, header))
+    if pending:
+        context.application.create_task(track_multi_buy(query.message, templates, statuses, pending, header))
+
+async def track_multi_buy(message, templates, statuses, pending, header):
+    """Edit a multi-wallet buy message once every transaction is mined."""
+    outcomes = await asyncio.gather(*[wait_for_receipt(tx_hash) for _, tx_hash in pending], return_exceptions=True)
+    for (i, tx_hash), outcome in zip(pending, outcomes):
+        if isinstance(outcome, Exception):
+            status = "⚠️ Not confirmed yet"
+        else:
+            status = "✅ Confirmed" if outcome else "❌ Failed (reverted)"
+        statuses[i] = f"{status} {EXPLORER_URL}/tx/{tx_hash}"
+        balance_service.invalidate(templates[i].account.address)
+    try:
+        await message.get_bot().edit_message_text(
+            format_multi_buy(templates, statuses, header),
+            chat_id=message.chat_id,
+            message_id=message.message_id,
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu")
+            ]]),
+            rate_limit_args=BACKGROUND
+        )
+    except Exception as e:
+        logger.error(f"Error updating transaction status: {str(e)}")
+
+async def handle_limit_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Let the user choose between a limit buy and a limit sell."""
+    query = update.callback_query
+    if not await require_trade_selection(update, context):
+        return
+    keyboard = [
         [
-            InlineKeyboardButton("Rapid (1500)", callback_data="set_gas_1500"),
-            InlineKeyboardButton("Custom", callback_data="set_gas_custom")
+            InlineKeyboardButton("📈 Limit Buy", callback_data="limit_side_buy"),
+            InlineKeyboardButton("📉 Limit Sell", callback_data="limit_side_sell")
         ],
         [InlineKeyboardButton("⬅️ Back", callback_data="token_info")]
     ]
-    
-    query.message.edit_text(
-        "Select gas price (in MIST):",
+    await query.message.edit_text(
+        "📈 Limit Order\n\n"
+        "A limit buy executes when the price falls to your trigger price,\n"
+        "a limit sell when it rises to it.",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-def button_callback(update: Update, context: CallbackContext):
-    """Handle button presses."""
+async def select_limit_side(update: Update, context: ContextTypes.DEFAULT_TYPE, side: str):
+    """Ask for the trigger price of a new limit order."""
     query = update.callback_query
-    query.answer()
-    
-    if query.data == "token_info":
-        handle_token_info(update, context)
-    elif query.data == "select_trading_wallet":
-        handle_select_trading_wallet(update, context)
-    elif query.data.startswith("select_trade_wallet_"):
-        wallet_index = int(query.data.split("_")[-1])
-        context.user_data['selected_trading_wallet'] = wallet_index
-        handle_token_info(update, context)
-    elif query.data == "set_slippage":
-        handle_set_slippage(update, context)
-    elif query.data.startswith("set_slippage_"):
-        slippage = query.data.split("_")[-1]
-        if slippage != "custom":
-            context.user_data['slippage'] = float(slippage)
-        handle_token_info(update, context)
-    elif query.data == "set_gas":
-        handle_set_gas(update, context)
-    elif query.data == "manage_orders":
-        handle_manage_orders(update, context)
-    elif query.data == "active_orders":
-        handle_active_orders(update, context)
-    elif query.data == "order_history":
-        handle_order_history(update, context)
-    elif query.data == "cancel_orders":
-        handle_cancel_orders(update, context)
-    elif query.data.startswith("view_active_"):
-        try:
-            index = int(query.data.split("_")[-1])
-            order = context.user_data.get('active_orders', [])[index]
-            show_order_details(update, context, order, is_active=True)
-        except (ValueError, IndexError):
-            query.message.edit_text(
-                "Error: Order not found.",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("⬅️ Back", callback_data="active_orders")
-                ]])
-            )
-    elif query.data.startswith("view_history_"):
-        try:
-            index = int(query.data.split("_")[-1])
-            order = context.user_data.get('order_history', [])[index]
-            show_order_details(update, context, order, is_active=False)
-        except (ValueError, IndexError):
-            query.message.edit_text(
-                "Error: Order not found.",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("⬅️ Back", callback_data="order_history")
-                ]])
+    context.user_data['limit_side'] = side
+    context.user_data['waiting_for'] = 'limit_price'
+    await query.message.edit_text(
+        f"Enter the trigger price in ${NATIVE_SYMBOL} per token:\n\n"
+        "Example: `0.0025`",
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("⬅️ Back", callback_data="limit_order")
+        ]])
+    )
+
+async def place_limit_order(update: Update, context: ContextTypes.DEFAULT_TYPE, amount):
+    """Create a limit order for the current token and trading wallet."""
+    user_id = str(update.effective_user.id)
+    side = context.user_data.get('limit_side')
+    price = context.user_data.get('limit_price')
+    token_address = context.user_data.get('current_token')
+    wallet_index = context.user_data.get('selected_trading_wallet')
+    wallets = users.get(user_id, {}).get("wallets", [])
+    if side is None or price is None or token_address is None or wallet_index is None or wallet_index >= len(wallets):
+        raise TradeError("Select a token and a trading wallet first")
+    if not trade_limiter.allow(update.effective_user.id):
+        raise TradeError(f"Trade limit of {MAX_TRADES_PER_MINUTE} per minute reached")
+
+    metadata = await get_token_metadata(token_address)
+    slippage, gas_price = get_trade_settings(user_id, context)
+    return order_engine.place(
+        user_id, token_address, metadata["symbol"], side, amount, price,
+        wallets[wallet_index]["address"], slippage, gas_price
+    )
+
+async def notify_order(bot, order):
+    """Tell a user that one of their limit orders was filled or failed."""
+    if order["status"] == FILLED:
+        text = (
+            f"✅ Limit {order['type']} filled\n\n"
+            f"Token: {order['token_symbol']}\n"
+            f"Amount: {format_order_amount(order)}\n"
+            f"Trigger: {order['price']:g} ${NATIVE_SYMBOL}\n"
+            f"{EXPLORER_URL}/tx/{order['tx_hash']}"
+        )
+    else:
+        text = (
+            f"❌ Limit {order['type']} failed\n\n"
+            f"Token: {order['token_symbol']}\n"
+            f"Error: {order['error']}"
+        )
+        if order.get("tx_hash"):
+            text += f"\n{EXPLORER_URL}/tx/{order['tx_hash']}"
+    try:
+        await bot.send_message(chat_id=int(order["user_id"]), text=text, rate_limit_args=BACKGROUND)
+    except Exception as e:
+        logger.error(f"Error notifying order update: {str(e)}")
+
+def get_chart_keyboard(interval):
+    """Create the chart interval keyboard."""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(f"✅ {name}" if name == interval else name, callback_data=f"chart_{name}")
+            for name in CHART_INTERVALS
+        ],
+        [InlineKeyboardButton("❌ Close", callback_data="close_chart")]
+    ])
+
+async def show_chart(update: Update, context: ContextTypes.DEFAULT_TYPE, interval=DEFAULT_CHART_INTERVAL):
+    """Send the price chart of the current token, or switch the interval of a shown chart."""
+    query = update.callback_query
+    token = context.user_data.get('current_token')
+    if not token or interval not in CHART_INTERVALS:
+        await query.message.reply_text("❌ Open a token first to see its chart.")
+        return
+    
+    price_feed.watch(token)
+    try:
+        symbol = (await get_token_metadata(token))["symbol"]
+    except Exception:
+        symbol = token[:10]
+    
+    chart = await chart_cache.get(token, symbol, interval)
+    if chart is None:
+        text = (
+            f"📊 Not enough price history for {symbol} yet.\n\n"
+            "Prices are recorded while the token is being watched. Check back in a few minutes."
+        )
+        if query.message.photo:
+            await query.message.reply_text(text)
+        else:
+            await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("⬅️ Back", callback_data="token_info")
+            ]]))
+        return
+    
+    key, photo = chart
+    caption = f"📊 {symbol} · {interval} candles"
+    try:
+        if query.message.photo:
+            message = await query.message.edit_media(
+                InputMediaPhoto(photo, caption=caption),
+                reply_markup=get_chart_keyboard(interval)
             )
-    elif query.data.startswith("cancel_"):
-        try:
-            index = int(query.data.split("_")[-1])
-            order = context.user_data.get('active_orders', [])[index]
-            handle_order_cancellation(update, context, order.get("id", ""))
-        except (ValueError, IndexError):
-            query.message.edit_text(
-                "Error: Order not found.",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("⬅️ Back", callback_data="cancel_orders")
-                ]])
+        else:
+            message = await query.message.reply_photo(
+                photo,
+                caption=caption,
+                reply_markup=get_chart_keyboard(interval)
             )
-    elif query.data == "wallets":
-        show_wallets(update, context)
-    elif query.data == "new_wallet":
-        handle_new_wallet(update, context)
-    elif query.data == "new_x_wallets":
-        handle_new_x_wallets(update, context)
-    elif query.data == "import_wallet":
-        handle_import_wallet(update, context)
-    elif query.data == "delete_wallet":
-        handle_delete_wallet(update, context)
-    elif query.data == "show_private_key":
-        handle_show_private_key(update, context)
-    elif query.data.startswith("confirm_delete_"):
-        wallet_index = int(query.data.split("_")[-1])
-        confirm_delete_wallet(update, context, wallet_index)
-    elif query.data.startswith("execute_delete_"):
-        wallet_index = int(query.data.split("_")[-1])
-        execute_delete_wallet(update, context, wallet_index)
-    elif query.data.startswith("confirm_show_key_"):
-        wallet_index = int(query.data.split("_")[-1])
-        confirm_show_private_key(update, context, wallet_index)
-    elif query.data.startswith("execute_show_key_"):
-        wallet_index = int(query.data.split("_")[-1])
-        execute_show_private_key(update, context, wallet_index)
-    elif query.data == "withdraw":
-        handle_withdraw(update, context)
-    elif query.data.startswith("select_wallet_withdraw_"):
-        wallet_index = int(query.data.split("_")[-1])
-        handle_wallet_selection_for_withdraw(update, context, wallet_index)
-    elif query.data == "withdraw_mon":
-        handle_mon_withdrawal(update, context)
-    elif query.data == "withdraw_tokens":
-        handle_token_withdrawal(update, context)
-    elif query.data == "main_menu":
-        # Show main menu
-        query.message.edit_text(
-            "Welcome to Monad Sniper Bot! 🚀\n\nSelect an option:",
-            reply_markup=get_main_menu_keyboard()
-        )
-    elif query.data == "config":
-        show_config(update, context)
-    elif query.data == "referral":
-        show_referral(update, context)
-    elif query.data == "portfolio":
-        show_portfolio(update, context)
-    elif query.data == "guide":
-        show_guide(update, context)
-
-def show_config(update: Update, context: CallbackContext):
+    except BadRequest as e:
+        # Same chart clicked again
+        if "not modified" in str(e):
+            return
+        raise
+    
+    if isinstance(photo, bytes) and getattr(message, "photo", None):
+        chart_cache.set_file_id(key, message.photo[-1].file_id)
+
+async def close_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Delete a chart message."""
+    await update.callback_query.message.delete()
+
+async def select_slippage(update: Update, context: ContextTypes.DEFAULT_TYPE, slippage: str):
+    """Store the chosen slippage and return to the token card."""
+    if slippage != "custom":
+        context.user_data['slippage'] = float(slippage)
+    await handle_token_info(update, context)
+
+async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the main menu."""
+    query = update.callback_query
+    await query.message.edit_text(
+        "Welcome to Monad Sniper Bot! 🚀\n\nSelect an option:",
+        reply_markup=get_main_menu_keyboard()
+    )
+
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle button presses."""
+    query = update.callback_query
+    # Answer in the background so trades are not delayed by a Telegram round-trip
+    context.application.create_task(query.answer())
+    await router.dispatch(update, context)
+
+async def show_config(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show configuration interface."""
     query = update.callback_query
     user_id = str(query.from_user.id)
@@ -1773,42 +2033,209 @@ def show_config(update: Update, context: CallbackContext):
         f"• Gas Settings: {settings['gas_settings'].title()}"
     )
     
-    query.message.reply_text(text)
+    await query.message.reply_text(text)
 
-def show_referral(update: Update, context: CallbackContext):
+async def show_referral(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show referral information."""
     query = update.callback_query
     text = "👥 Referral Program\n\nShare your referral link to earn up to 50% of trading fees!"
-    query.message.reply_text(text)
+    await query.message.reply_text(text)
+
+def format_portfolio(wallets, native, holdings, metadata, prices):
+    """Format the holdings of a user's wallets, valued in the native token."""
+    text = "📊 Portfolio\n\n"
+    total = Decimal(0)
+    for i, wallet in enumerate(wallets, 1):
+        address = Web3.to_checksum_address(wallet["address"])
+        balance = native.get(address)
+        text += f"{i}. `{address[:6]}...{address[-4:]}`\n"
+        text += f"   {NATIVE_SYMBOL}: {format_balance(balance)}\n"
+        if balance is not None:
+            total += Web3.from_wei(balance, 'ether')
+        for token, amount in holdings.get(address, {}).items():
+            info = metadata.get(token)
+            if info is None:
+                continue
+            symbol = escape_markdown(info["symbol"])
+            amount = Decimal(amount) / (Decimal(10) ** info["decimals"])
+            price = prices.get(token)
+            if price:
+                value = amount * Decimal(str(price))
+                total += value
+                text += f"   {symbol}: {amount:,.4f} ≈ {value:,.4f} {NATIVE_SYMBOL}\n"
+            else:
+                text += f"   {symbol}: {amount:,.4f}\n"
+        text += "\n"
+    text += f"💰 Total: {total:,.4f} {NATIVE_SYMBOL}"
+    return text
 
-def show_portfolio(update: Update, context: CallbackContext):
-    """Show portfolio information."""
+async def show_portfolio(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the token holdings and value of all of a user's wallets."""
     query = update.callback_query
-    text = "📊 Portfolio\n\nConnect a wallet to view your portfolio."
-    query.message.reply_text(text)
+    user_id = str(query.from_user.id)
+    wallets = users.get(user_id, {}).get("wallets", [])
+    if not wallets:
+        await query.message.reply_text("📊 Portfolio\n\nCreate or import a wallet to view your portfolio.")
+        return
+    
+    addresses = [wallet["address"] for wallet in wallets]
+    try:
+        native, holdings = await asyncio.gather(
+            balance_service.get_balances(addresses),
+            holdings_service.get_holdings(addresses)
+        )
+        tokens = {token for balances in holdings.values() for token in balances}
+        metadata, prices = await asyncio.gather(
+            get_many_token_metadata(tokens),
+            price_feed.prices(tokens)
+        )
+    except Exception as e:
+        logger.error(f"Error loading portfolio: {str(e)}")
+        await query.message.reply_text("❌ Error loading portfolio. Please try again later.")
+        return
+    
+    await query.message.reply_text(
+        format_portfolio(wallets, native, holdings, metadata, prices),
+        parse_mode='Markdown'
+    )
 
-def show_guide(update: Update, context: CallbackContext):
+async def show_guide(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show bot guide."""
     query = update.callback_query
     text = "📖 Trading Bot Guide\n\nLearn how to use all features of the Monad Trading Bot."
-    query.message.reply_text(text)
+    await query.message.reply_text(text)
+
+# Callback routes: exact keys first, then the longest matching "prefix_"
+router = CallbackRouter()
+router.exact("token_info", handle_token_info)
+router.exact("select_trading_wallet", handle_select_trading_wallet)
+router.prefix("select_trade_wallet_", select_trade_wallet)
+router.prefix("toggle_trade_wallet_", toggle_trade_wallet)
+router.exact("show_chart", show_chart)
+router.prefix("chart_", show_chart, str)
+router.exact("close_chart", close_chart)
+router.exact("set_slippage", handle_set_slippage)
+router.prefix("set_slippage_", select_slippage, str)
+router.exact("set_gas", handle_set_gas)
+router.prefix("set_gas_", select_gas, str)
+router.exact("buy_token", handle_buy_token)
+router.exact("sell_token", handle_sell_token)
+router.prefix("buy_amount_", lambda u, c, amount: execute_trade(u, c, "buy", amount), str)
+router.prefix("sell_percent_", lambda u, c, percentage: execute_trade(u, c, "sell", percentage))
+router.exact("manage_orders", handle_manage_orders)
+router.exact("limit_order", handle_limit_order)
+router.prefix("limit_side_", select_limit_side, str)
+router.exact("active_orders", handle_active_orders)
+router.exact("order_history", handle_order_history)
+router.exact("cancel_orders", handle_cancel_orders)
+router.prefix("view_order_", view_order, str)
+router.prefix("confirm_cancel_", handle_order_cancellation, str)
+for _list_name in ORDER_LISTS:
+    router.prefix(f"{_list_name}_after_", lambda u, c, i, name=_list_name: show_order_list(u, c, name, after=i), str)
+    router.prefix(f"{_list_name}_before_", lambda u, c, i, name=_list_name: show_order_list(u, c, name, before=i), str)
+router.exact("wallets", show_wallets)
+router.exact("new_wallet", handle_new_wallet)
+router.exact("new_x_wallets", handle_new_x_wallets)
+router.exact("import_wallet", handle_import_wallet)
+router.exact("delete_wallet", handle_delete_wallet)
+router.exact("show_private_key", handle_show_private_key)
+router.prefix("confirm_delete_", confirm_delete_wallet)
+router.prefix("execute_delete_", execute_delete_wallet)
+router.prefix("confirm_show_key_", confirm_show_private_key)
+router.prefix("execute_show_key_", execute_show_private_key)
+router.exact("withdraw", handle_withdraw)
+router.prefix("select_wallet_withdraw_", handle_wallet_selection_for_withdraw)
+router.exact("withdraw_mon", handle_mon_withdrawal)
+router.exact("withdraw_tokens", handle_token_withdrawal)
+router.exact("main_menu", show_main_menu)
+router.exact("config", show_config)
+router.exact("referral", show_referral)
+router.exact("portfolio", show_portfolio)
+router.exact("guide", show_guide)
+
+async def on_startup(application: Application):
+    """Start background services."""
+    tasks = application.bot_data.setdefault('background_tasks', [])
+    if BLOCK_SUBSCRIBER_ENABLED:
+        balance_service.tracker = block_subscriber
+        holdings_service.tracker = block_subscriber
+        if chain_follower is not None:
+            tasks.append(clients.background_task(chain_follower.run()))
+        if chain_follower is not block_subscriber:
+            tasks.append(asyncio.create_task(block_subscriber.run()))
+    order_engine.on_update = lambda order: application.create_task(notify_order(application.bot, order))
+    # Loaded only now so orders failed by the restart are reported
+    order_engine.load(owns_user)
+    order_engine.resume()
+    tasks.append(clients.background_task(price_feed.run()))
+    
+    queue_depth.labels("updates").set_function(application.update_queue.qsize)
+    active_orders = registry.gauge("active_orders", "Limit orders waiting for their price")
+    active_orders.set_function(lambda: len(order_engine.active))
+    price_feed_tokens = registry.gauge("price_feed_tokens", "Tokens with recorded prices")
+    price_feed_tokens.set_function(lambda: len(price_feed.series))
+    if METRICS_ENABLED:
+        # Workers of one host each expose their own endpoint
+        metrics_port = METRICS_PORT + SHARD_INDEX
+        application.bot_data['metrics_server'] = await start_metrics_server(METRICS_LISTEN, metrics_port)
+        logger.info(f"Metrics available on http://{METRICS_LISTEN}:{metrics_port}/metrics")
+
+async def on_shutdown(application: Application):
+    """Stop background services, flush pending writes and close shared network clients."""
+    tasks = application.bot_data.pop('background_tasks', [])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    metrics_server = application.bot_data.pop('metrics_server', None)
+    if metrics_server is not None:
+        await metrics_server.cleanup()
+    await order_engine.close()
+    await holdings_service.close()
+    flush_users()
+    order_store.close()
+    holdings_service.store.close()
+    if price_exchange is not None:
+        price_exchange.close()
+    if block_store is not None:
+        block_store.close()
+    await clients.close()
 
 def main():
     """Start the bot."""
-    updater = Updater(TELEGRAM_BOT_TOKEN)
-
-    # Get the dispatcher to register handlers
-    dp = updater.dispatcher
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES))
+        .rate_limiter(OutboundLimiter())
+        .persistence(SqliteStatePersistence(STATE_DB_FILE, owns_user, STATE_FLUSH_INTERVAL))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if BOT_MODE == 'webhook' or SHARD_COUNT > 1:
+        # Updates arrive through our own HTTP server instead of getUpdates
+        builder = builder.updater(None)
+    application = builder.build()
 
-    # Add handlers
-    dp.add_handler(CommandHandler("start", start))
-    dp.add_handler(CommandHandler("menu", start))  # Add menu command
-    dp.add_handler(CallbackQueryHandler(button_callback))
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, handle_text_input))
+    # Add handlers; rate limits run first and stop over-limit updates
+    application.add_handler(TypeHandler(Update, enforce_rate_limit), group=-1)
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("menu", start))  # Add menu command
+    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_input))
 
     # Start the Bot
-    updater.start_polling()
-    updater.idle()
+    if SHARD_COUNT > 1:
+        # The sharding front forwards this worker's users' updates
+        server = WebhookServer(
+            application.process_update, application.bot,
+            listen=SHARD_LISTEN, port=SHARD_PORT + SHARD_INDEX,
+            path=SHARD_PATH, secret_token=SHARD_SECRET
+        )
+        asyncio.run(run_webhook(application, server))
+    elif BOT_MODE == 'webhook':
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+In-process caches shared by the data fetchers.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Collapse concurrent fetches of the same key into one in-flight call.
+
+    The first caller for a key starts the fetch; everyone who asks for the
+    same key before it finishes awaits that same result. A caller that is
+    cancelled (e.g. by its own timeout) does not cancel the shared fetch.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def in_flight(self, key):
+        """Return True while a fetch for ``key`` is running."""
+        return key in self._inflight
+
+    async def do(self, key, fetch):
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fetch())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Mark the exception as retrieved when every waiter has gone away
+        if not future.cancelled():
+            future.exception()
+
+
+class TTLCache:
+    """Bounded LRU cache with stale-while-revalidate.
+
+    An entry is fresh for ``ttl`` seconds. For ``stale_ttl`` seconds after
+    that it is still served immediately, while a single background task
+    refreshes it. Once the least recently used entry has to make room for
+    a new one it is evicted. Concurrent misses for the same key share a
+    single fetch.
+    """
+
+    def __init__(self, maxsize, ttl, stale_ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._flight = SingleFlight()
+        # Running background refreshes; the loop only keeps weak references to tasks
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return ``(value, fresh)`` for a usable entry, or ``(None, False)``."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl + self.stale_ttl:
+            del self._entries[key]
+            return None, False
+
+        self._entries.move_to_end(key)
+        return value, age <= self.ttl
+
+    def set(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_fetch(self, key, fetch):
+        """Return the cached value for ``key``, calling ``fetch()`` on a miss.
+
+        Stale values are returned at once and refreshed in the background.
+        """
+        value, fresh = self.get(key)
+        if key in self._entries:
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._refresh(key, fetch)
+            return value
+
+        self.misses += 1
+        return await self._flight.do(key, lambda: self._fetch_and_store(key, fetch))
+
+    async def _fetch_and_store(self, key, fetch):
+        value = await fetch()
+        self.set(key, value)
+        return value
+
+    def _refresh(self, key, fetch):
+        async def refresh():
+            try:
+                await self._flight.do(key, lambda: self._fetch_and_store(key, fetch))
+            except Exception as e:
+                logger.error(f"Error refreshing cache entry {key}: {str(e)}")
+
+        # A refresh or miss already in flight for this key will update it
+        if not self._flight.in_flight(key):
+            task = asyncio.ensure_future(refresh())
+            self._refreshing.add(task)
+            task.add_done_callback(self._refreshing.discard)
+
+    def stats(self):
+        """Return hit/miss counters for this cache."""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self._flight.shared,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
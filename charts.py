@@ -0,0 +1,140 @@
+"""
+Price charts rendered from the locally recorded price feed.
+
+Samples are bucketed into OHLC candles with numpy ``reduceat`` (one pass per
+aggregate, no Python loop over samples) and drawn to PNG with matplotlib's
+Agg backend in a worker thread. Rendered charts are cached per token,
+interval and last candle, so everyone asking for the same chart while its
+last candle is unchanged gets the same image. Once an image has been sent,
+Telegram's ``file_id`` for it is cached alongside, and later requests send
+that id instead of uploading the PNG again.
+"""
+import asyncio
+import io
+import logging
+import time
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from cache import SingleFlight
+from config import CHART_INTERVALS, CHART_CANDLES, CHART_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Candle colours
+UP = "#26a69a"
+DOWN = "#ef5350"
+
+
+def ohlc(times, prices, interval, candles=CHART_CANDLES):
+    """Aggregate samples into the last ``candles`` candles of ``interval`` seconds.
+
+    Returns ``(starts, opens, highs, lows, closes)`` numpy arrays, oldest first.
+    """
+    times = np.frombuffer(times, dtype=np.float64)
+    prices = np.frombuffer(prices, dtype=np.float64)
+    if not len(times):
+        empty = np.empty(0)
+        return empty, empty, empty, empty, empty
+
+    buckets = (times // interval).astype(np.int64)
+    # Only samples that fall into the last ``candles`` buckets are aggregated
+    first = np.searchsorted(buckets, buckets[-1] - candles + 1)
+    buckets, prices = buckets[first:], prices[first:]
+
+    starts = np.flatnonzero(np.diff(buckets)) + 1
+    starts = np.concatenate(([0], starts))
+    ends = np.concatenate((starts[1:] - 1, [len(prices) - 1]))
+    return (
+        buckets[starts] * float(interval),
+        prices[starts],
+        np.maximum.reduceat(prices, starts),
+        np.minimum.reduceat(prices, starts),
+        prices[ends],
+    )
+
+
+def render_chart(title, candles, interval):
+    """Draw candles to a PNG and return its bytes."""
+    starts, opens, highs, lows, closes = candles
+    figure = Figure(figsize=(8, 4.5), dpi=100, facecolor="#131722")
+    axes = figure.add_subplot()
+    axes.set_facecolor("#131722")
+    axes.tick_params(colors="#d1d4dc", labelsize=8)
+    for spine in axes.spines.values():
+        spine.set_color("#363a45")
+    axes.grid(color="#363a45", linewidth=0.5)
+
+    x = np.arange(len(starts))
+    colors = np.where(closes >= opens, UP, DOWN)
+    axes.vlines(x, lows, highs, colors=colors, linewidth=1)
+    bodies = np.abs(closes - opens)
+    # Keep flat candles visible as a thin line
+    bodies = np.maximum(bodies, (highs.max() - lows.min()) * 0.002 or closes.max() * 0.002)
+    axes.bar(x, bodies, bottom=np.minimum(opens, closes), width=0.7, color=colors)
+
+    ticks = x[::max(1, len(x) // 6)]
+    axes.set_xticks(ticks)
+    axes.set_xticklabels([time.strftime("%H:%M", time.gmtime(starts[i])) for i in ticks])
+    axes.yaxis.tick_right()
+    axes.set_title(f"{title} · {interval} · UTC", color="#d1d4dc", fontsize=10)
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", facecolor=figure.get_facecolor())
+    return buffer.getvalue()
+
+
+class ChartCache:
+    """Rendered charts keyed by ``(token, interval, last candle)``, plus their Telegram file ids."""
+
+    def __init__(self, price_feed, maxsize=CHART_CACHE_SIZE):
+        self.price_feed = price_feed
+        self.maxsize = maxsize
+        self._images = {}
+        self._flight = SingleFlight()
+        self.renders = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._images)
+
+    async def get(self, token, title, interval):
+        """Return ``(key, photo)`` where photo is a cached file id or fresh PNG bytes, or None without data."""
+        seconds = CHART_INTERVALS[interval]
+        times, prices = self.price_feed.history(token, time.time() - seconds * CHART_CANDLES)
+        candles = ohlc(times, prices, seconds)
+        if len(candles[0]) < 2:
+            return None
+
+        last = tuple(float(column[-1]) for column in candles)
+        key = (token, interval, last)
+        entry = self._images.get(key)
+        if entry is not None:
+            self.hits += 1
+            return key, entry["file_id"] or entry["png"]
+
+        self.misses += 1
+        png = await self._flight.do(key, lambda: self._render(key, title, candles, interval))
+        return key, self._images.get(key, {}).get("file_id") or png
+
+    async def _render(self, key, title, candles, interval):
+        png = await asyncio.to_thread(render_chart, title, candles, interval)
+        self.renders += 1
+        # Charts of a token whose last candle moved on are never asked for again
+        for old in [old for old in self._images if old[:2] == key[:2]]:
+            del self._images[old]
+        self._images[key] = {"png": png, "file_id": None}
+        while len(self._images) > self.maxsize:
+            del self._images[next(iter(self._images))]
+        return png
+
+    def set_file_id(self, key, file_id):
+        """Remember the Telegram file id of an uploaded chart."""
+        entry = self._images.get(key)
+        if entry is not None:
+            entry["file_id"] = file_id
+            # The upload is the only copy needed from now on
+            entry["png"] = None
@@ -0,0 +1,164 @@
+"""
+Process-wide network clients shared by every handler.
+
+All outbound HTTP (the Monad RPC and the Kuru API) goes through a single
+aiohttp session with keep-alive connection pooling and DNS caching, so a
+token lookup reuses warm TCP/TLS connections instead of opening new ones.
+The session is bound to the bot's event loop and created on first use.
+
+Outbound calls are metered against two budgets per service: background
+pollers (price feed, block subscriber, portfolio history scans) are started
+with ``background_task`` and draw only on their own ``BACKGROUND_BUDGET_SHARE``,
+so however busy they get, the rest stays free for interactive requests.
+"""
+import asyncio
+import contextvars
+import logging
+
+import aiohttp
+
+from metrics import registry
+from config import (
+    MONAD_RPC_URL,
+    HTTP_POOL_SIZE,
+    HTTP_POOL_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_TIMEOUT,
+    DNS_CACHE_TTL,
+    RPC_CALLS_PER_SECOND,
+    KURU_REQUESTS_PER_SECOND,
+    OUTBOUND_BURST_SECONDS,
+    BACKGROUND_BUDGET_SHARE,
+    SHARD_COUNT
+)
+from ratelimit import RateLimiter, RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_rpc_id = 0
+
+rpc_latency = registry.histogram("rpc_request_seconds", "Monad RPC request latency", ["method"])
+rpc_calls = registry.counter("rpc_calls_total", "Monad RPC calls, counting each call of a batch", ["method"])
+rpc_errors = registry.counter("rpc_errors_total", "Failed Monad RPC calls", ["method"])
+
+
+def _budget(name, rate):
+    return RateLimiter(name, rate, rate * OUTBOUND_BURST_SECONDS)
+
+
+# Shared outbound budgets so one busy user cannot spend everyone's quota;
+# sharded workers each get an equal part, and pollers a fixed share of it
+_rpc_rate = RPC_CALLS_PER_SECOND / SHARD_COUNT
+_kuru_rate = KURU_REQUESTS_PER_SECOND / SHARD_COUNT
+_interactive = 1 - BACKGROUND_BUDGET_SHARE
+rpc_limiter = _budget("rpc", _rpc_rate * _interactive)
+kuru_limiter = _budget("kuru", _kuru_rate * _interactive)
+rpc_background_limiter = _budget("rpc_background", _rpc_rate * BACKGROUND_BUDGET_SHARE)
+kuru_background_limiter = _budget("kuru_background", _kuru_rate * BACKGROUND_BUDGET_SHARE)
+_limiters = {
+    "rpc": (rpc_limiter, rpc_background_limiter),
+    "kuru": (kuru_limiter, kuru_background_limiter),
+}
+_background = contextvars.ContextVar("background", default=False)
+
+
+class RPCError(Exception):
+    """Error returned by the JSON-RPC endpoint for a single call."""
+
+
+def background_task(coro):
+    """Start ``coro`` as a task whose outbound calls, and those of tasks it starts, use the background budget."""
+    token = _background.set(True)
+    try:
+        return asyncio.create_task(coro)
+    finally:
+        _background.reset(token)
+
+
+def allow(service, cost=1):
+    """Take ``cost`` calls from the ``"rpc"`` or ``"kuru"`` budget of the current task."""
+    return _limiters[service][_background.get()].allow(service, cost)
+
+
+def get_session():
+    """Return the shared aiohttp session, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            limit_per_host=HTTP_POOL_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=DNS_CACHE_TTL
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+    return _session
+
+
+async def rpc_batch(calls):
+    """Send several JSON-RPC calls to the Monad RPC in a single HTTP request.
+
+    ``calls`` is a list of ``(method, params)`` tuples. Results come back in
+    the same order; a call that failed yields an ``RPCError`` instance
+    instead of a result.
+    """
+    global _rpc_id
+    if not calls:
+        return []
+    if not allow("rpc", len(calls)):
+        raise RateLimitExceeded("RPC request budget exhausted")
+
+    payload = []
+    for method, params in calls:
+        _rpc_id += 1
+        payload.append({"jsonrpc": "2.0", "id": _rpc_id, "method": method, "params": params})
+        rpc_calls.labels(method).inc()
+
+    methods = {request["method"] for request in payload}
+    label = methods.pop() if len(methods) == 1 else "batch"
+    try:
+        with rpc_latency.labels(label).time():
+            async with get_session().post(MONAD_RPC_URL, json=payload) as response:
+                response.raise_for_status()
+                replies = await response.json(content_type=None)
+
+        if isinstance(replies, dict):
+            # Some nodes answer a rejected batch with a single error object
+            raise RPCError(replies.get("error", {}).get("message", "Invalid batch response"))
+    except Exception:
+        rpc_errors.labels(label).inc()
+        raise
+
+    by_id = {reply.get("id"): reply for reply in replies}
+    results = []
+    for request in payload:
+        reply = by_id.get(request["id"])
+        if reply is None:
+            rpc_errors.labels(request["method"]).inc()
+            results.append(RPCError("Missing response"))
+        elif "error" in reply:
+            rpc_errors.labels(request["method"]).inc()
+            results.append(RPCError(reply["error"].get("message", "Unknown error")))
+        else:
+            results.append(reply.get("result"))
+    return results
+
+
+async def rpc_call(method, params):
+    """Send a single JSON-RPC call to the Monad RPC and return its result."""
+    result = (await rpc_batch([(method, params)]))[0]
+    if isinstance(result, RPCError):
+        raise result
+    return result
+
+
+async def close():
+    """Close the shared session."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
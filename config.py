@@ -9,6 +9,49 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("No TELEGRAM_BOT_TOKEN found in environment variables")
 
+# Maximum number of updates handled concurrently on the bot's event loop
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '256'))
+
+# Update ingestion: 'polling' or 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Webhook Configuration (BOT_MODE=webhook)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # public HTTPS URL Telegram posts updates to
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # sent back by Telegram in every request; required
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '64'))  # updates of one chat stay on one worker
+WEBHOOK_QUEUE_SIZE = 100  # pending updates per worker
+WEBHOOK_ENQUEUE_TIMEOUT = 2.0  # seconds to wait for queue space before answering 503
+WEBHOOK_MAX_CONNECTIONS = 100  # concurrent connections Telegram may open
+if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+    raise ValueError("WEBHOOK_URL is required when BOT_MODE is 'webhook'")
+if BOT_MODE == 'webhook' and not WEBHOOK_SECRET:
+    # Without it anyone who finds the URL can post updates as any user
+    raise ValueError("WEBHOOK_SECRET is required when BOT_MODE is 'webhook'")
+
+# Sharding: sharding.py ingests updates (per BOT_MODE) and forwards each user's
+# updates to worker ``user id % SHARD_COUNT``; every worker runs bot.py
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))  # 1 runs the bot as a single process
+SHARD_INDEX = int(os.getenv('SHARD_INDEX', '0'))  # this worker's shard
+SHARD_WORKER_URLS = [url for url in os.getenv('SHARD_WORKER_URLS', '').split(',') if url]  # front: URL of worker i
+SHARD_LISTEN = os.getenv('SHARD_LISTEN', '127.0.0.1')
+SHARD_PORT = int(os.getenv('SHARD_PORT', '8450'))  # worker i listens on SHARD_PORT + i
+SHARD_PATH = '/updates'
+SHARD_SECRET = os.getenv('SHARD_SECRET', '')  # sent by the front with every batch; required
+SHARD_QUEUE_SIZE = 1000  # updates the front holds per worker
+SHARD_BATCH_SIZE = 100  # updates forwarded in one request
+SHARD_RETRY_DELAY = 1.0  # seconds before forwarding to an unavailable worker again
+UPDATE_DEDUP_WINDOW = 10000  # recent update ids remembered to drop redelivered updates
+if not 0 <= SHARD_INDEX < SHARD_COUNT:
+    raise ValueError("SHARD_INDEX must be between 0 and SHARD_COUNT - 1")
+if SHARD_WORKER_URLS and len(SHARD_WORKER_URLS) != SHARD_COUNT:
+    raise ValueError("SHARD_WORKER_URLS must list one URL per shard")
+if SHARD_COUNT > 1 and not SHARD_SECRET:
+    # Workers would take forged updates from anyone who can reach their ports
+    raise ValueError("SHARD_SECRET is required when SHARD_COUNT > 1")
+
 # Blockchain Configuration
 MONAD_RPC_URL = os.getenv('MONAD_RPC_URL', 'https://rpc.monad.xyz')
 EXPLORER_URL = os.getenv('EXPLORER_URL', 'https://explorer.monad.xyz')
@@ -18,16 +61,110 @@ NATIVE_SYMBOL = os.getenv('NATIVE_SYMBOL', 'MON')
 # API Configuration
 KURU_API_URL = "https://api.kuru.io"
 
+# Per-source timeouts (seconds) for the token card pipeline
+TOKEN_SOURCE_TIMEOUTS = {
+    'chain': 3.0,  # on-chain metadata, required for the card
+    'token': 2.0,  # Kuru token stats
+    'pair': 2.0,  # Kuru pair reserves
+    'socials': 1.5,  # Kuru social links
+}
+
+# Token info cache
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '5000'))  # tokens per cache
+TOKEN_METADATA_TTL = 3600  # seconds; name, symbol, decimals, total supply
+TOKEN_MARKET_TTL = 10  # seconds; price, liquidity, reserves
+TOKEN_MARKET_STALE_TTL = 60  # seconds a stale market entry is served while refreshing
+TOKEN_SOCIALS_TTL = 300  # seconds
+
+# Price feed: tokens that are viewed, held or have open orders are polled together
+PRICE_FEED_INTERVAL = 2.0  # seconds between polls
+PRICE_FEED_MAX_BACKOFF = 30.0  # longest pause in seconds while the background budget is spent
+PRICE_HISTORY_SIZE = 10800  # samples kept per token (6 hours at the default interval)
+PRICE_VIEW_TTL = 900  # seconds a token stays polled after its card was shown
+PRICE_STALE_INTERVALS = 5  # polls after which a token's last sample no longer counts as its price
+PRICE_SHARE_TTL = 60.0  # seconds a sharded worker's interest in a token outlasts its last round
+
+# Price charts, rendered from the price feed's history
+CHART_INTERVALS = {'1m': 60, '5m': 300, '15m': 900}  # candle sizes in seconds
+DEFAULT_CHART_INTERVAL = '5m'
+CHART_CANDLES = 60  # candles per chart
+CHART_CACHE_SIZE = 500  # rendered charts kept in memory
+
+# Wallet keyboards are memoized per user
+KEYBOARD_CACHE_SIZE = int(os.getenv('KEYBOARD_CACHE_SIZE', '10000'))  # users whose keyboards are kept
+
+# Native balances are re-read at most once per this many seconds (about one block)
+BALANCE_CACHE_TTL = float(os.getenv('BALANCE_CACHE_TTL', '1.0'))
+# While the block subscriber is live, balances are invalidated per block instead
+BALANCE_TRACKED_TTL = 60.0  # seconds; safety net for transfers the subscriber cannot see
+
+# Block subscriber
+BLOCK_SUBSCRIBER_ENABLED = os.getenv('BLOCK_SUBSCRIBER_ENABLED', 'true').lower() == 'true'
+MONAD_WS_URL = os.getenv('MONAD_WS_URL')  # newHeads subscription; polling is used when unset
+BLOCK_POLL_INTERVAL = 1.0  # seconds between eth_blockNumber polls
+MAX_BLOCK_RANGE = 20  # blocks replayed after falling behind; older ones are skipped
+BLOCK_STALL_TIMEOUT = 15.0  # seconds without a block before the subscriber counts as down
+BLOCK_RELAY_POLL_INTERVAL = 0.25  # seconds between sharded workers' reads of new block events
+BLOCK_RELAY_RETENTION = 300  # seconds block events are kept for sharded workers
+
+# Portfolio: held tokens are discovered from Transfer logs into the wallet
+PORTFOLIO_SCAN_BLOCKS = int(os.getenv('PORTFOLIO_SCAN_BLOCKS', '100000'))  # blocks of history scanned per step
+LOG_BLOCK_RANGE = int(os.getenv('LOG_BLOCK_RANGE', '1000'))  # widest block range per eth_getLogs call
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', '10'))  # eth_getLogs ranges sent in one request
+
+# HTTP Client Configuration (shared by RPC and Kuru API calls)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '100'))  # total open connections
+HTTP_POOL_PER_HOST = int(os.getenv('HTTP_POOL_PER_HOST', '20'))  # connections per host
+HTTP_KEEPALIVE_TIMEOUT = 30  # seconds an idle connection is kept open
+HTTP_TIMEOUT = 10  # seconds per request
+DNS_CACHE_TTL = 300  # seconds
+
+# Multicall3 is used for batched contract reads when deployed; set empty to disable
+MULTICALL3_ADDRESS = os.getenv('MULTICALL3_ADDRESS', '0xcA11bde05977b3631167028862bE2a173976CA11')
+MULTICALL_CHUNK_SIZE = 200  # calls per aggregate3 eth_call
+
+# Transaction submission
+NATIVE_TRANSFER_GAS = 21000
+GAS_PRICE_TTL = 2.0  # seconds a fetched gas price is reused
+RECEIPT_POLL_INTERVAL = 1.0  # seconds between receipt polls
+RECEIPT_TIMEOUT = 120  # seconds before a pending transaction is reported as unconfirmed
+
 # Data Storage
 DATA_DIR = "data"
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
+USERS_DB_FILE = os.path.join(DATA_DIR, "users.db")
+USER_STORE_BACKEND = os.getenv('USER_STORE_BACKEND', 'sqlite')  # 'sqlite' or 'json'
+USER_STORE_FLUSH_MS = int(os.getenv('USER_STORE_FLUSH_MS', '50'))  # group commit window
+ORDERS_DB_FILE = os.path.join(DATA_DIR, "orders.db")
+PORTFOLIO_DB_FILE = os.path.join(DATA_DIR, "portfolio.db")  # per-wallet transfer log scan progress
+STATE_DB_FILE = os.path.join(DATA_DIR, "state.db")  # per-user conversation state
+PRICES_DB_FILE = os.path.join(DATA_DIR, "prices.db")  # prices shared by sharded workers
+BLOCKS_DB_FILE = os.path.join(DATA_DIR, "blocks.db")  # block events shard 0 hands to the others
+STATE_FLUSH_INTERVAL = 1.0  # seconds between writes of changed conversation state
+if SHARD_COUNT > 1 and USER_STORE_BACKEND != 'sqlite':
+    # Workers share the user store; only SQLite can be written by several processes
+    raise ValueError("USER_STORE_BACKEND must be 'sqlite' when SHARD_COUNT > 1")
 
 # Trading Configuration
 DEFAULT_SLIPPAGE = 1.0  # 1%
-DEFAULT_GAS_PRICE = 750  # MIST
+DEFAULT_GAS_PRICE = None  # gwei; None bids the node's current eth_gasPrice
 MAX_SLIPPAGE = 50.0  # 50%
 MIN_SLIPPAGE = 0.1  # 0.1%
 
+# Swap router (UniswapV2-compatible) used for buys and sells
+DEX_ROUTER_ADDRESS = os.getenv('DEX_ROUTER_ADDRESS', '')
+BUY_AMOUNTS = ['0.1', '0.5', '1', '5']  # native amounts offered on the buy menu
+SELL_PERCENTAGES = [25, 50, 100]  # share of the token balance offered on the sell menu
+SWAP_GAS_LIMIT = 300000
+SWAP_DEADLINE = 60  # seconds a signed swap stays valid
+TRADE_TEMPLATE_TTL = 5.0  # seconds prepared pool reserves are trusted
+ORDERS_PER_PAGE = 5
+
+# Metrics: Prometheus text format on http://METRICS_LISTEN:METRICS_PORT/metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')  # local only by default
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+
 # Security Configuration
 MAX_WALLETS_PER_USER = 10
 PRIVATE_KEY_MESSAGE_TIMEOUT = 60  # seconds
@@ -35,6 +172,23 @@ PRIVATE_KEY_MESSAGE_TIMEOUT = 60  # seconds
 # Rate Limiting
 MAX_REQUESTS_PER_MINUTE = 60
 MAX_TRADES_PER_MINUTE = 10
+REQUEST_BURST = 10  # updates a user may send back to back
+TRADE_BURST = 3  # trades a user may send back to back
+# Global outbound budgets; requests beyond them are shed before they are sent
+RPC_CALLS_PER_SECOND = int(os.getenv('RPC_CALLS_PER_SECOND', '200'))  # each call of a batch counts
+KURU_REQUESTS_PER_SECOND = int(os.getenv('KURU_REQUESTS_PER_SECOND', '50'))
+OUTBOUND_BURST_SECONDS = 2  # seconds of budget that can be spent at once
+BACKGROUND_BUDGET_SHARE = float(os.getenv('BACKGROUND_BUDGET_SHARE', '0.3'))  # part of each budget kept for pollers
+
+# Telegram send limits applied to every Bot API call addressed to a chat
+TELEGRAM_GLOBAL_RATE = 30  # messages per second across all chats
+TELEGRAM_GLOBAL_BURST = 30
+TELEGRAM_CHAT_RATE = 1.0  # messages per second to one private chat
+TELEGRAM_CHAT_BURST = 3
+TELEGRAM_GROUP_RATE = 20 / 60  # messages per second to one group or channel
+TELEGRAM_GROUP_BURST = 3
+TELEGRAM_BACKGROUND_RESERVE = 10  # global burst kept free for interactive replies
+TELEGRAM_MAX_RETRIES = 3  # retries after a RetryAfter before giving up
 
 # Error Messages
 ERRORS = {
@@ -13,6 +13,9 @@ def what(file, h=None):
             if isinstance(file, str):
                 f = open(file, 'rb')
                 h = f.read(32)
+            elif isinstance(file, (bytes, bytearray, memoryview)):
+                # In-memory images, e.g. rendered charts
+                h = bytes(file[:32])
             else:
                 location = file.tell()
                 h = file.read(32)
@@ -0,0 +1,153 @@
+"""
+Prebuilt and memoized inline keyboards.
+
+Menus that never change are built once at import. Keyboards that list a
+user's wallets are built on first use and kept until the user's wallets
+change, for the ``KEYBOARD_CACHE_SIZE`` most recently active users. Both
+are ``CachedKeyboard`` instances that serialize themselves once: Telegram
+objects are immutable, so the ``to_dict()`` payload sent with every
+message is computed at construction and reused.
+"""
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import KEYBOARD_CACHE_SIZE
+
+
+class CachedKeyboard(InlineKeyboardMarkup):
+    """InlineKeyboardMarkup whose serialized form is computed once."""
+
+    __slots__ = ("_payload",)
+
+    def __init__(self, inline_keyboard, **kwargs):
+        super().__init__(inline_keyboard, **kwargs)
+        with self._unfrozen():
+            self._payload = super().to_dict()
+
+    def to_dict(self, recursive=True):
+        return self._payload
+
+
+def wallet_buttons(wallets, icon, callback_prefix):
+    """One button per wallet, labelled with its short address."""
+    return [
+        [InlineKeyboardButton(
+            f"{icon} {wallet['address'][:6]}...{wallet['address'][-4:]}",
+            callback_data=f"{callback_prefix}{i}"
+        )]
+        for i, wallet in enumerate(wallets)
+    ]
+
+
+class KeyboardCache:
+    """Per-user keyboards, rebuilt only after ``invalidate(user_id)``.
+
+    Holds the keyboards of at most ``maxsize`` users; the least recently
+    served user is dropped to make room for a new one.
+    """
+
+    def __init__(self, maxsize=KEYBOARD_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._keyboards = OrderedDict()
+
+    def __len__(self):
+        return len(self._keyboards)
+
+    def get(self, user_id, kind, build):
+        """Return the user's ``kind`` keyboard, calling ``build()`` if it is not cached."""
+        keyboards = self._keyboards.get(user_id)
+        if keyboards is None:
+            keyboards = self._keyboards[user_id] = {}
+            if len(self._keyboards) > self.maxsize:
+                self._keyboards.popitem(last=False)
+        else:
+            self._keyboards.move_to_end(user_id)
+        keyboard = keyboards.get(kind)
+        if keyboard is None:
+            keyboard = keyboards[kind] = build()
+        return keyboard
+
+    def invalidate(self, user_id):
+        """Forget a user's keyboards, e.g. after a wallet was added or deleted."""
+        self._keyboards.pop(user_id, None)
+
+
+MAIN_MENU_KEYBOARD = CachedKeyboard([
+    [
+        InlineKeyboardButton("🛒 Buy a Token", callback_data="buy_token"),
+        InlineKeyboardButton("💰 Sell a Token", callback_data="sell_token")
+    ],
+    [
+        InlineKeyboardButton("👛 Wallets", callback_data="wallets"),
+        InlineKeyboardButton("📊 Portfolio", callback_data="portfolio")
+    ],
+    [
+        InlineKeyboardButton("👥 Referral", callback_data="referral"),
+        InlineKeyboardButton("📤 Withdraw", callback_data="withdraw")
+    ],
+    [
+        InlineKeyboardButton("📋 Manage Orders", callback_data="manage_orders"),
+        InlineKeyboardButton("⚙️ Config", callback_data="config")
+    ],
+    [
+        InlineKeyboardButton("📖 Trading Bot Guide", callback_data="guide")
+    ]
+])
+
+WALLET_MENU_KEYBOARD = CachedKeyboard([
+    [
+        InlineKeyboardButton("➕ New Wallet", callback_data="new_wallet"),
+        InlineKeyboardButton("➕ New X Wallets", callback_data="new_x_wallets")
+    ],
+    [
+        InlineKeyboardButton("🔑 Import Wallet", callback_data="import_wallet"),
+        InlineKeyboardButton("🗑️ Delete Wallet", callback_data="delete_wallet")
+    ],
+    [
+        InlineKeyboardButton("👁️ Show Private Key", callback_data="show_private_key")
+    ],
+    [
+        InlineKeyboardButton("⬅️ Main Menu", callback_data="main_menu")
+    ]
+])
+
+MANAGE_ORDERS_KEYBOARD = CachedKeyboard([
+    [
+        InlineKeyboardButton("📋 Active Orders", callback_data="active_orders"),
+        InlineKeyboardButton("📜 Order History", callback_data="order_history")
+    ],
+    [
+        InlineKeyboardButton("❌ Cancel Orders", callback_data="cancel_orders")
+    ],
+    [
+        InlineKeyboardButton("⬅️ Main Menu", callback_data="main_menu")
+    ]
+])
+
+SLIPPAGE_KEYBOARD = CachedKeyboard([
+    [
+        InlineKeyboardButton("0.5%", callback_data="set_slippage_0.5"),
+        InlineKeyboardButton("1%", callback_data="set_slippage_1"),
+        InlineKeyboardButton("2%", callback_data="set_slippage_2")
+    ],
+    [
+        InlineKeyboardButton("3%", callback_data="set_slippage_3"),
+        InlineKeyboardButton("5%", callback_data="set_slippage_5"),
+        InlineKeyboardButton("Custom", callback_data="set_slippage_custom")
+    ],
+    [InlineKeyboardButton("⬅️ Back", callback_data="token_info")]
+])
+
+GAS_KEYBOARD = CachedKeyboard([
+    [InlineKeyboardButton("Auto (network price)", callback_data="set_gas_auto")],
+    [
+        InlineKeyboardButton("Standard (750)", callback_data="set_gas_750"),
+        InlineKeyboardButton("Fast (1000)", callback_data="set_gas_1000")
+    ],
+    [
+        InlineKeyboardButton("Rapid (1500)", callback_data="set_gas_1500"),
+        InlineKeyboardButton("Custom", callback_data="set_gas_custom")
+    ],
+    [InlineKeyboardButton("⬅️ Back", callback_data="token_info")]
+])
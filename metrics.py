@@ -0,0 +1,245 @@
+"""
+Lightweight in-process metrics.
+
+Counters, gauges and histograms are grouped into labelled families in a
+registry, which renders them in the Prometheus text exposition format.
+``start_metrics_server`` serves that text on ``/metrics``. Recording a
+value is a dict lookup and an addition, cheap enough for every update,
+RPC call and cache lookup.
+"""
+import bisect
+import functools
+import math
+import time
+
+from aiohttp import web
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative histogram of observed values with fixed bucket bounds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket containing it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+        }
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Counter:
+    """Monotonically increasing count."""
+
+    def __init__(self):
+        self.value = 0
+        self._function = None
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set_function(self, function):
+        """Read the value from ``function()`` at collection time instead."""
+        self._function = function
+
+    def get(self):
+        return self._function() if self._function is not None else self.value
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class MetricFamily:
+    """Metrics of one name, one child per combination of label values."""
+
+    def __init__(self, kind, name, documentation, labelnames, factory):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children = {}
+
+    def labels(self, *values):
+        """Return the child for label values, creating it on first use."""
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self.children[values] = self.factory()
+        return child
+
+    def _labels(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for values, child in list(self.children.items()):
+            if self.kind == "histogram":
+                cumulative = 0
+                for bound, count in zip(child.buckets, child.counts):
+                    cumulative += count
+                    le = self._labels(values, [("le", _format(bound))])
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = self._labels(values, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{le} {child.count}")
+                lines.append(f"{self.name}_sum{self._labels(values)} {_format(child.sum)}")
+                lines.append(f"{self.name}_count{self._labels(values)} {child.count}")
+            else:
+                try:
+                    value = child.get()
+                except Exception:
+                    continue
+                lines.append(f"{self.name}{self._labels(values)} {_format(value)}")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class Registry:
+    """Named metric families, rendered together for scraping.
+
+    Families without labels are returned as their single child, so they
+    can be used directly (``counter.inc()``, ``histogram.time()``).
+    Registering an existing name again returns the existing family.
+    """
+
+    def __init__(self):
+        self._families = {}
+
+    def _register(self, kind, name, documentation, labelnames, factory):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = MetricFamily(kind, name, documentation, labelnames, factory)
+        elif family.kind != kind or family.labelnames != tuple(labelnames):
+            raise ValueError(f"Metric {name} is already registered differently")
+        return family if labelnames else family.labels()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register("counter", name, documentation, labelnames, Counter)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register("gauge", name, documentation, labelnames, Gauge)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register("histogram", name, documentation, labelnames, lambda: Histogram(buckets))
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        for family in list(self._families.values()):
+            family.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Families shared by several modules
+queue_depth = registry.gauge("queue_depth", "Items waiting in an internal queue", ["queue"])
+cache_lookups = registry.counter("cache_lookups_total", "Cache lookups by result", ["cache", "result"])
+cache_entries = registry.gauge("cache_entries", "Entries held in a cache", ["cache"])
+
+
+def track_cache(name, cache):
+    """Export the ``hits``, ``stale_hits`` and ``misses`` counters and the size of a cache."""
+    for result, attribute in (("hit", "hits"), ("stale", "stale_hits"), ("miss", "misses")):
+        if hasattr(cache, attribute):
+            cache_lookups.labels(name, result).set_function(lambda attribute=attribute: getattr(cache, attribute))
+    cache_entries.labels(name).set_function(lambda: len(cache))
+
+
+def timed(family, label):
+    """Decorate a coroutine function to observe its duration in a histogram family.
+
+    ``label`` is the label value, or a function of the call's arguments
+    returning the label values as a tuple.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            values = label(*args, **kwargs) if callable(label) else (label,)
+            with family.labels(*values).time():
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def start_metrics_server(listen, port, metrics_registry=registry):
+    """Serve ``/metrics`` over HTTP; returns the runner to clean up on shutdown."""
+    async def handle(request):
+        return web.Response(body=metrics_registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    return runner
@@ -0,0 +1,55 @@
+"""
+Import an existing users.json into the SQLite user store.
+
+Usage:
+    python migrate_users.py [--source data/users.json] [--target data/users.db]
+"""
+import argparse
+import json
+import os
+import sys
+
+from storage import SqliteUserStore
+
+DEFAULT_SOURCE = os.path.join("data", "users.json")
+DEFAULT_TARGET = os.path.join("data", "users.db")
+
+
+def migrate(source, target, batch_size=1000):
+    """Copy every user from the JSON file into the SQLite store."""
+    with open(source, 'r') as f:
+        users = json.load(f)
+
+    store = SqliteUserStore(target)
+    try:
+        batch = {}
+        for user_id, record in users.items():
+            batch[user_id] = record
+            if len(batch) >= batch_size:
+                store.save_many(batch)
+                batch = {}
+        if batch:
+            store.save_many(batch)
+    finally:
+        store.close()
+
+    return len(users)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import users.json into the SQLite user store.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Path to the legacy users.json")
+    parser.add_argument("--target", default=DEFAULT_TARGET, help="Path to the SQLite database")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"Source file not found: {args.source}")
+        sys.exit(1)
+
+    os.makedirs(os.path.dirname(args.target) or ".", exist_ok=True)
+    count = migrate(args.source, args.target)
+    print(f"Imported {count} users into {args.target}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+"""
+Limit orders.
+
+Orders are persisted in SQLite under stable ids. Lists are read a page at a
+time with keyset pagination on (user, open/closed, created_at, id), so a
+page costs one index range scan no matter how long a user's history is.
+The active orders are also indexed in memory per
+token, in two heaps keyed by trigger price: limit buys fire when the price
+falls to their trigger and limit sells when it rises to it. Both heaps are
+ordered so that the crossed orders are on top, so placing an order costs
+O(log n) and a price tick pops the k crossed ones in O(k log n), independent
+of how many other orders rest on the book.
+
+A triggered order is EXECUTING until its swap has a receipt: it is FILLED
+only if the transaction succeeded and FAILED if it reverted. Without a
+receipt yet it stays EXECUTING and the receipt is waited for again, since
+the transaction may still be mined. Orders still waiting for a receipt when
+the bot stops are picked up again by ``resume()`` on the next start.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from itertools import count
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = "active"
+EXECUTING = "executing"
+FILLED = "filled"
+FAILED = "failed"
+CANCELLED = "cancelled"
+CLOSED_STATUSES = (FILLED, FAILED, CANCELLED)
+
+
+class SqliteOrderStore:
+    """SQLite table of orders, one JSON record per order id.
+
+    ``closed`` separates open orders (active or executing) from history so
+    each list is a single range of the ``(user_id, closed, created_at, id)``
+    index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            "id TEXT PRIMARY KEY, "
+            "user_id TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "data TEXT NOT NULL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(orders)")]
+        if "closed" not in columns:
+            self._conn.execute("ALTER TABLE orders ADD COLUMN closed INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute(
+                f"UPDATE orders SET closed = 1 WHERE status IN ({', '.join('?' * len(CLOSED_STATUSES))})",
+                CLOSED_STATUSES
+            )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS orders_by_user "
+            "ON orders (user_id, closed, created_at, id)"
+        )
+
+    def save(self, order):
+        """Insert or update an order."""
+        data = json.dumps({key: value for key, value in order.items() if key != "seq"})
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO orders (id, user_id, status, closed, created_at, data) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET status = excluded.status, closed = excluded.closed, "
+                "data = excluded.data",
+                (
+                    order["id"], order["user_id"], order["status"],
+                    int(order["status"] in CLOSED_STATUSES), order["created_at"], data
+                )
+            )
+
+    def get(self, order_id):
+        """Return an order by id, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM orders WHERE id = ?", (order_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_by_status(self, status):
+        """Return every order with a status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM orders WHERE status = ?", (status,)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def page(self, user_id, closed, limit, after=None, before=None):
+        """Return one page of a user's open or closed orders, newest first.
+
+        ``after`` / ``before`` are order ids: the page starts right after the
+        first or ends right before the second. Returns ``(orders, has_newer,
+        has_older)``.
+        """
+        params = [str(user_id), int(closed)]
+        if before is not None:
+            query = (
+                "SELECT data FROM orders WHERE user_id = ? AND closed = ? "
+                "AND (created_at, id) > (SELECT created_at, id FROM orders WHERE id = ?) "
+                "ORDER BY created_at ASC, id ASC LIMIT ?"
+            )
+            params.append(before)
+        elif after is not None:
+            query = (
+                "SELECT data FROM orders WHERE user_id = ? AND closed = ? "
+                "AND (created_at, id) < (SELECT created_at, id FROM orders WHERE id = ?) "
+                "ORDER BY created_at DESC, id DESC LIMIT ?"
+            )
+            params.append(after)
+        else:
+            query = (
+                "SELECT data FROM orders WHERE user_id = ? AND closed = ? "
+                "ORDER BY created_at DESC, id DESC LIMIT ?"
+            )
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        more = len(rows) > limit
+        orders = [json.loads(data) for data, in rows[:limit]]
+        if before is not None:
+            return orders[::-1], more, True
+        return orders, after is not None, more
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _CrossingHeap:
+    """Order ids in a max-heap by key; crossed orders are always the largest keys.
+
+    Keys are stored negated in a ``heapq`` min-heap. Removed entries are
+    skipped when they surface and dropped in one pass once they outnumber
+    the live ones.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.live = set()
+
+    def __len__(self):
+        return len(self.live)
+
+    @staticmethod
+    def _negate(key):
+        return tuple(-part for part in key)
+
+    def add(self, key, order_id):
+        key = self._negate(key)
+        self.live.add(key)
+        heapq.heappush(self.heap, (key, order_id))
+
+    def remove(self, key):
+        self.live.discard(self._negate(key))
+        if len(self.heap) > 2 * len(self.live):
+            self.heap = [entry for entry in self.heap if entry[0] in self.live]
+            heapq.heapify(self.heap)
+
+    def pop_from(self, key):
+        """Remove and return the ids of every entry with a key >= ``key``."""
+        bound = self._negate(key)
+        crossed = []
+        while self.heap and self.heap[0][0] <= bound:
+            entry, order_id = heapq.heappop(self.heap)
+            if entry in self.live:
+                self.live.remove(entry)
+                crossed.append(order_id)
+        return crossed
+
+
+class OrderBook:
+    """Active orders of one token, indexed by trigger price."""
+
+    def __init__(self):
+        # Buys fire at price <= trigger: keyed by trigger, crossed ones are the highest
+        self.buys = _CrossingHeap()
+        # Sells fire at price >= trigger: keyed by -trigger, crossed ones are the highest
+        self.sells = _CrossingHeap()
+
+    def __len__(self):
+        return len(self.buys) + len(self.sells)
+
+    @staticmethod
+    def _key(order):
+        price = order["price"] if order["type"] == "buy" else -order["price"]
+        return (price, order["seq"])
+
+    def add(self, order):
+        side = self.buys if order["type"] == "buy" else self.sells
+        side.add(self._key(order), order["id"])
+
+    def remove(self, order):
+        side = self.buys if order["type"] == "buy" else self.sells
+        side.remove(self._key(order))
+
+    def crossed(self, price):
+        """Remove and return the ids of the orders a price triggers."""
+        return self.buys.pop_from((price, -1)) + self.sells.pop_from((-price, -1))
+
+
+class OrderEngine:
+    """Place, cancel and trigger limit orders.
+
+    ``execute(order)`` performs the trade of a triggered order and returns its
+    transaction hash; ``confirm(tx_hash)`` waits for its receipt and returns
+    whether it succeeded. ``on_update(order)`` is called after every fill or
+    failure.
+    """
+
+    def __init__(self, store, execute, on_update=None, confirm=None):
+        self.store = store
+        self.execute = execute
+        self.confirm = confirm
+        self.on_update = on_update
+        self.books = {}
+        self.active = {}
+        self._seq = count()
+        self._unconfirmed = []
+        self._tasks = set()
+
+    def load(self, owns=None):
+        """Index the stored active orders; orders interrupted before broadcasting are failed.
+
+        With ``owns`` given, only orders of the users it accepts are loaded.
+        """
+        for order in self.store.load_by_status(EXECUTING):
+            if owns is not None and not owns(order["user_id"]):
+                continue
+            if order.get("tx_hash"):
+                # Sent before the restart; resume() waits for its receipt
+                self._unconfirmed.append(order)
+            else:
+                self._finish(order, FAILED, error="Interrupted by a restart")
+        for order in sorted(self.store.load_by_status(ACTIVE), key=lambda o: o["created_at"]):
+            if owns is None or owns(order["user_id"]):
+                self._index(order)
+
+    def _index(self, order):
+        order["seq"] = next(self._seq)
+        self.active[order["id"]] = order
+        self.books.setdefault(order["token"], OrderBook()).add(order)
+
+    def place(self, user_id, token, token_symbol, side, amount, price, wallet, slippage, gas_price):
+        """Create and index a limit order. ``amount`` is in MON for buys and percent for sells."""
+        now = time.time()
+        order = {
+            "id": uuid.uuid4().hex,
+            "user_id": str(user_id),
+            "token": token,
+            "token_symbol": token_symbol,
+            "type": side,
+            "amount": amount,
+            "price": price,
+            "wallet": wallet,
+            "slippage": slippage,
+            "gas_price": gas_price,
+            "status": ACTIVE,
+            "created_at": now,
+            "updated_at": now,
+            "tx_hash": None,
+            "error": None,
+        }
+        self.store.save(order)
+        self._index(order)
+        return order
+
+    def cancel(self, user_id, order_id):
+        """Cancel an active order of a user; returns False if it is no longer active."""
+        order = self.active.get(order_id)
+        if order is None or order["user_id"] != str(user_id):
+            return False
+        del self.active[order_id]
+        self._unindex(order)
+        self._finish(order, CANCELLED)
+        return True
+
+    def _unindex(self, order):
+        book = self.books.get(order["token"])
+        if book is not None:
+            book.remove(order)
+            if not len(book):
+                del self.books[order["token"]]
+
+    def tokens(self):
+        """Tokens that currently have active orders."""
+        return list(self.books)
+
+    def on_price(self, token, price):
+        """Trigger the orders a new price crosses; returns them."""
+        book = self.books.get(token)
+        if book is None:
+            return []
+        triggered = [self.active.pop(order_id) for order_id in book.crossed(price)]
+        if not len(book):
+            del self.books[token]
+        for order in triggered:
+            order["status"] = EXECUTING
+            order["trigger_price"] = price
+            self.store.save(order)
+            self._spawn(self._fill(order))
+        return triggered
+
+    def resume(self):
+        """Wait again for the receipts of orders that were sent before a restart."""
+        for order in self._unconfirmed:
+            self._spawn(self._confirm(order))
+        self._unconfirmed = []
+
+    async def close(self):
+        """Stop fills in progress; orders already sent are resumed on the next start."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fill(self, order):
+        try:
+            tx_hash = await self.execute(order)
+        except Exception as e:
+            logger.error(f"Error filling order {order['id']}: {str(e)}")
+            self._finish(order, FAILED, error=str(e))
+            return
+        order["tx_hash"] = tx_hash
+        self.store.save(order)
+        await self._confirm(order)
+
+    async def _confirm(self, order):
+        tx_hash = order["tx_hash"]
+        if self.confirm is None:
+            self._finish(order, FILLED, tx_hash=tx_hash)
+            return
+        while True:
+            try:
+                succeeded = await self.confirm(tx_hash)
+                break
+            except Exception as e:
+                # Not mined yet is not a failure: keep the order EXECUTING and wait again
+                logger.warning(f"Order {order['id']} still unconfirmed: {str(e)}")
+        if succeeded:
+            self._finish(order, FILLED, tx_hash=tx_hash)
+        else:
+            self._finish(order, FAILED, tx_hash=tx_hash, error="Transaction reverted")
+
+    def _finish(self, order, status, tx_hash=None, error=None):
+        order["status"] = status
+        order["updated_at"] = time.time()
+        order["tx_hash"] = tx_hash
+        order["error"] = error
+        order.pop("seq", None)
+        self.store.save(order)
+        if self.on_update is not None and status in (FILLED, FAILED):
+            try:
+                self.on_update(order)
+            except Exception as e:
+                logger.error(f"Error in order update callback: {str(e)}")
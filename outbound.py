@@ -0,0 +1,183 @@
+"""
+Outbound Telegram request scheduling.
+
+Every Bot API call goes through ``OutboundLimiter``, plugged into the
+application as its rate limiter. Requests addressed to a chat draw on a
+per-chat token bucket (stricter for groups) and on a global one, so the bot
+stays under Telegram's flood limits instead of collecting 429s. Requests of
+one chat are sent in order. An edit of a message that is still waiting for
+its turn is dropped when a newer edit of the same message arrives, and its
+caller gets the newer edit's result. A ``RetryAfter`` pauses the chat for
+the time Telegram asks for, with growing backoff over repeated retries.
+
+Background sends (fill alerts, receipt updates) pass
+``rate_limit_args=BACKGROUND``. They leave part of the global budget to
+interactive responses and wait while any of those are queued.
+"""
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import (
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GLOBAL_BURST,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_GROUP_RATE,
+    TELEGRAM_GROUP_BURST,
+    TELEGRAM_BACKGROUND_RESERVE,
+    TELEGRAM_MAX_RETRIES,
+    SHARD_COUNT
+)
+from metrics import queue_depth, registry
+from ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND = "background"
+
+# Edits that replace the whole state they set; a newer one makes an older one pointless
+COLLAPSIBLE = {"editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup"}
+# Requests that carry a chat_id but do not count against its send limits
+EXEMPT = {"deleteMessage", "sendChatAction"}
+
+collapsed_edits = registry.counter("telegram_edits_collapsed_total", "Edits dropped for a newer edit")
+retry_afters = registry.counter("telegram_retry_after_total", "RetryAfter responses from Telegram")
+
+
+class _ChatState:
+    __slots__ = ("lock", "users", "paused_until")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+        self.paused_until = 0.0
+
+
+class _Edit:
+    __slots__ = ("future", "newer")
+
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.newer = None
+
+
+class OutboundLimiter(BaseRateLimiter):
+    """Per-chat and global send windows with edit collapsing and RetryAfter backoff."""
+
+    def __init__(self, max_retries=TELEGRAM_MAX_RETRIES):
+        self.max_retries = max_retries
+        # The global limit is the bot token's; sharded workers split it
+        self.global_bucket = RateLimiter(
+            "telegram_global", TELEGRAM_GLOBAL_RATE / SHARD_COUNT, max(1, TELEGRAM_GLOBAL_BURST / SHARD_COUNT)
+        )
+        self.chat_buckets = RateLimiter("telegram_chat", TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST)
+        self.group_buckets = RateLimiter("telegram_group", TELEGRAM_GROUP_RATE, TELEGRAM_GROUP_BURST)
+        self._chats = {}
+        self._edits = {}
+        self.waiting = 0
+        self.waiting_interactive = 0
+
+    async def initialize(self):
+        queue_depth.labels("telegram_outbound").set_function(lambda: self.waiting)
+
+    async def shutdown(self):
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None or endpoint in EXEMPT:
+            return await callback(*args, **kwargs)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            # @channelname
+            pass
+
+        edit = None
+        key = None
+        if endpoint in COLLAPSIBLE and "message_id" in data:
+            key = (endpoint, chat_id, data["message_id"])
+            edit = _Edit()
+            previous = self._edits.get(key)
+            if previous is not None:
+                previous.newer = edit
+            self._edits[key] = edit
+
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatState()
+        state.users += 1
+        try:
+            # One chat's requests are sent in the order they were made
+            async with state.lock:
+                if edit is None or edit.newer is None:
+                    result = await self._send(
+                        chat_id, state, rate_limit_args == BACKGROUND, callback, args, kwargs
+                    )
+                    if edit is not None:
+                        edit.future.set_result(result)
+                    return result
+            collapsed_edits.inc()
+            result = await asyncio.shield(edit.newer.future)
+            edit.future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            if edit is not None:
+                edit.future.cancel()
+            raise
+        except Exception as e:
+            if edit is not None and not edit.future.done():
+                edit.future.set_exception(e)
+                # Only an older, collapsed edit would retrieve it
+                edit.future.exception()
+            raise
+        finally:
+            state.users -= 1
+            if not state.users:
+                del self._chats[chat_id]
+            if key is not None and self._edits.get(key) is edit:
+                del self._edits[key]
+
+    async def _send(self, chat_id, state, background, callback, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, state, background)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_afters.inc()
+                if attempt == self.max_retries:
+                    logger.error(f"Giving up on chat {chat_id} after {attempt} RetryAfter responses")
+                    raise
+                delay = e.retry_after * (1 + attempt / 2) + 0.1
+                logger.info(f"Flood limit for chat {chat_id}, retrying in {delay:.1f}s")
+                state.paused_until = time.monotonic() + delay
+
+    async def _acquire(self, chat_id, state, background):
+        """Wait until the chat and global windows both have room, then take it."""
+        chat_buckets = self.group_buckets if isinstance(chat_id, str) or chat_id < 0 else self.chat_buckets
+        global_cost = 1 + TELEGRAM_BACKGROUND_RESERVE / SHARD_COUNT if background else 1
+        self.waiting += 1
+        if not background:
+            self.waiting_interactive += 1
+        try:
+            while True:
+                wait = max(
+                    state.paused_until - time.monotonic(),
+                    chat_buckets.retry_after(chat_id),
+                    self.global_bucket.retry_after("global", global_cost)
+                )
+                if background and self.waiting_interactive:
+                    wait = max(wait, 1 / self.global_bucket.rate)
+                if wait <= 0:
+                    chat_buckets.allow(chat_id)
+                    self.global_bucket.allow("global")
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+            if not background:
+                self.waiting_interactive -= 1
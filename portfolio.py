@@ -0,0 +1,257 @@
+"""
+Token holdings of the bot's wallets.
+
+The tokens a wallet holds are discovered from the ERC-20 ``Transfer`` logs
+that credited it. Each wallet has a scan cursor persisted in SQLite: the
+range of blocks ``[low, high]`` whose logs have been read. A new wallet gets
+the most recent ``PORTFOLIO_SCAN_BLOCKS`` blocks scanned, together with every
+other wallet being opened; after that, each opening scans one more step of
+older history in the background, on the pollers' budget, until block 0 is
+reached. ``eth_getLogs`` ranges are sent at most ``LOG_BATCH_SIZE`` per
+request, and a step with a failed range raises without moving the cursor,
+so it is scanned again instead of being remembered as complete.
+
+The block subscriber keeps the recent end current: a transfer touching a
+wallet marks that (wallet, token) balance stale and moves ``high`` forward.
+Blocks it did not see, in a gap or while the bot was down, are scanned on
+the next opening. Opening a portfolio rereads only the stale balances, all
+in one Multicall, so while the subscriber is live and nothing moved it costs
+no RPC call at all.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+
+from eth_abi import decode, encode
+from web3 import Web3
+
+import clients
+from cache import SingleFlight
+from config import PORTFOLIO_SCAN_BLOCKS, LOG_BLOCK_RANGE, LOG_BATCH_SIZE
+from subscriber import TRANSFER_TOPIC, is_erc20_transfer
+from token_metadata import BALANCE_OF, read_contracts
+
+logger = logging.getLogger(__name__)
+
+def _address_topic(address):
+    return "0x" + "00" * 12 + address[2:].lower()
+
+
+class SqliteScanStore:
+    """SQLite table of the scanned block range and discovered tokens of each wallet."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS wallet_scans ("
+            "wallet TEXT PRIMARY KEY, "
+            "low INTEGER NOT NULL, "
+            "high INTEGER NOT NULL, "
+            "tokens TEXT NOT NULL)"
+        )
+
+    def get(self, wallet):
+        """Return ``(low, high, tokens)`` of a wallet, or None if it was never scanned."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT low, high, tokens FROM wallet_scans WHERE wallet = ?", (wallet,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def save(self, wallet, low, high, tokens):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO wallet_scans (wallet, low, high, tokens) VALUES (?, ?, ?, ?)",
+                (wallet, low, high, json.dumps(sorted(tokens)))
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class HoldingsService:
+    """Cached token balances per wallet, updated incrementally from new blocks."""
+
+    def __init__(self, index, store, scan_blocks=PORTFOLIO_SCAN_BLOCKS):
+        self.index = index
+        self.store = store
+        self.scan_blocks = scan_blocks
+        self.tracker = None
+        # wallet -> {token: balance in base units, or None while stale}
+        self._holdings = {}
+        # wallet -> [low, high], the blocks whose transfer logs were scanned
+        self._scanned = {}
+        self._flight = SingleFlight()
+        self._backfilling = set()
+        self._tasks = set()
+
+    def tokens(self):
+        """Tokens held by any tracked wallet, for the price feed."""
+        for wallet in [wallet for wallet in self._holdings if wallet not in self.index]:
+            del self._holdings[wallet]
+            self._scanned.pop(wallet, None)
+        return {
+            token
+            for balances in self._holdings.values()
+            for token, balance in balances.items()
+            if balance != 0
+        }
+
+    def on_block(self, events):
+        """Mark the balances a block range may have changed as stale."""
+        if events.gap:
+            for balances in self._holdings.values():
+                for token in balances:
+                    balances[token] = None
+            return
+        for span in self._scanned.values():
+            # Only a range right after the scanned one keeps it contiguous
+            if span[1] >= events.from_block - 1:
+                span[1] = max(span[1], events.block)
+        for wallet, token in events.token_transfers:
+            balances = self._holdings.get(Web3.to_checksum_address(wallet))
+            if balances is not None:
+                balances[Web3.to_checksum_address(token)] = None
+
+    async def get_holdings(self, wallets):
+        """Return ``{wallet: {token: balance}}`` of the non-zero token balances of wallets."""
+        wallets = [Web3.to_checksum_address(wallet) for wallet in wallets]
+        live = self.tracker is not None and self.tracker.live
+        behind = [
+            wallet for wallet in wallets
+            if wallet not in self._scanned or not live or self._scanned[wallet][1] < self.tracker.last_block
+        ]
+        if behind:
+            key = tuple(sorted(behind))
+            await self._flight.do(key, lambda: self._catch_up(key))
+
+        older = [
+            wallet for wallet in wallets
+            if self._scanned.get(wallet, (0,))[0] > 0 and wallet not in self._backfilling
+        ]
+        if older:
+            self._backfilling.update(older)
+            task = clients.background_task(self._backfill(older))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: self._backfilling.difference_update(older))
+
+        stale = [
+            (wallet, token)
+            for wallet in wallets
+            for token, balance in self._holdings.get(wallet, {}).items()
+            if balance is None or not live
+        ]
+        if stale:
+            results = await read_contracts([
+                (token, "0x" + (BALANCE_OF + encode(["address"], [wallet])).hex())
+                for wallet, token in stale
+            ])
+            for (wallet, token), raw in zip(stale, results):
+                if wallet in self._holdings:
+                    self._holdings[wallet][token] = decode(["uint256"], raw)[0] if raw else 0
+
+        return {
+            wallet: {token: balance for token, balance in self._holdings.get(wallet, {}).items() if balance}
+            for wallet in wallets
+        }
+
+    async def close(self):
+        """Stop background scans; their cursors are where the last finished step left them."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _catch_up(self, wallets):
+        """Scan the wallets' transfer logs from where each one stopped up to the head."""
+        head = int(await clients.rpc_call("eth_blockNumber", []), 16)
+        cursors = {}
+        for wallet in wallets:
+            if wallet in self._scanned:
+                low, high = self._scanned[wallet]
+                cursors[wallet] = (low, high + 1, set(self._holdings.get(wallet, {})))
+                continue
+            record = self.store.get(wallet)
+            if record is None:
+                start = max(0, head - self.scan_blocks + 1)
+                cursors[wallet] = (start, start, set())
+            else:
+                low, high, tokens = record
+                cursors[wallet] = (low, high + 1, set(tokens))
+
+        # Wallets opened together usually stopped at the same block and share the calls
+        by_start = {}
+        for wallet, (_, start, _) in cursors.items():
+            by_start.setdefault(start, []).append(wallet)
+        found = {}
+        for start, group in by_start.items():
+            if start <= head:
+                found.update(await self._scan(group, start, head))
+
+        for wallet, (low, _, tokens) in cursors.items():
+            balances = self._holdings.setdefault(wallet, {})
+            for token in tokens | found.get(wallet, set()):
+                balances.setdefault(token, None)
+            span = self._scanned.setdefault(wallet, [low, head])
+            span[1] = max(span[1], head)
+            self.store.save(wallet, span[0], span[1], balances)
+
+    async def _backfill(self, wallets):
+        """Scan one more step of older history below the wallets' cursors."""
+        try:
+            by_low = {}
+            for wallet in wallets:
+                by_low.setdefault(self._scanned[wallet][0], []).append(wallet)
+            for low, group in by_low.items():
+                start = max(0, low - self.scan_blocks)
+                found = await self._scan(group, start, low - 1)
+                for wallet in group:
+                    span = self._scanned.get(wallet)
+                    if span is None:
+                        # No longer tracked
+                        continue
+                    balances = self._holdings[wallet]
+                    for token in found[wallet]:
+                        balances.setdefault(token, None)
+                    span[0] = min(span[0], start)
+                    self.store.save(wallet, span[0], span[1], balances)
+        except Exception as e:
+            logger.error(f"Error scanning older transfer logs: {str(e)}")
+
+    async def _scan(self, wallets, start, end):
+        """Return the tokens that credited each wallet in blocks ``start``..``end``.
+
+        Raises the error of the first range that failed.
+        """
+        topics = [TRANSFER_TOPIC, None, [_address_topic(wallet) for wallet in wallets]]
+        calls = [
+            ("eth_getLogs", [{
+                "fromBlock": hex(block),
+                "toBlock": hex(min(end, block + LOG_BLOCK_RANGE - 1)),
+                "topics": topics
+            }])
+            for block in range(start, end + 1, LOG_BLOCK_RANGE)
+        ]
+
+        owners = {_address_topic(wallet): wallet for wallet in wallets}
+        found = {wallet: set() for wallet in wallets}
+        for i in range(0, len(calls), LOG_BATCH_SIZE):
+            for result in await clients.rpc_batch(calls[i:i + LOG_BATCH_SIZE]):
+                if isinstance(result, clients.RPCError):
+                    raise result
+                for log in result:
+                    if not is_erc20_transfer(log):
+                        continue
+                    wallet = owners.get(log["topics"][2].lower())
+                    if wallet is not None:
+                        found[wallet].add(Web3.to_checksum_address(log["address"]))
+        return found
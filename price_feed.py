@@ -0,0 +1,315 @@
+"""
+Shared in-process price feed.
+
+One background loop prices the union of tokens anybody currently cares
+about: tokens viewed recently, plus whatever the registered sources report
+(tokens with open limit orders, held tokens). Each token is fetched once per
+interval however many users watch it, and every sample is appended to a
+fixed-size, array-backed series that charts and portfolio views read
+without network I/O. Kuru offers no streaming endpoint for prices, so the
+feed polls. When its share of the outbound budget is spent it skips rounds,
+waiting twice as long after each one, until a round fits again.
+
+Sharded workers share one feed through ``SqlitePriceExchange``: each token
+is polled by exactly one worker, for all of them, and the others record the
+samples it publishes.
+
+A sample older than a few poll intervals no longer counts as the current
+price, and a series is dropped once its token has been out of interest for
+longer than the history it holds.
+"""
+import asyncio
+import bisect
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+
+from config import (
+    PRICE_FEED_INTERVAL,
+    PRICE_FEED_MAX_BACKOFF,
+    PRICE_HISTORY_SIZE,
+    PRICE_VIEW_TTL,
+    PRICE_SHARE_TTL,
+    PRICE_STALE_INTERVALS
+)
+from ratelimit import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class PriceSeries:
+    """Ring buffer of (unix time, price) samples stored in two ``array('d')``.
+
+    The arrays grow with the samples until ``capacity`` and are then reused
+    in place, so a briefly watched token costs only the samples it has.
+    """
+
+    def __init__(self, capacity=PRICE_HISTORY_SIZE):
+        self.capacity = capacity
+        self.times = array('d')
+        self.prices = array('d')
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, timestamp, price):
+        if self.size < self.capacity:
+            self.times.append(timestamp)
+            self.prices.append(price)
+            self.size += 1
+        else:
+            self.times[self.start] = timestamp
+            self.prices[self.start] = price
+            self.start = (self.start + 1) % self.capacity
+
+    def latest(self):
+        """Return the newest ``(time, price)``, or None."""
+        if not self.size:
+            return None
+        end = (self.start + self.size - 1) % self.capacity
+        return self.times[end], self.prices[end]
+
+    def window(self, since=0.0):
+        """Return ``(times, prices)`` arrays of the samples taken at or after ``since``, oldest first."""
+        end = self.start + self.size
+        if end <= self.capacity:
+            times, prices = self.times[self.start:end], self.prices[self.start:end]
+        else:
+            end -= self.capacity
+            times = self.times[self.start:] + self.times[:end]
+            prices = self.prices[self.start:] + self.prices[:end]
+        if since and times and times[0] < since:
+            i = bisect.bisect_left(times, since)
+            times, prices = times[i:], prices[i:]
+        return times, prices
+
+
+class SqlitePriceExchange:
+    """Token interest and latest prices shared by sharded workers in SQLite.
+
+    Every round a worker renews its interest in the tokens it wants priced.
+    Token ``int(token, 16) % shards`` is polled by that shard alone, for
+    every worker still interested in it, which publishes what it fetched.
+    """
+
+    def __init__(self, path, shard, shards, ttl=PRICE_SHARE_TTL):
+        self.path = path
+        self.shard = shard
+        self.shards = shards
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS price_interest ("
+            "token TEXT NOT NULL, "
+            "shard INTEGER NOT NULL, "
+            "expires REAL NOT NULL, "
+            "PRIMARY KEY (token, shard))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS prices ("
+            "token TEXT PRIMARY KEY, "
+            "price REAL NOT NULL, "
+            "at REAL NOT NULL)"
+        )
+
+    def owns(self, token):
+        return int(token, 16) % self.shards == self.shard
+
+    def exchange(self, tokens):
+        """Renew this worker's interest in tokens; return the tokens it polls for everyone."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM price_interest WHERE expires < ?", (now,))
+                self._conn.executemany(
+                    "INSERT INTO price_interest (token, shard, expires) VALUES (?, ?, ?) "
+                    "ON CONFLICT(token, shard) DO UPDATE SET expires = excluded.expires",
+                    [(token.lower(), self.shard, now + self.ttl) for token in tokens]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            rows = self._conn.execute("SELECT DISTINCT token FROM price_interest").fetchall()
+        local = {token.lower(): token for token in tokens}
+        return {local.get(token, token) for token, in rows if self.owns(token)}
+
+    def publish(self, prices):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO prices (token, price, at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(token) DO UPDATE SET price = excluded.price, at = excluded.at",
+                    [(token.lower(), price, now) for token, price in prices.items()]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def read(self, tokens):
+        """Return ``{token: (price, unix time)}`` of the published prices of tokens."""
+        local = {token.lower(): token for token in tokens}
+        if not local:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT token, price, at FROM prices WHERE token IN ({', '.join('?' * len(local))})",
+                list(local)
+            ).fetchall()
+        return {local[token]: (price, at) for token, price, at in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PriceFeed:
+    """Poll prices for the tokens of interest and keep their recent history."""
+
+    def __init__(self, fetch_prices, interval=PRICE_FEED_INTERVAL, view_ttl=PRICE_VIEW_TTL,
+                 max_backoff=PRICE_FEED_MAX_BACKOFF, exchange=None):
+        self.fetch_prices = fetch_prices
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.exchange = exchange
+        # token -> time of the last sample read from the exchange
+        self._shared_at = {}
+        self.view_ttl = view_ttl
+        self.stale_after = interval * PRICE_STALE_INTERVALS
+        self.retention = interval * PRICE_HISTORY_SIZE
+        self.series = {}
+        # token -> monotonic time it was last of interest
+        self._wanted = {}
+        self._viewed = {}
+        self._sources = []
+        self._listeners = []
+
+    def watch(self, token):
+        """Keep a token priced for ``view_ttl`` seconds, e.g. after its card was shown."""
+        self._viewed[token] = time.monotonic() + self.view_ttl
+
+    def add_source(self, tokens):
+        """Register ``tokens()`` returning more tokens to price on every round."""
+        self._sources.append(tokens)
+
+    def subscribe(self, listener):
+        """Register ``listener(token, price)``, called for every new sample."""
+        self._listeners.append(listener)
+
+    def interest(self):
+        """Return the set of tokens to price this round."""
+        now = time.monotonic()
+        for token in [token for token, expires in self._viewed.items() if expires < now]:
+            del self._viewed[token]
+        tokens = set(self._viewed)
+        for source in self._sources:
+            try:
+                tokens.update(source())
+            except Exception as e:
+                logger.error(f"Error reading price feed source: {str(e)}")
+        return tokens
+
+    def price(self, token):
+        """Return the latest price of a token, or None if it is unknown or stale."""
+        series = self.series.get(token)
+        latest = series.latest() if series is not None else None
+        if not latest or latest[0] < time.time() - self.stale_after:
+            return None
+        return latest[1]
+
+    def history(self, token, since=0.0):
+        """Return ``(times, prices)`` recorded for a token since a unix time."""
+        series = self.series.get(token)
+        if series is None:
+            return array('d'), array('d')
+        return series.window(since)
+
+    async def prices(self, tokens):
+        """Return ``{token: price}`` for tokens, fetching only those without a fresh sample."""
+        prices = {}
+        missing = []
+        for token in tokens:
+            price = self.price(token)
+            if price is None:
+                missing.append(token)
+            else:
+                prices[token] = price
+        if missing:
+            fetched = await self.fetch_prices(missing)
+            self._record(fetched)
+            prices.update(fetched)
+        return prices
+
+    async def poll(self):
+        """Price every token of interest once."""
+        tokens = self.interest()
+        self._evict(tokens)
+        polled = tokens
+        if self.exchange is not None:
+            polled = self.exchange.exchange(tokens)
+            self._read_shared(tokens - polled)
+        if not polled:
+            return
+        prices = await self.fetch_prices(list(polled))
+        # Tokens polled only for other workers are published, not kept
+        self._record({token: price for token, price in prices.items() if token in tokens})
+        if self.exchange is not None:
+            self.exchange.publish(prices)
+
+    def _evict(self, tokens):
+        now = time.monotonic()
+        for token in tokens:
+            self._wanted[token] = now
+        for token in [token for token, at in self._wanted.items() if now - at > self.retention]:
+            del self._wanted[token]
+            self.series.pop(token, None)
+
+    def _read_shared(self, tokens):
+        prices = {}
+        times = {}
+        for token, (price, at) in self.exchange.read(tokens).items():
+            if at > self._shared_at.get(token, 0.0):
+                prices[token] = price
+                times[token] = at
+        self._shared_at = {token: self._shared_at[token] for token in tokens if token in self._shared_at}
+        self._shared_at.update(times)
+        self._record(prices, times)
+
+    def _record(self, prices, times=None):
+        now = time.time()
+        for token, price in prices.items():
+            series = self.series.get(token)
+            if series is None:
+                series = self.series[token] = PriceSeries()
+                self._wanted.setdefault(token, time.monotonic())
+            series.append(times[token] if times else now, price)
+            for listener in self._listeners:
+                try:
+                    listener(token, price)
+                except Exception as e:
+                    logger.error(f"Price listener error: {str(e)}")
+
+    async def run(self):
+        """Poll on a fixed interval until cancelled, backing off while out of budget."""
+        delay = self.interval
+        while True:
+            started = time.monotonic()
+            try:
+                await self.poll()
+                delay = self.interval
+            except RateLimitExceeded:
+                delay = min(delay * 2, self.max_backoff)
+                logger.warning(f"Price feed out of budget; next round in {delay:g}s")
+            except Exception as e:
+                logger.error(f"Error polling prices: {str(e)}")
+            await asyncio.sleep(max(0.0, delay - (time.monotonic() - started)))
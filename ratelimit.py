@@ -0,0 +1,85 @@
+"""
+Token-bucket rate limiting.
+
+Each key (a user id, or a shared name such as ``"rpc"``) owns a bucket of
+``capacity`` tokens refilled continuously at ``rate`` tokens per second.
+Buckets are refilled lazily when they are checked, so a check is O(1) with
+no timers, and only keys seen recently hold memory: buckets live in an
+ordered dict sorted by last use, and those idle long enough to have refilled
+completely are dropped from its front as new checks come in.
+"""
+import logging
+import time
+from collections import OrderedDict
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+rate_limited = registry.counter("rate_limited_total", "Requests rejected by a rate limit", ["limit"])
+
+
+class RateLimitExceeded(Exception):
+    """A request was shed because its rate limit is exhausted."""
+
+
+class RateLimiter:
+    """Token buckets keyed by caller."""
+
+    def __init__(self, name, rate, capacity):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        # key -> [tokens, last refill, rejections since the last allowed request]
+        self._buckets = OrderedDict()
+        self._rejected = rate_limited.labels(name)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.capacity, now, 0]
+        else:
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def allow(self, key, cost=1):
+        """Take ``cost`` tokens from a key's bucket; returns False if there are not enough."""
+        now = time.monotonic()
+        self._evict(now)
+        bucket = self._bucket(key, now)
+        # A request larger than the bucket is let through whenever the bucket is full
+        cost = min(cost, self.capacity)
+        if bucket[0] < cost:
+            bucket[2] += 1
+            self._rejected.inc()
+            return False
+        bucket[0] -= cost
+        bucket[2] = 0
+        return True
+
+    def rejections(self, key):
+        """Return how many requests of a key were rejected in a row."""
+        bucket = self._buckets.get(key)
+        return bucket[2] if bucket is not None else 0
+
+    def retry_after(self, key, cost=1):
+        """Seconds until a key's bucket holds ``cost`` tokens again."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0.0
+        tokens = min(self.capacity, bucket[0] + (time.monotonic() - bucket[1]) * self.rate)
+        return max(0.0, (min(cost, self.capacity) - tokens) / self.rate)
+
+    def _evict(self, now):
+        idle = self.capacity / self.rate
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < idle:
+                break
+            # A bucket that would be full again is the same as no bucket
+            del self._buckets[key]
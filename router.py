@@ -0,0 +1,66 @@
+"""
+Table-driven dispatch of inline keyboard callbacks.
+
+Routes are registered either for an exact ``callback_data`` value or for a
+``prefix_`` followed by one parameter, which is parsed once by the route's
+converter. Exact keys always win, and among prefixes the longest one that
+ends at an underscore wins, so ``cancel_orders`` and ``cancel_page_1`` are
+never shadowed by ``cancel_``.
+"""
+import logging
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackRouter:
+    """Dispatch callback queries to handlers in O(1) per underscore of the key."""
+
+    def __init__(self):
+        self._exact = {}
+        self._prefixes = {}
+        self.latency = registry.histogram("callback_latency_seconds", "Callback handler latency", ["route"])
+
+    def exact(self, key, handler):
+        """Route ``callback_data == key`` to ``handler(update, context)``."""
+        self._exact[key] = handler
+
+    def prefix(self, prefix, handler, param=int):
+        """Route ``prefix + value`` to ``handler(update, context, param(value))``."""
+        if not prefix.endswith("_"):
+            raise ValueError(f"Callback prefix must end with '_': {prefix}")
+        self._prefixes[prefix] = (handler, param)
+
+    def resolve(self, data):
+        """Return ``(route, handler, args)`` for callback data, or None."""
+        handler = self._exact.get(data)
+        if handler is not None:
+            return data, handler, ()
+
+        end = data.rfind("_")
+        while end != -1:
+            route = data[:end + 1]
+            entry = self._prefixes.get(route)
+            if entry is not None:
+                handler, param = entry
+                try:
+                    return route, handler, (param(data[end + 1:]),)
+                except ValueError:
+                    logger.error(f"Invalid parameter in callback data: {data}")
+                    return None
+            end = data.rfind("_", 0, end)
+        return None
+
+    async def dispatch(self, update, context):
+        """Run the handler for the update's callback data and time it."""
+        resolved = self.resolve(update.callback_query.data or "")
+        if resolved is None:
+            return
+        route, handler, args = resolved
+        with self.latency.labels(route).time():
+            await handler(update, context, *args)
+
+    def stats(self):
+        """Return latency statistics (seconds) per route."""
+        return {route: histogram.snapshot() for (route,), histogram in self.latency.children.items()}
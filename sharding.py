@@ -0,0 +1,225 @@
+"""
+Sharded multi-process mode.
+
+A front process (``python sharding.py``) is the only one that takes updates
+from Telegram, by long polling or webhook as set by ``BOT_MODE``. It does not
+parse them beyond finding their user, and forwards each one to worker
+``user id % SHARD_COUNT``. Each worker is a full ``bot.py`` started with its
+``SHARD_INDEX``. It serves only the users of its shard, with their wallets,
+limit orders and conversation state, so one user's updates are always handled
+by the same worker and in order. Updates for a worker are queued in the front
+and posted to it in batches, one request at a time; when the worker is down
+or full they wait in the queue, which in turn pauses polling or makes
+Telegram retry its webhook deliveries.
+"""
+import asyncio
+import hmac
+import logging
+
+import aiohttp
+from aiohttp import web
+from telegram import Bot, Update
+from telegram.error import TelegramError
+
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_ENQUEUE_TIMEOUT,
+    WEBHOOK_MAX_CONNECTIONS,
+    SHARD_COUNT,
+    SHARD_WORKER_URLS,
+    SHARD_SECRET,
+    SHARD_QUEUE_SIZE,
+    SHARD_BATCH_SIZE,
+    SHARD_RETRY_DELAY
+)
+from webhook import SECRET_HEADER, stop_on_signals
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30  # seconds a getUpdates call waits for new updates
+DRAIN_TIMEOUT = 10  # seconds to keep forwarding queued updates on shutdown
+
+
+def shard_for(user_id, shards=SHARD_COUNT):
+    """Return the shard that serves a user."""
+    return int(user_id) % shards
+
+
+def update_user_id(data):
+    """Return the id of the user an update is from, like ``Update.effective_user``."""
+    for value in data.values():
+        if isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            if user:
+                return user["id"]
+            # Channel posts and anonymous admins have no user
+            chat = value.get("chat")
+            if chat:
+                return chat["id"]
+    return data.get("update_id", 0)
+
+
+class Forwarder:
+    """Post one worker its updates in order, in batches."""
+
+    def __init__(self, url, session, secret_token=SHARD_SECRET, queue_size=SHARD_QUEUE_SIZE):
+        self.url = url
+        self.session = session
+        self.secret_token = secret_token
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    async def run(self):
+        batch = []
+        while True:
+            if not batch:
+                batch.append(await self.queue.get())
+            while len(batch) < SHARD_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            accepted = await self._post(batch)
+            for _ in range(accepted):
+                self.queue.task_done()
+            # Whatever the worker did not take goes first in the next request
+            del batch[:accepted]
+            if batch:
+                await asyncio.sleep(SHARD_RETRY_DELAY)
+
+    async def _post(self, batch):
+        """Return how many updates from the start of the batch the worker queued."""
+        headers = {SECRET_HEADER: self.secret_token}
+        try:
+            async with self.session.post(self.url, json=batch, headers=headers) as response:
+                if response.status in (200, 503):
+                    return (await response.json())["accepted"]
+                logger.error(f"Worker {self.url} answered {response.status}")
+        except Exception as e:
+            logger.error(f"Error forwarding updates to {self.url}: {str(e)}")
+        return 0
+
+
+class Front:
+    """Take updates from Telegram and hand each to the forwarder of its shard."""
+
+    def __init__(self, bot, session, worker_urls=SHARD_WORKER_URLS):
+        self.bot = bot
+        self.forwarders = [Forwarder(url, session) for url in worker_urls]
+        self._runner = None
+
+    def forwarder(self, data):
+        return self.forwarders[shard_for(update_user_id(data), len(self.forwarders))]
+
+    async def poll(self, stop_event):
+        """Long-poll getUpdates until ``stop_event`` is set."""
+        await self.bot.delete_webhook()
+        offset = None
+        stopped = asyncio.create_task(stop_event.wait())
+        while not stop_event.is_set():
+            poll = asyncio.create_task(self.bot.get_updates(
+                offset=offset, timeout=POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES
+            ))
+            await asyncio.wait([poll, stopped], return_when=asyncio.FIRST_COMPLETED)
+            if not poll.done():
+                # Updates it may still return are not confirmed and come again
+                poll.cancel()
+                break
+            try:
+                updates = poll.result()
+            except TelegramError as e:
+                logger.error(f"Error getting updates: {str(e)}")
+                await asyncio.sleep(SHARD_RETRY_DELAY)
+                continue
+            for update in updates:
+                data = update.to_dict()
+                # Blocks while the worker is backed up, which pauses polling
+                await self.forwarder(data).queue.put(data)
+                offset = update.update_id + 1
+        if offset is not None:
+            # Confirm the forwarded updates so Telegram does not send them again
+            await self.bot.get_updates(offset=offset, timeout=0)
+
+    async def start_webhook(self):
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+        await self.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        logger.info(f"Front listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    async def stop_webhook(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request):
+        received = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received, WEBHOOK_SECRET):
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        try:
+            await asyncio.wait_for(self.forwarder(data).queue.put(data), WEBHOOK_ENQUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return web.Response(status=503)
+        return web.Response()
+
+
+async def run_front():
+    """Run the front process until SIGINT/SIGTERM."""
+    stop_event = asyncio.Event()
+    stop_on_signals(stop_event)
+
+    async with Bot(TELEGRAM_BOT_TOKEN) as bot, aiohttp.ClientSession() as session:
+        front = Front(bot, session)
+        tasks = [
+            asyncio.create_task(forwarder.run(), name=f"forward-{i}")
+            for i, forwarder in enumerate(front.forwarders)
+        ]
+        logger.info(f"Forwarding updates to {len(front.forwarders)} workers")
+        try:
+            if BOT_MODE == 'webhook':
+                await front.start_webhook()
+                await stop_event.wait()
+                await front.stop_webhook()
+            else:
+                await front.poll(stop_event)
+            # Hand over everything already taken from Telegram before exiting
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(forwarder.queue.join() for forwarder in front.forwarders)),
+                    DRAIN_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                pending = sum(forwarder.queue.qsize() for forwarder in front.forwarders)
+                logger.error(f"Dropping {pending} updates no worker accepted before shutdown")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if SHARD_COUNT < 2 or not SHARD_WORKER_URLS:
+        raise ValueError("The front needs SHARD_COUNT > 1 and SHARD_WORKER_URLS")
+    asyncio.run(run_front())
+
+
+if __name__ == '__main__':
+    main()
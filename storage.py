@@ -0,0 +1,364 @@
+"""
+User storage backends for the bot.
+
+Users are kept in memory as a dict keyed by Telegram id; the backend only
+persists the records that actually changed. Conversation state
+(``context.user_data``) is persisted separately by ``SqliteStatePersistence``.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+class UserStore:
+    """Interface every user storage backend implements."""
+
+    def load_all(self):
+        """Return every stored user as a dict keyed by Telegram id."""
+        raise NotImplementedError
+
+    def save(self, user_id, record):
+        """Persist a single user record."""
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        """Remove a single user record."""
+        raise NotImplementedError
+
+    def save_many(self, records):
+        """Persist several user records."""
+        for user_id, record in records.items():
+            self.save(user_id, record)
+
+    def delete_many(self, user_ids):
+        """Remove several user records."""
+        for user_id in user_ids:
+            self.delete(user_id)
+
+    def flush(self):
+        """Write any buffered changes to disk."""
+
+    def close(self):
+        """Release any resources held by the backend."""
+
+
+class JsonUserStore(UserStore):
+    """Legacy backend that rewrites the whole users.json file on every save.
+
+    The file is replaced atomically so a crash mid-write never truncates it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._users = None
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        if self._users is None:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self._users = json.load(f)
+            else:
+                self._users = {}
+        return dict(self._users)
+
+    def save(self, user_id, record):
+        self.save_many({user_id: record})
+
+    def save_many(self, records):
+        with self._lock:
+            self.load_all()
+            for user_id, record in records.items():
+                self._users[str(user_id)] = record
+            self._dump()
+
+    def delete(self, user_id):
+        self.delete_many([user_id])
+
+    def delete_many(self, user_ids):
+        with self._lock:
+            self.load_all()
+            for user_id in user_ids:
+                self._users.pop(str(user_id), None)
+            self._dump()
+
+    def _dump(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".users-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._users, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+class SqliteUserStore(UserStore):
+    """SQLite backend in WAL mode storing one row per user, keyed by Telegram id."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "user_id TEXT PRIMARY KEY, "
+            "data TEXT NOT NULL)"
+        )
+
+    def load_all(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM users").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def get(self, user_id):
+        """Return a single user record, or None if it does not exist."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM users WHERE user_id = ?", (str(user_id),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, user_id, record):
+        self.save_many({user_id: record})
+
+    def save_many(self, records):
+        """Upsert several user records in one transaction."""
+        rows = [(str(user_id), json.dumps(record)) for user_id, record in records.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO users (user_id, data) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, user_id):
+        self.delete_many([user_id])
+
+    def delete_many(self, user_ids):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM users WHERE user_id = ?",
+                [(str(user_id),) for user_id in user_ids]
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BatchedUserStore(UserStore):
+    """Write-behind wrapper that group-commits changes from many handlers.
+
+    Handlers only snapshot the changed record in memory; a background thread
+    commits everything that changed every ``flush_interval`` seconds in a
+    single write to the wrapped backend. Call ``close()`` on shutdown to
+    flush whatever is still pending.
+    """
+
+    _DELETED = object()
+
+    def __init__(self, backend, flush_interval=0.05):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="user-store-flush", daemon=True)
+        self._thread.start()
+
+    def load_all(self):
+        self.flush()
+        return self.backend.load_all()
+
+    def save(self, user_id, record):
+        # Snapshot now so later in-place edits by handlers don't race the flush
+        snapshot = json.dumps(record)
+        with self._lock:
+            self._pending[str(user_id)] = snapshot
+        self._wakeup.set()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._pending[str(user_id)] = self._DELETED
+        self._wakeup.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            records = {}
+            deleted = []
+            for user_id, snapshot in pending.items():
+                if snapshot is self._DELETED:
+                    deleted.append(user_id)
+                else:
+                    records[user_id] = json.loads(snapshot)
+
+            try:
+                if records:
+                    self.backend.save_many(records)
+                if deleted:
+                    self.backend.delete_many(deleted)
+            except Exception:
+                # Put the batch back unless a newer change superseded it
+                with self._lock:
+                    for user_id, snapshot in pending.items():
+                        self._pending.setdefault(user_id, snapshot)
+                raise
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._closed:
+                break
+            # Let more changes accumulate so they share one commit
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing user store: {str(e)}")
+                self._wakeup.set()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        self.backend.close()
+
+
+class SqliteStatePersistence(BasePersistence):
+    """Keep ``context.user_data`` in SQLite, one JSON row per user.
+
+    Only user data is stored. ``owns(user_id)`` limits loading to the users
+    this process serves; they are loaded once at startup and this process is
+    their only writer while it runs, so nothing is re-read per update.
+    """
+
+    def __init__(self, path, owns=None, update_interval=60):
+        super().__init__(
+            PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval
+        )
+        self.path = path
+        self.owns = owns
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Losing the last second of a conversation to a power cut is acceptable
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_state ("
+            "user_id INTEGER PRIMARY KEY, "
+            "data TEXT NOT NULL)"
+        )
+
+    async def get_user_data(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM user_state").fetchall()
+        return {
+            user_id: json.loads(data)
+            for user_id, data in rows
+            if self.owns is None or self.owns(user_id)
+        }
+
+    async def update_user_data(self, user_id, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO user_state (user_id, data) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                (user_id, json.dumps(data))
+            )
+
+    async def drop_user_data(self, user_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM user_state WHERE user_id = ?", (user_id,))
+
+    async def refresh_user_data(self, user_id, user_data):
+        # The in-memory copy is never older than the stored one
+        pass
+
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def flush(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_user_store(backend, users_file, users_db_file, flush_interval=None):
+    """Create the configured user storage backend.
+
+    When ``flush_interval`` is given, writes are group-committed in the
+    background every ``flush_interval`` seconds.
+    """
+    if backend == 'json':
+        store = JsonUserStore(users_file)
+    elif backend == 'sqlite':
+        store = SqliteUserStore(users_db_file)
+        # Import the legacy JSON file the first time the database is used
+        if os.path.exists(users_file) and not store.load_all():
+            with open(users_file, 'r') as f:
+                store.save_many(json.load(f))
+    else:
+        raise ValueError(f"Unknown user store backend: {backend}")
+
+    if flush_interval is not None:
+        return BatchedUserStore(store, flush_interval)
+    return store
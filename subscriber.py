@@ -0,0 +1,444 @@
+"""
+Block subscriber driving cache invalidation.
+
+Follows new heads over the RPC websocket (``eth_subscribe newHeads``) when
+MONAD_WS_URL is configured, falling back to ``eth_blockNumber`` polling.
+For every new block it reads the ERC-20 ``Transfer`` logs and the block's
+transactions in one JSON-RPC batch, matches them against an in-memory
+index of the bot's wallet addresses and hands the affected addresses and
+tokens to the registered listeners. Matching costs one dict lookup per
+log or transaction, independent of the number of users.
+
+Sharded workers follow the chain only once. Shard 0 runs the subscriber
+over the addresses of every shard, listed in ``SqliteBlockStore``, and
+stores each processed range with the events of each shard; every worker
+reads back its own through a ``BlockRelay``, which its listeners use
+exactly like a local subscriber.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import clients
+from config import (
+    MONAD_WS_URL,
+    BLOCK_POLL_INTERVAL,
+    MAX_BLOCK_RANGE,
+    BLOCK_STALL_TIMEOUT,
+    BLOCK_RELAY_POLL_INTERVAL,
+    BLOCK_RELAY_RETENTION
+)
+from ratelimit import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+
+def _topic_to_address(topic):
+    return "0x" + topic[-40:].lower()
+
+
+def is_erc20_transfer(log):
+    """Whether a ``Transfer`` log is an ERC-20 one.
+
+    ERC-721 transfers share the topic but index the token id too.
+    """
+    return len(log.get("topics", [])) == 3
+
+
+class AddressIndex:
+    """Map of wallet address to the ids of the users owning it."""
+
+    def __init__(self):
+        self._owners = {}
+        self._addresses = {}
+
+    def __contains__(self, address):
+        return address.lower() in self._owners
+
+    def __len__(self):
+        return len(self._owners)
+
+    def owners(self, address):
+        return self._owners.get(address.lower(), set())
+
+    def set_user(self, user_id, addresses):
+        """Replace the addresses indexed for a user."""
+        new = {address.lower() for address in addresses}
+        old = self._addresses.get(user_id, set())
+        for address in old - new:
+            owners = self._owners.get(address)
+            if owners is not None:
+                owners.discard(user_id)
+                if not owners:
+                    del self._owners[address]
+        for address in new - old:
+            self._owners.setdefault(address, set()).add(user_id)
+        if new:
+            self._addresses[user_id] = new
+        else:
+            self._addresses.pop(user_id, None)
+
+
+class BlockEvents:
+    """What changed in a range of blocks for addresses the bot tracks."""
+
+    def __init__(self, block, gap=False, from_block=None):
+        self.block = block
+        self.from_block = block if from_block is None else from_block  # first block of the range
+        self.gap = gap  # blocks were skipped; every cached balance may be stale
+        self.native = set()  # tracked addresses whose native balance may have changed
+        self.token_transfers = set()  # (tracked address, token) pairs with a transfer
+
+
+class BlockSubscriber:
+    """Follow the chain head and notify listeners about affected addresses."""
+
+    def __init__(self, index):
+        self.index = index
+        self.listeners = []
+        self.last_block = None
+        self.last_block_at = 0.0
+
+    @property
+    def live(self):
+        """True while blocks are being processed on time."""
+        return time.monotonic() - self.last_block_at < BLOCK_STALL_TIMEOUT
+
+    def subscribe(self, listener):
+        """Register ``listener(events)``, called for every processed block range."""
+        self.listeners.append(listener)
+
+    async def run(self):
+        """Follow new heads until cancelled."""
+        while True:
+            try:
+                if MONAD_WS_URL:
+                    await self._follow_websocket()
+                else:
+                    await self._follow_polling()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Block subscriber error: {str(e)}")
+                if MONAD_WS_URL:
+                    # Keep up by polling until the websocket can be reopened
+                    try:
+                        await asyncio.wait_for(self._follow_polling(), BLOCK_STALL_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        pass
+                    except Exception as e:
+                        logger.error(f"Block polling error: {str(e)}")
+                await asyncio.sleep(BLOCK_POLL_INTERVAL)
+
+    async def _follow_websocket(self):
+        async with clients.get_session().ws_connect(MONAD_WS_URL, heartbeat=30) as ws:
+            await ws.send_json({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]})
+            async for message in ws:
+                data = json.loads(message.data)
+                head = data.get("params", {}).get("result", {}).get("number")
+                if head:
+                    try:
+                        await self._advance(int(head, 16))
+                    except RateLimitExceeded:
+                        # The next head replays this one's blocks
+                        continue
+            raise ConnectionError("Websocket closed")
+
+    async def _follow_polling(self):
+        while True:
+            try:
+                head = int(await clients.rpc_call("eth_blockNumber", []), 16)
+                await self._advance(head)
+            except RateLimitExceeded:
+                # Out of budget: wait a round, the next poll replays the skipped blocks
+                pass
+            await asyncio.sleep(BLOCK_POLL_INTERVAL)
+
+    async def _advance(self, head):
+        if self.last_block is None:
+            self.last_block = head - 1
+        if head <= self.last_block:
+            self.last_block_at = time.monotonic()
+            return
+
+        from_block = self.last_block + 1
+        if head - from_block + 1 > MAX_BLOCK_RANGE:
+            # Too far behind to replay; listeners must drop everything
+            logger.error(f"Skipped blocks {from_block}-{head - MAX_BLOCK_RANGE}")
+            self._notify(BlockEvents(head, gap=True))
+            from_block = head - MAX_BLOCK_RANGE + 1
+
+        self._notify(await self._read_range(from_block, head))
+        self.last_block = head
+        self.last_block_at = time.monotonic()
+
+    async def _read_range(self, from_block, to_block):
+        calls = [("eth_getLogs", [{
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+            "topics": [TRANSFER_TOPIC]
+        }])]
+        calls += [("eth_getBlockByNumber", [hex(n), True]) for n in range(from_block, to_block + 1)]
+        results = await clients.rpc_batch(calls)
+        for result in results:
+            if isinstance(result, clients.RPCError):
+                raise result
+
+        events = BlockEvents(to_block, from_block=from_block)
+        for log in results[0]:
+            if not is_erc20_transfer(log):
+                continue
+            topics = log["topics"]
+            token = log["address"].lower()
+            for address in (_topic_to_address(topics[1]), _topic_to_address(topics[2])):
+                if address in self.index:
+                    events.token_transfers.add((address, token))
+
+        for block in results[1:]:
+            for tx in (block or {}).get("transactions", []):
+                for address in (tx.get("from"), tx.get("to")):
+                    if address and address in self.index:
+                        events.native.add(address.lower())
+        return events
+
+    def _notify(self, events):
+        for listener in self.listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                logger.error(f"Block listener error: {str(e)}")
+
+
+class SqliteBlockStore:
+    """Tracked addresses of every shard and the block events stored for them."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracked_addresses ("
+            "user_id TEXT NOT NULL, "
+            "address TEXT NOT NULL, "
+            "shard INTEGER NOT NULL, "
+            "PRIMARY KEY (user_id, address))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tracked_version (version INTEGER NOT NULL)")
+        if self._conn.execute("SELECT COUNT(*) FROM tracked_version").fetchone()[0] == 0:
+            self._conn.execute("INSERT INTO tracked_version (version) VALUES (0)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS block_ranges ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "from_block INTEGER NOT NULL, "
+            "block INTEGER NOT NULL, "
+            "gap INTEGER NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS block_events ("
+            "seq INTEGER NOT NULL, "
+            "shard INTEGER NOT NULL, "
+            "address TEXT NOT NULL, "
+            "token TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS block_events_by_shard ON block_events (shard, seq)")
+
+    def _track(self, statements):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for query, rows in statements:
+                    self._conn.executemany(query, rows)
+                self._conn.execute("UPDATE tracked_version SET version = version + 1")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def set_user(self, shard, user_id, addresses):
+        """Replace the addresses tracked for a user of a shard."""
+        self._track([
+            ("DELETE FROM tracked_addresses WHERE user_id = ?", [(str(user_id),)]),
+            (
+                "INSERT OR IGNORE INTO tracked_addresses (user_id, address, shard) VALUES (?, ?, ?)",
+                [(str(user_id), address.lower(), shard) for address in addresses]
+            ),
+        ])
+
+    def set_shard(self, shard, addresses_by_user):
+        """Replace every address tracked for a shard, e.g. on startup."""
+        self._track([
+            ("DELETE FROM tracked_addresses WHERE shard = ?", [(shard,)]),
+            (
+                "INSERT OR IGNORE INTO tracked_addresses (user_id, address, shard) VALUES (?, ?, ?)",
+                [
+                    (str(user_id), address.lower(), shard)
+                    for user_id, addresses in addresses_by_user.items()
+                    for address in addresses
+                ]
+            ),
+        ])
+
+    def tracked_version(self):
+        with self._lock:
+            return self._conn.execute("SELECT version FROM tracked_version").fetchone()[0]
+
+    def tracked(self):
+        """Return ``{address: shards tracking it}``."""
+        with self._lock:
+            rows = self._conn.execute("SELECT address, shard FROM tracked_addresses").fetchall()
+        shards = {}
+        for address, shard in rows:
+            shards.setdefault(address, set()).add(shard)
+        return shards
+
+    def append(self, events, shards_of):
+        """Store a processed block range with its events, tagged with the shards they concern."""
+        rows = []
+        for address in events.native:
+            rows += [(shard, address, None) for shard in shards_of(address)]
+        for address, token in events.token_transfers:
+            rows += [(shard, address, token) for shard in shards_of(address)]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                seq = self._conn.execute(
+                    "INSERT INTO block_ranges (from_block, block, gap, created_at) VALUES (?, ?, ?, ?)",
+                    (events.from_block, events.block, int(events.gap), now)
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT INTO block_events (seq, shard, address, token) VALUES (?, ?, ?, ?)",
+                    [(seq,) + row for row in rows]
+                )
+                # Readers that fall further behind than this see a gap
+                expired = self._conn.execute(
+                    "SELECT MAX(seq) FROM block_ranges WHERE created_at < ?", (now - BLOCK_RELAY_RETENTION,)
+                ).fetchone()[0]
+                if expired is not None:
+                    self._conn.execute("DELETE FROM block_ranges WHERE seq <= ?", (expired,))
+                    self._conn.execute("DELETE FROM block_events WHERE seq <= ?", (expired,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def latest_seq(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM block_ranges").fetchone()[0]
+
+    def read(self, shard, after):
+        """Return the ranges stored after sequence number ``after`` as ``(seq, BlockEvents)``."""
+        with self._lock:
+            ranges = self._conn.execute(
+                "SELECT seq, from_block, block, gap FROM block_ranges WHERE seq > ? ORDER BY seq", (after,)
+            ).fetchall()
+            if not ranges:
+                return []
+            rows = self._conn.execute(
+                "SELECT seq, address, token FROM block_events WHERE shard = ? AND seq > ? AND seq <= ?",
+                (shard, after, ranges[-1][0])
+            ).fetchall()
+        events = {seq: BlockEvents(block, bool(gap), from_block) for seq, from_block, block, gap in ranges}
+        for seq, address, token in rows:
+            if token is None:
+                events[seq].native.add(address)
+            else:
+                events[seq].token_transfers.add((address, token))
+        return list(events.items())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SharedAddressIndex:
+    """The addresses tracked by all shards, as an index for shard 0's subscriber."""
+
+    def __init__(self, store):
+        self.store = store
+        self._shards = {}
+        self._version = None
+
+    def __contains__(self, address):
+        return address.lower() in self._shards
+
+    def __len__(self):
+        return len(self._shards)
+
+    def shards(self, address):
+        return self._shards.get(address.lower(), ())
+
+    def refresh(self):
+        """Reload the addresses if any shard changed them."""
+        version = self.store.tracked_version()
+        if version != self._version:
+            self._shards = self.store.tracked()
+            self._version = version
+
+    def publish(self, events):
+        """Listener of shard 0's subscriber: store a block range for every shard."""
+        self.store.append(events, self.shards)
+        self.refresh()
+
+
+class BlockRelay:
+    """Notify listeners of the block events shard 0 stored for this shard.
+
+    Has the ``live``, ``last_block`` and ``subscribe`` of a ``BlockSubscriber``.
+    """
+
+    def __init__(self, store, shard):
+        self.store = store
+        self.shard = shard
+        self.listeners = []
+        self.last_block = None
+        self.last_block_at = 0.0
+        self._seq = None
+
+    @property
+    def live(self):
+        """True while shard 0 stores blocks on time."""
+        return time.monotonic() - self.last_block_at < BLOCK_STALL_TIMEOUT
+
+    def subscribe(self, listener):
+        """Register ``listener(events)``, called for every stored block range."""
+        self.listeners.append(listener)
+
+    async def run(self):
+        """Read new block ranges until cancelled."""
+        while True:
+            try:
+                self._read()
+            except Exception as e:
+                logger.error(f"Block relay error: {str(e)}")
+            await asyncio.sleep(BLOCK_RELAY_POLL_INTERVAL)
+
+    def _read(self):
+        if self._seq is None:
+            # Like the subscriber, start from the current head
+            self._seq = self.store.latest_seq()
+            return
+        for seq, events in self.store.read(self.shard, self._seq):
+            if seq != self._seq + 1:
+                # Ranges expired before they were read
+                logger.error(f"Block relay missed ranges {self._seq + 1}-{seq - 1}")
+                self._notify(BlockEvents(events.block, gap=True))
+            self._notify(events)
+            self._seq = seq
+            self.last_block = events.block
+            self.last_block_at = time.monotonic()
+
+    def _notify(self, events):
+        for listener in self.listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                logger.error(f"Block listener error: {str(e)}")
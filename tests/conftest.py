@@ -0,0 +1,52 @@
+"""
+Shared test setup.
+
+config.py refuses to load without a bot token, and the modules under test
+read it at import time.
+"""
+import os
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+
+import pytest
+
+import clients
+
+
+class FakeRPC:
+    """Stand-in for the Monad RPC behind ``clients.rpc_batch``/``rpc_call``.
+
+    ``handlers`` maps a method to ``handler(params)``; a handler may return
+    an ``RPCError`` to fail that call only. Every batch is recorded.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.batches = []
+
+    async def rpc_batch(self, calls):
+        self.batches.append(list(calls))
+        results = []
+        for method, params in calls:
+            try:
+                results.append(self.handlers[method](params))
+            except clients.RPCError as e:
+                results.append(e)
+        return results
+
+    async def rpc_call(self, method, params):
+        result = (await self.rpc_batch([(method, params)]))[0]
+        if isinstance(result, clients.RPCError):
+            raise result
+        return result
+
+    def calls(self, method):
+        return [params for batch in self.batches for name, params in batch if name == method]
+
+
+@pytest.fixture
+def rpc(monkeypatch):
+    fake = FakeRPC()
+    monkeypatch.setattr(clients, "rpc_batch", fake.rpc_batch)
+    monkeypatch.setattr(clients, "rpc_call", fake.rpc_call)
+    return fake
@@ -0,0 +1,71 @@
+"""
+Sends against a local anvil node, skipped when anvil is not installed.
+"""
+import asyncio
+import shutil
+import socket
+import subprocess
+import time
+
+import pytest
+from eth_account import Account
+
+import clients
+import transactions
+from config import CHAIN_ID
+
+pytestmark = pytest.mark.skipif(shutil.which("anvil") is None, reason="anvil is not installed")
+
+# anvil's first prefunded development account
+PRIVATE_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+RECIPIENT = "0x" + "42" * 20
+
+
+@pytest.fixture
+def anvil(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    node = subprocess.Popen(
+        ["anvil", "--port", str(port), "--chain-id", str(CHAIN_ID), "--silent"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                node.kill()
+                pytest.fail("anvil did not start")
+            time.sleep(0.1)
+    monkeypatch.setattr(clients, "MONAD_RPC_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(transactions, "nonce_manager", transactions.NonceManager())
+    monkeypatch.setattr(transactions, "receipt_tracker", transactions.ReceiptTracker(interval=0.1, timeout=10))
+    yield
+    node.terminate()
+    node.wait()
+
+
+def test_concurrent_sends_get_consecutive_nonces_and_confirm(anvil):
+    sender = Account.from_key(PRIVATE_KEY).address
+
+    async def main():
+        try:
+            start = int(await clients.rpc_call("eth_getTransactionCount", [sender, "pending"]), 16)
+            hashes = await asyncio.gather(*[
+                transactions.send_native(PRIVATE_KEY, RECIPIENT, 1) for _ in range(10)
+            ])
+            sent = await asyncio.gather(*[
+                clients.rpc_call("eth_getTransactionByHash", [tx_hash]) for tx_hash in hashes
+            ])
+            succeeded = await asyncio.gather(*[transactions.wait_for_receipt(tx_hash) for tx_hash in hashes])
+            return start, sorted(int(tx["nonce"], 16) for tx in sent), succeeded
+        finally:
+            await clients.close()
+
+    start, nonces, succeeded = asyncio.run(main())
+    assert nonces == list(range(start, start + 10))
+    assert all(succeeded)
+    assert transactions.receipt_tracker.pending() == 0
@@ -0,0 +1,39 @@
+import asyncio
+
+import clients
+from price_feed import PriceFeed
+from ratelimit import RateLimitExceeded
+
+
+def test_background_tasks_draw_on_their_own_budget():
+    async def spend():
+        return clients.allow("kuru", clients.kuru_background_limiter.capacity)
+
+    async def main():
+        assert await clients.background_task(spend())
+        # The background share is used up, the interactive budget is untouched
+        assert not await clients.background_task(spend())
+        assert clients.allow("kuru")
+
+    asyncio.run(main())
+
+
+def test_price_feed_backs_off_while_out_of_budget(monkeypatch):
+    delays = []
+
+    async def fetch_prices(tokens):
+        raise RateLimitExceeded("Kuru request budget exhausted")
+
+    async def sleep(delay):
+        delays.append(delay)
+        if len(delays) == 5:
+            raise asyncio.CancelledError
+
+    feed = PriceFeed(fetch_prices, interval=2.0, max_backoff=10.0)
+    feed.watch("0xtoken")
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    try:
+        asyncio.run(feed.run())
+    except asyncio.CancelledError:
+        pass
+    assert [round(delay) for delay in delays] == [4, 8, 10, 10, 10]
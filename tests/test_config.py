@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_config(tmp_path, **env):
+    env = {"PATH": os.environ.get("PATH", ""), "TELEGRAM_BOT_TOKEN": "123:test", **env}
+    # Run from an empty directory so no .env file is picked up
+    return subprocess.run(
+        [sys.executable, "-c", f"import sys; sys.path.insert(0, {ROOT!r}); import config"],
+        cwd=tmp_path, env=env, capture_output=True, text=True
+    )
+
+
+def test_sharding_requires_a_secret(tmp_path):
+    result = load_config(tmp_path, SHARD_COUNT="2")
+    assert result.returncode != 0
+    assert "SHARD_SECRET is required" in result.stderr
+    assert load_config(tmp_path, SHARD_COUNT="2", SHARD_SECRET="s3cret").returncode == 0
+
+
+def test_webhook_mode_requires_a_secret(tmp_path):
+    result = load_config(tmp_path, BOT_MODE="webhook", WEBHOOK_URL="https://bot.example.com/telegram")
+    assert result.returncode != 0
+    assert "WEBHOOK_SECRET is required" in result.stderr
@@ -0,0 +1,115 @@
+import asyncio
+
+from orders import EXECUTING, FAILED, FILLED, OrderBook, OrderEngine, SqliteOrderStore
+
+
+def make_engine(tmp_path, execute, confirm):
+    store = SqliteOrderStore(str(tmp_path / "orders.db"))
+    updates = []
+    engine = OrderEngine(store, execute, on_update=updates.append, confirm=confirm)
+    return store, engine, updates
+
+
+def place_sell(engine):
+    return engine.place(1, "0xtoken", "TKN", "sell", 50, 2.0, "0xwallet", 10, 50)
+
+
+async def execute(order):
+    return "0xhash"
+
+
+def test_order_filled_only_after_successful_receipt(tmp_path):
+    async def main():
+        receipt = asyncio.Event()
+
+        async def confirm(tx_hash):
+            await receipt.wait()
+            return True
+
+        store, engine, updates = make_engine(tmp_path, execute, confirm)
+        order = place_sell(engine)
+        engine.on_price("0xtoken", 2.5)
+        await asyncio.sleep(0)
+        assert store.get(order["id"])["status"] == EXECUTING
+        assert store.get(order["id"])["tx_hash"] == "0xhash"
+        assert updates == []
+
+        receipt.set()
+        await asyncio.gather(*engine._tasks)
+        assert store.get(order["id"])["status"] == FILLED
+        assert [o["id"] for o in updates] == [order["id"]]
+
+    asyncio.run(main())
+
+
+def test_reverted_order_fails_and_unconfirmed_one_waits_again(tmp_path):
+    async def main():
+        results = iter([False, TimeoutError("Transaction 0xhash not mined"), True])
+
+        async def confirm(tx_hash):
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        store, engine, updates = make_engine(tmp_path, execute, confirm)
+        reverted = place_sell(engine)
+        engine.on_price("0xtoken", 2.5)
+        await asyncio.gather(*engine._tasks)
+        timed_out = place_sell(engine)
+        engine.on_price("0xtoken", 2.5)
+        await asyncio.gather(*engine._tasks)
+
+        assert store.get(reverted["id"])["status"] == FAILED
+        assert store.get(reverted["id"])["error"] == "Transaction reverted"
+        assert store.get(timed_out["id"])["status"] == FILLED
+        assert store.get(timed_out["id"])["tx_hash"] == "0xhash"
+
+    asyncio.run(main())
+
+
+def test_sent_order_resumes_after_restart(tmp_path):
+    async def main():
+        async def hang(tx_hash):
+            await asyncio.Event().wait()
+
+        store, engine, _ = make_engine(tmp_path, execute, hang)
+        order = place_sell(engine)
+        engine.on_price("0xtoken", 2.5)
+        await asyncio.sleep(0)
+        await engine.close()
+        assert not engine._tasks
+        assert store.get(order["id"])["status"] == EXECUTING
+
+        async def confirm(tx_hash):
+            return True
+
+        restarted = OrderEngine(store, execute, confirm=confirm)
+        restarted.load()
+        restarted.resume()
+        await asyncio.gather(*restarted._tasks)
+        assert store.get(order["id"])["status"] == FILLED
+        store.close()
+
+    asyncio.run(main())
+
+
+def test_book_pops_only_crossed_orders():
+    book = OrderBook()
+    orders = [
+        {"id": "buy-low", "type": "buy", "price": 1.0, "seq": 0},
+        {"id": "buy-high", "type": "buy", "price": 3.0, "seq": 1},
+        {"id": "sell-low", "type": "sell", "price": 4.0, "seq": 2},
+        {"id": "sell-high", "type": "sell", "price": 6.0, "seq": 3},
+        {"id": "cancelled", "type": "buy", "price": 5.0, "seq": 4},
+    ]
+    for order in orders:
+        book.add(order)
+    book.remove(orders[-1])
+
+    assert book.crossed(2.0) == ["buy-high"]
+    assert book.crossed(4.0) == ["sell-low"]
+    assert len(book) == 2
+    assert book.crossed(0.5) == ["buy-low"]
+    assert book.crossed(6.0) == ["sell-high"]
+    assert not len(book)
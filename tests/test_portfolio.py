@@ -0,0 +1,103 @@
+import asyncio
+
+from eth_abi import encode
+from web3 import Web3
+
+import clients
+import portfolio
+from portfolio import HoldingsService, SqliteScanStore, _address_topic
+from subscriber import TRANSFER_TOPIC
+
+WALLET = Web3.to_checksum_address("0x" + "11" * 20)
+TOKEN = Web3.to_checksum_address("0x" + "22" * 20)
+OLD_TOKEN = Web3.to_checksum_address("0x" + "33" * 20)
+HEAD = 9_999
+
+
+class Chain:
+    """Transfer logs of two tokens into the wallet, at blocks 9_500 and 2_000."""
+
+    def __init__(self, rpc):
+        self.failing = set()
+        rpc.handlers["eth_blockNumber"] = lambda params: hex(HEAD)
+        rpc.handlers["eth_getLogs"] = self.get_logs
+
+    def get_logs(self, params):
+        start, end = int(params[0]["fromBlock"], 16), int(params[0]["toBlock"], 16)
+        if start in self.failing:
+            raise clients.RPCError("query timeout")
+        return [
+            {"address": token.lower(), "topics": [TRANSFER_TOPIC, "0x" + "00" * 32, _address_topic(WALLET)]}
+            for block, token in ((9_500, TOKEN), (2_000, OLD_TOKEN))
+            if start <= block <= end
+        ]
+
+
+async def read_contracts(calls):
+    return [encode(["uint256"], [5]) for _ in calls]
+
+
+def make_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(portfolio, "LOG_BLOCK_RANGE", 1_000)
+    monkeypatch.setattr(portfolio, "LOG_BATCH_SIZE", 2)
+    monkeypatch.setattr(portfolio, "read_contracts", read_contracts)
+    store = SqliteScanStore(str(tmp_path / "portfolio.db"))
+    return HoldingsService({WALLET}, store, scan_blocks=5_000)
+
+
+def test_discovery_scans_recent_blocks_then_older_history(rpc, tmp_path, monkeypatch):
+    Chain(rpc)
+    service = make_service(tmp_path, monkeypatch)
+
+    async def main():
+        holdings = await service.get_holdings([WALLET])
+        assert holdings == {WALLET: {TOKEN: 5}}
+        # 5 ranges of the recent step, at most 2 per request
+        assert [len(batch) for batch in rpc.batches[1:4]] == [2, 2, 1]
+
+        await asyncio.gather(*service._tasks)
+        assert service.store.get(WALLET) == (0, HEAD, sorted([TOKEN, OLD_TOKEN]))
+        holdings = await service.get_holdings([WALLET])
+        assert holdings == {WALLET: {TOKEN: 5, OLD_TOKEN: 5}}
+
+    asyncio.run(main())
+    service.store.close()
+
+
+def test_failed_range_is_not_cached(rpc, tmp_path, monkeypatch):
+    chain = Chain(rpc)
+    chain.failing.add(7_000)
+    service = make_service(tmp_path, monkeypatch)
+
+    async def main():
+        try:
+            await service.get_holdings([WALLET])
+        except clients.RPCError:
+            pass
+        else:
+            raise AssertionError("a failed range must not count as discovered")
+        assert service.store.get(WALLET) is None
+
+        chain.failing.clear()
+        holdings = await service.get_holdings([WALLET])
+        assert holdings == {WALLET: {TOKEN: 5}}
+        await service.close()
+
+    asyncio.run(main())
+    service.store.close()
+
+
+def test_cursor_survives_a_restart(rpc, tmp_path, monkeypatch):
+    Chain(rpc)
+    service = make_service(tmp_path, monkeypatch)
+    service.store.save(WALLET, 5_001, 9_000, [OLD_TOKEN])
+
+    async def main():
+        holdings = await service.get_holdings([WALLET])
+        assert holdings == {WALLET: {TOKEN: 5, OLD_TOKEN: 5}}
+        # Only the blocks since the last run were scanned again
+        assert rpc.calls("eth_getLogs")[0][0]["fromBlock"] == hex(9_001)
+        await service.close()
+
+    asyncio.run(main())
+    service.store.close()
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+from price_feed import PriceFeed, SqlitePriceExchange
+
+# int(token, 16) % 2 picks the worker that polls a token
+EVEN = "0x" + "00" * 19 + "02"
+ODD = "0x" + "00" * 19 + "03"
+
+
+def test_sharded_workers_poll_each_token_once(tmp_path):
+    path = str(tmp_path / "prices.db")
+    fetched = {0: [], 1: []}
+    feeds = []
+    for shard in (0, 1):
+        async def fetch_prices(tokens, shard=shard):
+            fetched[shard].append(sorted(tokens))
+            return {token: float(int(token, 16)) for token in tokens}
+
+        feed = PriceFeed(fetch_prices, exchange=SqlitePriceExchange(path, shard, 2))
+        feed.watch(EVEN)
+        feed.watch(ODD)
+        feeds.append(feed)
+
+    async def main():
+        for _ in range(2):
+            for feed in feeds:
+                await feed.poll()
+
+    asyncio.run(main())
+    assert fetched == {0: [[EVEN], [EVEN]], 1: [[ODD], [ODD]]}
+    # Each worker recorded the other's token from the shared table
+    assert feeds[0].price(ODD) == 3.0
+    assert feeds[1].price(EVEN) == 2.0
+    for feed in feeds:
+        feed.exchange.close()
+
+
+def test_stale_samples_are_fetched_again(monkeypatch):
+    fetched = []
+
+    async def fetch_prices(tokens):
+        fetched.append(sorted(tokens))
+        return {token: 1.0 for token in tokens}
+
+    feed = PriceFeed(fetch_prices, interval=2.0)
+    now = 1_000_000.0
+    monkeypatch.setattr(time, "time", lambda: now)
+    asyncio.run(feed.prices([EVEN]))
+    assert feed.price(EVEN) == 1.0
+
+    now += 5 * 2.0 + 1
+    assert feed.price(EVEN) is None
+    asyncio.run(feed.prices([EVEN]))
+    assert fetched == [[EVEN], [EVEN]]
+
+
+def test_series_evicted_after_leaving_interest():
+    async def fetch_prices(tokens):
+        return {token: 1.0 for token in tokens}
+
+    feed = PriceFeed(fetch_prices, interval=2.0)
+    feed.watch(EVEN)
+    asyncio.run(feed.poll())
+    assert EVEN in feed.series
+
+    # Still watched: an old last-interest time is renewed, not evicted
+    feed._wanted[EVEN] -= feed.retention + 1
+    asyncio.run(feed.poll())
+    assert EVEN in feed.series
+
+    del feed._viewed[EVEN]
+    feed._wanted[EVEN] -= feed.retention + 1
+    asyncio.run(feed.poll())
+    assert EVEN not in feed.series
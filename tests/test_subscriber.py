@@ -0,0 +1,47 @@
+from subscriber import BlockEvents, BlockRelay, SharedAddressIndex, SqliteBlockStore
+
+WALLET_0 = "0x" + "10" * 20
+WALLET_1 = "0x" + "11" * 20
+TOKEN = "0x" + "22" * 20
+
+
+def test_block_events_reach_only_the_shard_tracking_the_address(tmp_path):
+    store = SqliteBlockStore(str(tmp_path / "blocks.db"))
+    store.set_shard(0, {"10": [WALLET_0]})
+    store.set_shard(1, {"11": [WALLET_1]})
+    index = SharedAddressIndex(store)
+    index.refresh()
+    relays = [BlockRelay(store, shard) for shard in (0, 1)]
+    received = {0: [], 1: []}
+    for shard, relay in enumerate(relays):
+        relay.subscribe(received[shard].append)
+        relay._read()
+
+    events = BlockEvents(101, from_block=100)
+    events.native.add(WALLET_0)
+    events.token_transfers.add((WALLET_1, TOKEN))
+    index.publish(events)
+    for relay in relays:
+        relay._read()
+
+    assert [(e.from_block, e.block, e.native, e.token_transfers) for e in received[0]] == [
+        (100, 101, {WALLET_0}, set())
+    ]
+    assert [(e.from_block, e.block, e.native, e.token_transfers) for e in received[1]] == [
+        (100, 101, set(), {(WALLET_1, TOKEN)})
+    ]
+    assert relays[1].live and relays[1].last_block == 101
+    store.close()
+
+
+def test_new_wallets_of_other_shards_are_picked_up(tmp_path):
+    store = SqliteBlockStore(str(tmp_path / "blocks.db"))
+    index = SharedAddressIndex(store)
+    index.refresh()
+    assert WALLET_1 not in index
+
+    store.set_user(1, "11", [WALLET_1])
+    index.publish(BlockEvents(5))
+    assert WALLET_1 in index
+    assert index.shards(WALLET_1) == {1}
+    store.close()
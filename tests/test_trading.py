@@ -0,0 +1,120 @@
+import asyncio
+
+from eth_abi import encode
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from web3 import Web3
+
+import trading
+from trading import ALLOWANCE, APPROVE, BALANCE_OF, FACTORY, GET_PAIR, GET_RESERVES, TOKEN0, WETH, SnipeEngine
+from transactions import NonceManager
+
+ROUTER = Web3.to_checksum_address("0x" + "aa" * 20)
+FACTORY_ADDRESS = Web3.to_checksum_address("0x" + "bb" * 20)
+WRAPPED = Web3.to_checksum_address("0x" + "cc" * 20)
+PAIR = Web3.to_checksum_address("0x" + "dd" * 20)
+TOKEN = Web3.to_checksum_address("0x" + "ee" * 20)
+WALLET = {"private_key": "0x" + "01" * 32}
+WALLET["address"] = Account.from_key(WALLET["private_key"]).address
+
+
+def _address(address):
+    return encode(["address"], [address])
+
+
+class Chain:
+    """Contract reads of a router, a pool and a token the wallet holds but has not approved."""
+
+    def __init__(self):
+        self.allowance = 0
+        self.sent = []
+        self.receipts = {}
+
+    async def read_contracts(self, calls):
+        results = []
+        for to, data in calls:
+            selector = bytes.fromhex(data[2:10])
+            if selector == FACTORY:
+                results.append(_address(FACTORY_ADDRESS))
+            elif selector == WETH:
+                results.append(_address(WRAPPED))
+            elif selector == GET_PAIR:
+                results.append(_address(PAIR))
+            elif selector == TOKEN0:
+                results.append(_address(TOKEN))
+            elif selector == GET_RESERVES:
+                results.append(encode(["uint112", "uint112", "uint32"], [10 ** 24, 10 ** 21, 0]))
+            elif selector == BALANCE_OF:
+                results.append(encode(["uint256"], [10 ** 18]))
+            elif selector == ALLOWANCE:
+                results.append(encode(["uint256"], [self.allowance]))
+        return results
+
+
+def _engine(rpc, monkeypatch):
+    chain = Chain()
+    monkeypatch.setattr(trading, "read_contracts", chain.read_contracts)
+    manager = NonceManager()
+    monkeypatch.setattr(trading, "nonce_manager", manager)
+    monkeypatch.setattr("transactions.nonce_manager", manager)
+    rpc.handlers["eth_getTransactionCount"] = lambda params: hex(0)
+    rpc.handlers["eth_sendRawTransaction"] = lambda params: Web3.to_hex(Web3.keccak(hexstr=params[0]))
+    rpc.handlers["eth_getTransactionReceipt"] = lambda params: chain.receipts.get(params[0])
+    return SnipeEngine(ROUTER), chain
+
+
+def _sent(rpc):
+    """Transactions sent so far, as ``(nonce, to, selector, hash)``."""
+    sent = []
+    for params in rpc.calls("eth_sendRawTransaction"):
+        tx = Transaction.from_bytes(bytes.fromhex(params[0][2:]))
+        tx_hash = Web3.to_hex(Web3.keccak(hexstr=params[0]))
+        sent.append((tx.nonce, Web3.to_checksum_address(tx.to), tx.data[:4], tx_hash))
+    return sent
+
+
+def test_preparing_a_sell_sends_nothing(rpc, monkeypatch):
+    engine, _ = _engine(rpc, monkeypatch)
+    template = asyncio.run(engine.prepare("1", "sell", WALLET, TOKEN, 10 ** 9, 1.0))
+    assert template.allowance == 0
+    assert rpc.calls("eth_sendRawTransaction") == []
+
+
+def test_first_sell_approves_in_the_same_batch(rpc, monkeypatch):
+    engine, _ = _engine(rpc, monkeypatch)
+
+    async def run():
+        template = await engine.prepare("1", "sell", WALLET, TOKEN, 10 ** 9, 1.0)
+        await engine.sell(template, 50, 0.0)
+        # The approval is not mined yet; a second sell must not approve again
+        await engine.sell(template, 50, 0.0)
+        return template
+
+    template = asyncio.run(run())
+    assert [sent[:3] for sent in _sent(rpc)] == [
+        (0, TOKEN, APPROVE),
+        (1, ROUTER, trading.SWAP_EXACT_TOKENS_FOR_ETH),
+        (2, ROUTER, trading.SWAP_EXACT_TOKENS_FOR_ETH),
+    ]
+    # Approval and first swap went out in one batch
+    assert [len(batch) for batch in rpc.batches if batch[0][0] == "eth_sendRawTransaction"] == [2, 1]
+    assert template.allowance == 0
+
+
+def test_reverted_approval_is_sent_again(rpc, monkeypatch):
+    engine, chain = _engine(rpc, monkeypatch)
+    monkeypatch.setattr("transactions.receipt_tracker.interval", 0.01)
+
+    async def run():
+        template = await engine.prepare("1", "sell", WALLET, TOKEN, 10 ** 9, 1.0)
+        await engine.sell(template, 50, 0.0)
+        approval_hash = _sent(rpc)[0][3]
+        chain.receipts[approval_hash] = {"status": "0x0"}
+        while engine._approvals:
+            await asyncio.sleep(0.01)
+        await engine.sell(template, 50, 0.0)
+
+    asyncio.run(run())
+    assert [selector for _, _, selector, _ in _sent(rpc)] == [
+        APPROVE, trading.SWAP_EXACT_TOKENS_FOR_ETH, APPROVE, trading.SWAP_EXACT_TOKENS_FOR_ETH
+    ]
@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+from eth_account import Account
+
+import clients
+from transactions import (
+    NonceManager,
+    ReceiptTracker,
+    TransactionError,
+    broadcast,
+    broadcast_many,
+    sign_transaction
+)
+
+SENDER = "0x" + "11" * 20
+OTHER = "0x" + "22" * 20
+
+
+def test_concurrent_reservations_get_consecutive_nonces(rpc):
+    rpc.handlers["eth_getTransactionCount"] = lambda params: hex(7)
+    manager = NonceManager()
+
+    async def reserve_all():
+        return await asyncio.gather(*[manager.reserve(SENDER) for _ in range(20)])
+
+    nonces = asyncio.run(reserve_all())
+    assert sorted(nonces) == list(range(7, 27))
+    # Only the first reservation asks the node
+    assert len(rpc.calls("eth_getTransactionCount")) == 1
+
+
+def test_senders_have_separate_counters(rpc):
+    pending = {SENDER: 3, OTHER: 40}
+    rpc.handlers["eth_getTransactionCount"] = lambda params: hex(pending[params[0]])
+    manager = NonceManager()
+
+    async def run():
+        await manager.warm(SENDER)
+        return [await manager.reserve(SENDER), await manager.reserve(OTHER), await manager.reserve(SENDER)]
+
+    assert asyncio.run(run()) == [3, 40, 4]
+
+
+def test_rejected_send_resyncs_from_pending_nonce(rpc, monkeypatch):
+    manager = NonceManager()
+    monkeypatch.setattr("transactions.nonce_manager", manager)
+    pending = {"nonce": 5}
+    rpc.handlers["eth_getTransactionCount"] = lambda params: hex(pending["nonce"])
+
+    def reject(params):
+        raise clients.RPCError("nonce too low")
+
+    rpc.handlers["eth_sendRawTransaction"] = reject
+
+    async def run():
+        assert await manager.reserve(SENDER) == 5
+        # Another client used nonces 5 and 6 meanwhile, so the send is rejected
+        pending["nonce"] = 7
+        with pytest.raises(TransactionError, match="nonce too low"):
+            await broadcast(SENDER, "0xraw")
+        return await manager.reserve(SENDER)
+
+    assert asyncio.run(run()) == 7
+
+
+def test_failed_signing_resyncs_the_reserved_nonce(rpc, monkeypatch):
+    manager = NonceManager()
+    monkeypatch.setattr("transactions.nonce_manager", manager)
+    rpc.handlers["eth_getTransactionCount"] = lambda params: hex(4)
+    account = Account.create()
+
+    async def run():
+        with pytest.raises(Exception):
+            await sign_transaction(account, {"to": "not an address", "value": 0, "gasPrice": 1})
+        return await manager.reserve(account.address)
+
+    # Nonce 4 was never used, so the next send takes it again
+    assert asyncio.run(run()) == 4
+    assert len(rpc.calls("eth_getTransactionCount")) == 2
+
+
+def test_batched_broadcast_resyncs_only_failed_senders(rpc, monkeypatch):
+    manager = NonceManager()
+    monkeypatch.setattr("transactions.nonce_manager", manager)
+    rpc.handlers["eth_getTransactionCount"] = lambda params: hex(0)
+    rpc.handlers["eth_sendRawTransaction"] = lambda params: (
+        clients.RPCError("insufficient funds") if params[0] == "0xbad" else "0xhash"
+    )
+
+    async def run():
+        await manager.reserve(SENDER)
+        await manager.reserve(OTHER)
+        results = await broadcast_many([(SENDER, "0xgood"), (OTHER, "0xbad")])
+        return results, manager._next
+
+    (ok, failed), counters = asyncio.run(run())
+    assert ok == "0xhash"
+    assert isinstance(failed, TransactionError)
+    assert counters == {SENDER: 1}
+    assert len(rpc.batches[-1]) == 2
+
+
+def test_receipts_are_polled_in_one_batch(rpc):
+    mined = {}
+    rpc.handlers["eth_getTransactionReceipt"] = lambda params: mined.get(params[0])
+    tracker = ReceiptTracker(interval=0.01, timeout=1)
+
+    async def run():
+        waits = [asyncio.ensure_future(tracker.wait(tx_hash)) for tx_hash in ("0xa", "0xb", "0xc")]
+        await asyncio.sleep(0)
+        mined["0xa"] = {"status": "0x1"}
+        mined["0xb"] = {"status": "0x0"}
+        await asyncio.sleep(0.05)
+        assert not waits[2].done()
+        mined["0xc"] = {"status": "0x1"}
+        return await asyncio.gather(*waits)
+
+    receipts = asyncio.run(run())
+    assert [receipt["status"] for receipt in receipts] == ["0x1", "0x0", "0x1"]
+    assert sorted(params[0] for _, params in rpc.batches[0]) == ["0xa", "0xb", "0xc"]
+    # Mined transactions are not polled again
+    assert [params[0] for _, params in rpc.batches[-1]] == ["0xc"]
+    assert tracker.pending() == 0
+
+
+def test_receipt_poll_errors_are_retried(rpc):
+    attempts = []
+
+    def flaky(params):
+        attempts.append(params[0])
+        if len(attempts) == 1:
+            return clients.RPCError("header not found")
+        return {"status": "0x1"}
+
+    rpc.handlers["eth_getTransactionReceipt"] = flaky
+    tracker = ReceiptTracker(interval=0.01, timeout=1)
+    assert asyncio.run(tracker.wait("0xa")) == {"status": "0x1"}
+    assert len(attempts) == 2
+
+
+def test_receipt_wait_times_out(rpc):
+    rpc.handlers["eth_getTransactionReceipt"] = lambda params: None
+    tracker = ReceiptTracker(interval=0.01, timeout=0.05)
+
+    with pytest.raises(TransactionError, match="No receipt"):
+        asyncio.run(tracker.wait("0xa"))
+    assert tracker.pending() == 0
+
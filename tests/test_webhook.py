@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+from telegram import Chat, Message, Update, User
+
+from webhook import SECRET_HEADER, ChatOrderedUpdateProcessor, WebhookServer
+
+UPDATE = {"update_id": 1, "message": {"chat": {"id": 7}, "from": {"id": 7}}}
+
+
+async def process_update(update):
+    pass
+
+
+def post(server, headers):
+    async def main():
+        request = make_mocked_request("POST", server.path, headers=headers)
+        request.json = lambda: asyncio.sleep(0, UPDATE)
+        return await server._handle(request)
+
+    return asyncio.run(main())
+
+
+def test_requests_without_the_secret_are_rejected():
+    server = WebhookServer(process_update, None, secret_token="s3cret")
+    assert post(server, {}).status == 403
+    assert post(server, {SECRET_HEADER: "wrong"}).status == 403
+    assert server.queue_depth() == 0
+    assert post(server, {SECRET_HEADER: "s3cret"}).status == 200
+    assert server.queue_depth() == 1
+
+
+def test_a_server_without_a_secret_refuses_to_start():
+    with pytest.raises(ValueError):
+        WebhookServer(process_update, None, secret_token="")
+
+
+def test_resent_updates_are_acknowledged_but_not_handled_twice():
+    server = WebhookServer(process_update, None, secret_token="s3cret", dedup_window=2)
+    headers = {SECRET_HEADER: "s3cret"}
+    batch = [dict(UPDATE, update_id=update_id) for update_id in (1, 2)]
+
+    async def main():
+        responses = []
+        for data in (batch, batch, [dict(UPDATE, update_id=3)], batch[:1]):
+            request = make_mocked_request("POST", server.path, headers=headers)
+            request.json = lambda data=data: asyncio.sleep(0, data)
+            responses.append(await server._handle(request))
+        return responses
+
+    responses = asyncio.run(main())
+    assert [response.status for response in responses] == [200, 200, 200, 200]
+    # The resent batch is dropped; id 1 left the window of 2 and is queued again
+    assert server.duplicates == 2
+    assert server.queue_depth() == 4
+
+
+def make_update(update_id, chat_id):
+    chat = Chat(chat_id, Chat.PRIVATE)
+    message = Message(update_id, None, chat, from_user=User(chat_id, "user", False), text="hi")
+    return Update(update_id, message=message)
+
+
+def test_polling_keeps_each_chats_updates_in_order():
+    events = []
+
+    async def handle(update, delay):
+        events.append(("start", update.update_id))
+        await asyncio.sleep(delay)
+        events.append(("end", update.update_id))
+
+    async def main():
+        processor = ChatOrderedUpdateProcessor(8)
+        first, second, other = make_update(1, 7), make_update(2, 7), make_update(3, 8)
+        await asyncio.gather(
+            processor.process_update(first, handle(first, 0.02)),
+            processor.process_update(second, handle(second, 0)),
+            processor.process_update(other, handle(other, 0)),
+        )
+        assert not processor._chats
+
+    asyncio.run(main())
+    # Update 2 waits for update 1 of the same chat; chat 8 does not
+    assert events.index(("end", 1)) < events.index(("start", 2))
+    assert events.index(("end", 3)) < events.index(("end", 1))
@@ -0,0 +1,361 @@
+"""
+Token info pipeline behind the token card.
+
+Chain metadata, Kuru token stats, Kuru pair reserves and socials are
+independent, so they are fetched concurrently. Every source has its own
+timeout; a slow or failing Kuru endpoint only blanks its own fields
+instead of delaying or failing the whole card.
+
+Results are cached per checksummed address: metadata for a long time,
+market data briefly with stale-while-revalidate, so a trending token
+pasted by many users is served from memory.
+"""
+import asyncio
+import logging
+import time
+
+import aiohttp
+from web3 import Web3
+
+import clients
+from cache import SingleFlight, TTLCache
+from metrics import registry, track_cache
+from ratelimit import RateLimitExceeded
+from config import (
+    KURU_API_URL,
+    TOKEN_SOURCE_TIMEOUTS,
+    TOKEN_CACHE_SIZE,
+    TOKEN_METADATA_TTL,
+    TOKEN_MARKET_TTL,
+    TOKEN_MARKET_STALE_TTL,
+    TOKEN_SOCIALS_TTL
+)
+from token_metadata import fetch_token_metadata
+
+logger = logging.getLogger(__name__)
+
+# Standard ERC20 ABI used for the contract security checks
+ERC20_ABI = [
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "name",
+        "outputs": [{"name": "", "type": "string"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "symbol",
+        "outputs": [{"name": "", "type": "string"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "decimals",
+        "outputs": [{"name": "", "type": "uint8"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "totalSupply",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    }
+]
+
+
+# Name, symbol, decimals and supply rarely change; price, liquidity and reserves do
+metadata_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_METADATA_TTL)
+market_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_MARKET_TTL, TOKEN_MARKET_STALE_TTL)
+socials_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_SOCIALS_TTL, TOKEN_SOCIALS_TTL)
+track_cache("token_metadata", metadata_cache)
+track_cache("token_market", market_cache)
+track_cache("token_socials", socials_cache)
+
+# Per-step timings of the token card pipeline
+source_latency = registry.histogram("token_source_seconds", "Token card source latency, cache included", ["source"])
+source_failures = registry.counter("token_source_failures_total", "Token card sources that fell back", ["source", "reason"])
+kuru_latency = registry.histogram("kuru_request_seconds", "Kuru API request latency", ["endpoint"])
+kuru_errors = registry.counter("kuru_errors_total", "Failed Kuru API requests", ["endpoint"])
+
+# Concurrent card requests for the same token share one pipeline run
+token_info_flight = SingleFlight()
+
+
+def _abi_has_function(name):
+    return any(item.get("name") == name for item in ERC20_ABI)
+
+
+async def _with_timeout(source, coro, default):
+    """Await a source with its own timeout, falling back to ``default``."""
+    try:
+        with source_latency.labels(source).time():
+            return await asyncio.wait_for(coro, TOKEN_SOURCE_TIMEOUTS[source])
+    except asyncio.TimeoutError:
+        source_failures.labels(source, "timeout").inc()
+        logger.error(f"Timed out fetching {source} data")
+    except Exception as e:
+        source_failures.labels(source, "error").inc()
+        logger.error(f"Error fetching {source} data: {str(e)}")
+    return default
+
+
+async def _get_json(endpoint, url, charged=False):
+    """GET a Kuru endpoint over the shared session; raises unless it returns 200.
+
+    Raising keeps a failed request out of the caches, which only store results.
+    ``charged`` skips the budget check for a request the caller already paid for.
+    """
+    if not charged and not clients.allow("kuru"):
+        raise RateLimitExceeded("Kuru request budget exhausted")
+    try:
+        with kuru_latency.labels(endpoint).time():
+            async with clients.get_session().get(url) as response:
+                response.raise_for_status()
+                return await response.json()
+    except Exception:
+        kuru_errors.labels(endpoint).inc()
+        raise
+
+
+async def fetch_chain_metadata(token_address):
+    """Fetch name, symbol, decimals and total supply from the chain."""
+    metadata = (await fetch_token_metadata([token_address]))[token_address]
+    if metadata is None:
+        raise ValueError(f"{token_address} is not an ERC-20 token")
+    return metadata
+
+
+async def fetch_kuru_token(token_address, charged=False):
+    """Fetch price, liquidity and pair creation time from Kuru."""
+    token_data = await _get_json("token", f"{KURU_API_URL}/v1/tokens/{token_address}", charged)
+    return {
+        "price": token_data.get('price', '0'),
+        "liquidity": token_data.get('liquidity', '0'),
+        "pair_created_at": token_data.get('pairCreatedAt')
+    }
+
+
+async def fetch_kuru_pair(token_address):
+    """Fetch LP supply and reserves from Kuru."""
+    pair_data = await _get_json("pair", f"{KURU_API_URL}/v1/pairs/{token_address}")
+    lp_info = pair_data.get('lpInfo', {})
+    return {
+        "total_lp": lp_info.get('totalSupply', '0'),
+        "burned_lp": lp_info.get('burnedAmount', '0'),
+        "reserve0": pair_data.get('reserve0', '0'),
+        "reserve1": pair_data.get('reserve1', '0')
+    }
+
+
+async def fetch_kuru_socials(token_address, kuru_api_url=KURU_API_URL):
+    """Fetch token social links from Kuru DEX, raising on network errors."""
+    try:
+        social_data = await _get_json("socials", f"{kuru_api_url}/v1/tokens/{token_address}/social")
+    except aiohttp.ClientResponseError as e:
+        # A token without a social page is an answer worth caching
+        if e.status == 404:
+            return "Social links not available"
+        raise
+
+    socials = []
+    if social_data.get('website'):
+        socials.append(f"🌐 Website: {social_data['website']}")
+    if social_data.get('telegram'):
+        socials.append(f"📱 Telegram: {social_data['telegram']}")
+    if social_data.get('twitter'):
+        socials.append(f"🐦 Twitter: {social_data['twitter']}")
+    if social_data.get('discord'):
+        socials.append(f"💬 Discord: {social_data['discord']}")
+
+    return "\n".join(socials) if socials else "No social links available"
+
+
+async def fetch_token_socials(token_address, kuru_api_url=KURU_API_URL):
+    """Fetch token social links from Kuru DEX."""
+    try:
+        return await fetch_kuru_socials(token_address, kuru_api_url)
+    except Exception as e:
+        logger.error(f"Error fetching social links: {str(e)}")
+        return "Error fetching social links"
+
+
+def build_token_data(token_address, metadata, market, pair, socials):
+    """Combine the per-source results into the token card fields."""
+    token_symbol = metadata["symbol"]
+
+    # Calculate pair age if available
+    if market["pair_created_at"]:
+        pair_age = int(time.time()) - int(market["pair_created_at"])
+        days = pair_age // (24 * 3600)
+        hours = (pair_age % (24 * 3600)) // 3600
+        pair_age_str = f"{days} days, {hours} hours"
+    else:
+        pair_age_str = "Unknown"
+
+    # Calculate LP burned percentage
+    try:
+        total_lp = float(pair["total_lp"])
+        burned_lp = float(pair["burned_lp"])
+        if total_lp > 0:
+            lp_burned = f"{(burned_lp * 100) / total_lp:.2f}%"
+        else:
+            lp_burned = "0%"
+    except (TypeError, ValueError):
+        lp_burned = "Unknown"
+
+    # Format liquidity tokens
+    try:
+        token0_amount = Web3.from_wei(int(pair["reserve0"]), 'ether')
+        token1_amount = Web3.from_wei(int(pair["reserve1"]), 'ether')
+        liquidity_tokens = f"({token0_amount:.2f} MON + {token1_amount:.2f} {token_symbol})"
+    except (TypeError, ValueError):
+        liquidity_tokens = "Unknown"
+
+    # Check security features
+    is_mintable = _abi_has_function("mint")
+    can_blacklist = _abi_has_function("blacklist")
+    is_modifiable = _abi_has_function("upgrade")
+
+    price = float(market["price"])
+    return {
+        "name": metadata["name"],
+        "symbol": token_symbol,
+        "address": token_address,
+        "chain": "Monad",
+        "exchange": "Kuru DEX",
+        "price": f"{price:.8f}",
+        "base_currency": "MON",
+        "market_cap": f"{price * float(metadata['total_supply']) / (10 ** metadata['decimals']):.2f}",
+        "liquidity": market["liquidity"],
+        "liquidity_tokens": liquidity_tokens,
+        "lp_burned": lp_burned,
+        "pair_age": pair_age_str,
+        "security_mintable": "⚠️ Token is mintable!" if is_mintable else "✅ Token is not mintable",
+        "security_blacklist": "⚠️ Can be blacklisted!" if can_blacklist else "✅ Cannot be blacklisted",
+        "security_modifiable": "⚠️ Contract is modifiable!" if is_modifiable else "✅ Contract is not modifiable",
+        "socials": socials
+    }
+
+
+async def fetch_token_info(token_address):
+    """Fetch token information from Monad blockchain and Kuru DEX."""
+    try:
+        token_address = Web3.to_checksum_address(token_address)
+        return await token_info_flight.do(token_address, lambda: _load_token_info(token_address))
+
+    except Exception as e:
+        logger.error(f"Error fetching token info: {str(e)}")
+        return None
+
+
+async def _load_token_info(token_address):
+    """Run the token info pipeline for a checksummed address."""
+    metadata, market, pair, socials = await asyncio.gather(
+        _with_timeout(
+            "chain",
+            metadata_cache.get_or_fetch(token_address, lambda: fetch_chain_metadata(token_address)),
+            None
+        ),
+        _with_timeout(
+            "token",
+            market_cache.get_or_fetch(("token", token_address), lambda: fetch_kuru_token(token_address)),
+            {"price": "0", "liquidity": "0", "pair_created_at": None}
+        ),
+        _with_timeout(
+            "pair",
+            market_cache.get_or_fetch(("pair", token_address), lambda: fetch_kuru_pair(token_address)),
+            {"total_lp": "0", "burned_lp": "0", "reserve0": "0", "reserve1": "0"}
+        ),
+        _with_timeout(
+            "socials",
+            socials_cache.get_or_fetch(token_address, lambda: fetch_kuru_socials(token_address)),
+            "Social links not available"
+        )
+    )
+
+    # Without on-chain metadata this is not a token we can show
+    if metadata is None:
+        return None
+
+    return build_token_data(token_address, metadata, market, pair, socials)
+
+
+async def get_token_metadata(token_address):
+    """Return the cached on-chain metadata of a token; raises if it is not an ERC-20."""
+    token_address = Web3.to_checksum_address(token_address)
+    return await metadata_cache.get_or_fetch(token_address, lambda: fetch_chain_metadata(token_address))
+
+
+async def get_many_token_metadata(token_addresses):
+    """Return ``{address: metadata}`` from the metadata cache, fetching all misses in one batch.
+
+    Tokens that are not ERC-20 contracts are left out.
+    """
+    result = {}
+    missing = []
+    for token_address in token_addresses:
+        token_address = Web3.to_checksum_address(token_address)
+        metadata, _ = metadata_cache.get(token_address)
+        if metadata is None:
+            missing.append(token_address)
+        else:
+            result[token_address] = metadata
+    if missing:
+        for token_address, metadata in (await fetch_token_metadata(missing)).items():
+            if metadata is not None:
+                metadata_cache.set(token_address, metadata)
+                result[token_address] = metadata
+    return result
+
+
+async def fetch_token_prices(token_addresses):
+    """Fetch current Kuru prices of many tokens, refreshing their cached market data.
+
+    Returns ``{token: price in MON}`` for the tokens that could be priced. The
+    budget for every request is taken up front, so a round that does not fit
+    raises ``RateLimitExceeded`` before anything is sent.
+    """
+    if not clients.allow("kuru", len(token_addresses)):
+        raise RateLimitExceeded("Kuru request budget exhausted")
+    markets = await asyncio.gather(
+        *[fetch_kuru_token(token_address, charged=True) for token_address in token_addresses],
+        return_exceptions=True
+    )
+    prices = {}
+    for token_address, market in zip(token_addresses, markets):
+        if isinstance(market, Exception):
+            continue
+        try:
+            price = float(market["price"])
+        except (TypeError, ValueError):
+            continue
+        if price > 0:
+            market_cache.set(("token", token_address), market)
+            prices[token_address] = price
+    return prices
+
+
+def invalidate_token(token_address):
+    """Drop the cached market data of a token so the next card refetches it."""
+    token_address = Web3.to_checksum_address(token_address)
+    market_cache.invalidate(("token", token_address))
+    market_cache.invalidate(("pair", token_address))
+
+
+def clear_market_data():
+    """Drop the cached market data of every token."""
+    market_cache.clear()
+
+
+def cache_stats():
+    """Return hit/miss counters of the token info caches."""
+    return {
+        "metadata": metadata_cache.stats(),
+        "market": market_cache.stats(),
+        "socials": socials_cache.stats(),
+        "pipeline": {"calls": token_info_flight.calls, "coalesced": token_info_flight.shared}
+    }
@@ -0,0 +1,164 @@
+"""
+Batched ERC-20 metadata reads.
+
+``name()``, ``symbol()``, ``decimals()`` and ``totalSupply()`` for any
+number of tokens are resolved in a single round-trip: through a Multicall3
+``aggregate3`` call when the contract is deployed on the chain, otherwise
+as one JSON-RPC batch of ``eth_call``s.
+"""
+import logging
+
+from eth_abi import decode, encode
+from web3 import Web3
+
+import clients
+from config import MULTICALL3_ADDRESS, MULTICALL_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Function selectors of the metadata getters, in the order they are read
+ERC20_METADATA_CALLS = [
+    ("name", "0x06fdde03"),
+    ("symbol", "0x95d89b41"),
+    ("decimals", "0x313ce567"),
+    ("total_supply", "0x18160ddd"),
+]
+
+# balanceOf(address), read by the portfolio and the trade templates
+BALANCE_OF = bytes.fromhex("70a08231")
+
+# aggregate3((address target, bool allowFailure, bytes callData)[])
+AGGREGATE3_SELECTOR = "0x82ad56cb"
+
+_multicall_available = None
+
+
+def _decode_string(data):
+    """Decode a string return value, accepting legacy bytes32 tokens."""
+    try:
+        return decode(["string"], data)[0]
+    except Exception:
+        if len(data) == 32:
+            return data.rstrip(b"\x00").decode("utf-8", errors="replace")
+        raise
+
+
+def _decode_metadata(raw):
+    """Turn the four raw return values of a token into a metadata dict."""
+    if any(value is None or len(value) == 0 for value in raw):
+        return None
+    try:
+        return {
+            "name": _decode_string(raw[0]),
+            "symbol": _decode_string(raw[1]),
+            "decimals": decode(["uint8"], raw[2])[0],
+            "total_supply": decode(["uint256"], raw[3])[0],
+        }
+    except Exception:
+        return None
+
+
+async def _has_multicall():
+    """Check once whether Multicall3 is deployed on the configured chain."""
+    global _multicall_available
+    if _multicall_available is None:
+        if not MULTICALL3_ADDRESS:
+            _multicall_available = False
+        else:
+            try:
+                code = await clients.rpc_call("eth_getCode", [MULTICALL3_ADDRESS, "latest"])
+                _multicall_available = code not in (None, "0x", "0x0")
+            except Exception as e:
+                logger.error(f"Error checking Multicall3 deployment: {str(e)}")
+                return False
+    return _multicall_available
+
+
+async def _read_with_batch(addresses):
+    """Read metadata with one JSON-RPC batch of plain eth_calls."""
+    calls = [
+        ("eth_call", [{"to": address, "data": selector}, "latest"])
+        for address in addresses
+        for _, selector in ERC20_METADATA_CALLS
+    ]
+    results = await clients.rpc_batch(calls)
+
+    width = len(ERC20_METADATA_CALLS)
+    raw = {}
+    for i, address in enumerate(addresses):
+        values = []
+        for result in results[i * width:(i + 1) * width]:
+            values.append(None if isinstance(result, clients.RPCError) else bytes.fromhex(result[2:]))
+        raw[address] = values
+    return raw
+
+
+async def read_multicall(calls):
+    """Run ``(target, calldata)`` pairs through Multicall3 ``aggregate3``.
+
+    Calls are split into chunks of ``MULTICALL_CHUNK_SIZE`` and every chunk
+    is sent in the same JSON-RPC batch. Returns the raw return data of each
+    call, or None for calls that reverted.
+    """
+    chunks = [calls[i:i + MULTICALL_CHUNK_SIZE] for i in range(0, len(calls), MULTICALL_CHUNK_SIZE)]
+    requests = []
+    for chunk in chunks:
+        encoded = [(target, True, bytes.fromhex(data[2:])) for target, data in chunk]
+        data = AGGREGATE3_SELECTOR + encode(["(address,bool,bytes)[]"], [encoded]).hex()
+        requests.append(("eth_call", [{"to": MULTICALL3_ADDRESS, "data": data}, "latest"]))
+
+    values = []
+    for chunk, result in zip(chunks, await clients.rpc_batch(requests)):
+        if isinstance(result, clients.RPCError):
+            values.extend([None] * len(chunk))
+            continue
+        for success, return_data in decode(["(bool,bytes)[]"], bytes.fromhex(result[2:]))[0]:
+            values.append(return_data if success else None)
+    return values
+
+
+async def read_contracts(calls):
+    """Run ``(target, calldata)`` pairs in one round-trip, through Multicall3 when deployed.
+
+    Returns the raw return data of each call, or None for calls that reverted.
+    """
+    if await _has_multicall():
+        return await read_multicall(calls)
+    results = await clients.rpc_batch([
+        ("eth_call", [{"to": target, "data": data}, "latest"]) for target, data in calls
+    ])
+    return [None if isinstance(result, clients.RPCError) else bytes.fromhex(result[2:]) for result in results]
+
+
+async def _read_with_multicall(addresses):
+    """Read metadata through Multicall3."""
+    calls = [
+        (address, selector)
+        for address in addresses
+        for _, selector in ERC20_METADATA_CALLS
+    ]
+    values = await read_multicall(calls)
+
+    width = len(ERC20_METADATA_CALLS)
+    return {
+        address: values[i * width:(i + 1) * width]
+        for i, address in enumerate(addresses)
+    }
+
+
+async def fetch_token_metadata(token_addresses):
+    """Fetch name, symbol, decimals and total supply for many tokens at once.
+
+    Returns a dict keyed by checksummed address; tokens that are not valid
+    ERC-20 contracts map to None.
+    """
+    addresses = list(dict.fromkeys(Web3.to_checksum_address(a) for a in token_addresses))
+    if not addresses:
+        return {}
+
+    if await _has_multicall():
+        raw = await _read_with_multicall(addresses)
+    else:
+        raw = await _read_with_batch(addresses)
+
+    return {address: _decode_metadata(raw[address]) for address in addresses}
@@ -0,0 +1,355 @@
+"""
+Buy and sell execution against a UniswapV2-compatible swap router.
+
+Everything a swap needs except its size is prepared before the user clicks:
+the wallet's account and warmed nonce, the user's gas price and slippage,
+the pool and its reserves, and for sells the token balance and router
+allowance. A click only computes the amount and minimum output from the
+cached reserves, signs once and sends ``eth_sendRawTransaction``. Preparing
+never sends anything: the router approval a wallet needs before its first
+sell of a token is signed on the sell click and broadcast in the same batch
+as the swap, which takes the next nonce. A buy
+with several wallets signs one transaction per wallet, each from its own
+nonce stream, and broadcasts them all in a single JSON-RPC batch. The time
+from click to broadcast is recorded in ``broadcast_latency``.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from eth_abi import decode, encode
+from eth_account import Account
+from web3 import Web3
+
+from cache import SingleFlight
+from config import DEX_ROUTER_ADDRESS, SWAP_GAS_LIMIT, SWAP_DEADLINE, TRADE_TEMPLATE_TTL
+from metrics import registry
+from token_metadata import BALANCE_OF, read_contracts
+from transactions import nonce_manager, sign_transaction, broadcast, broadcast_many, wait_for_receipt
+
+logger = logging.getLogger(__name__)
+
+MAX_UINT256 = 2 ** 256 - 1
+ZERO_ADDRESS = "0x" + "00" * 20
+
+
+def _selector(signature):
+    return Web3.keccak(text=signature)[:4]
+
+
+FACTORY = _selector("factory()")
+WETH = _selector("WETH()")
+GET_PAIR = _selector("getPair(address,address)")
+TOKEN0 = _selector("token0()")
+GET_RESERVES = _selector("getReserves()")
+ALLOWANCE = _selector("allowance(address,address)")
+APPROVE = _selector("approve(address,uint256)")
+SWAP_EXACT_ETH_FOR_TOKENS = _selector("swapExactETHForTokens(uint256,address[],address,uint256)")
+SWAP_EXACT_TOKENS_FOR_ETH = _selector("swapExactTokensForETH(uint256,uint256,address[],address,uint256)")
+
+
+def _calldata(selector, types=(), args=()):
+    return "0x" + (selector + encode(list(types), list(args))).hex()
+
+
+def _set_gas_price(tx, gas_price):
+    """Bid ``gas_price`` wei; without one, sign_transaction uses the node's gas price."""
+    if gas_price is not None:
+        tx["gasPrice"] = gas_price
+    return tx
+
+
+def get_amount_out(amount_in, reserve_in, reserve_out):
+    """Output of a constant-product pool for an exact input, after the 0.3% fee."""
+    amount_in_with_fee = amount_in * 997
+    return amount_in_with_fee * reserve_out // (reserve_in * 1000 + amount_in_with_fee)
+
+
+def apply_slippage(amount, slippage):
+    """Minimum acceptable output for a slippage tolerance in percent."""
+    return amount * (10000 - int(slippage * 100)) // 10000
+
+
+class TradeError(Exception):
+    """A trade could not be prepared or sent."""
+
+
+class TradeTemplate:
+    """Everything needed to sign a swap except its size."""
+
+    def __init__(self, side, wallet, account, token, pair, token_is_token0, gas_price, slippage):
+        self.side = side
+        self.private_key = wallet["private_key"]
+        self.account = account
+        self.token = token
+        self.pair = pair
+        self.token_is_token0 = token_is_token0
+        self.gas_price = gas_price
+        self.slippage = slippage
+        self.reserve_token = 0
+        self.reserve_native = 0
+        self.token_balance = 0
+        self.allowance = 0
+        self.prepared_at = 0.0
+
+    @property
+    def fresh(self):
+        return time.monotonic() - self.prepared_at < TRADE_TEMPLATE_TTL
+
+
+class SnipeEngine:
+    """Prepared buy and sell templates per user, signed and sent on click."""
+
+    def __init__(self, router_address=DEX_ROUTER_ADDRESS):
+        self.router_address = router_address
+        self.factory = None
+        self.wrapped_native = None
+        self._pairs = {}
+        self._templates = {}
+        self._by_token = defaultdict(set)
+        # (wallet, token) -> (tx hash, nonce) of a router approval not yet mined
+        self._approvals = {}
+        self._tasks = set()
+        self._flight = SingleFlight()
+        self.broadcast_latency = registry.histogram("trade_broadcast_seconds", "Trade click to broadcast latency")
+
+    async def _load_router(self):
+        if self.factory is not None:
+            return
+        if not self.router_address:
+            raise TradeError("DEX_ROUTER_ADDRESS is not configured")
+        router = Web3.to_checksum_address(self.router_address)
+        factory, wrapped = await read_contracts([(router, _calldata(FACTORY)), (router, _calldata(WETH))])
+        if factory is None or wrapped is None:
+            raise TradeError("Swap router not found")
+        self.router_address = router
+        self.factory = decode(["address"], factory)[0]
+        self.wrapped_native = decode(["address"], wrapped)[0]
+
+    async def _load_pair(self, token):
+        pair = self._pairs.get(token)
+        if pair is None:
+            raw = (await read_contracts([
+                (self.factory, _calldata(GET_PAIR, ["address", "address"], [token, self.wrapped_native]))
+            ]))[0]
+            address = decode(["address"], raw)[0] if raw else ZERO_ADDRESS
+            if int(address, 16) == 0:
+                raise TradeError("No liquidity pool for this token")
+            token0 = (await read_contracts([(address, _calldata(TOKEN0))]))[0]
+            if token0 is None:
+                raise TradeError("Could not read the liquidity pool")
+            pair = (Web3.to_checksum_address(address), decode(["address"], token0)[0].lower() == token.lower())
+            self._pairs[token] = pair
+        return pair
+
+    async def prepare(self, user_id, side, wallet, token, gas_price, slippage):
+        """Return the ``side`` template of a user's wallet for a token, building or refreshing it if needed.
+
+        ``gas_price`` is in wei (None for the network price) and ``slippage`` in percent.
+        """
+        token = Web3.to_checksum_address(token)
+        key = (user_id, side, wallet["address"])
+        template = self._templates.get(key)
+        if template is not None and template.token == token and template.private_key == wallet["private_key"]:
+            template.gas_price = gas_price
+            template.slippage = slippage
+            if template.fresh:
+                return template
+        return await self._flight.do(key, lambda: self._build(key, wallet, token, gas_price, slippage))
+
+    async def prepare_many(self, user_id, side, wallets, token, gas_price, slippage):
+        """Prepare templates for several wallets concurrently."""
+        return await asyncio.gather(*[
+            self.prepare(user_id, side, wallet, token, gas_price, slippage) for wallet in wallets
+        ])
+
+    async def _build(self, key, wallet, token, gas_price, slippage):
+        side = key[1]
+        await self._load_router()
+        pair, token_is_token0 = await self._load_pair(token)
+
+        old = self._templates.get(key)
+        if old is not None and old.private_key == wallet["private_key"]:
+            account = old.account
+        else:
+            account = Account.from_key(wallet["private_key"])
+        template = TradeTemplate(side, wallet, account, token, pair, token_is_token0, gas_price, slippage)
+        await asyncio.gather(nonce_manager.warm(account.address), self._refresh(template))
+
+        if old is not None:
+            self._by_token[old.token.lower()].discard(key)
+        self._templates[key] = template
+        self._by_token[token.lower()].add(key)
+        return template
+
+    async def _refresh(self, template):
+        calls = [(template.pair, _calldata(GET_RESERVES))]
+        if template.side == "sell":
+            owner = template.account.address
+            calls.append((template.token, _calldata(BALANCE_OF, ["address"], [owner])))
+            calls.append((template.token, _calldata(ALLOWANCE, ["address", "address"], [owner, self.router_address])))
+        results = await read_contracts(calls)
+        if results[0] is None:
+            raise TradeError("Could not read pool reserves")
+
+        reserve0, reserve1, _ = decode(["uint112", "uint112", "uint32"], results[0])
+        if template.token_is_token0:
+            template.reserve_token, template.reserve_native = reserve0, reserve1
+        else:
+            template.reserve_token, template.reserve_native = reserve1, reserve0
+        if template.side == "sell":
+            template.token_balance = decode(["uint256"], results[1])[0] if results[1] else 0
+            template.allowance = decode(["uint256"], results[2])[0] if results[2] else 0
+        template.prepared_at = time.monotonic()
+
+    def _buy_tx(self, template, amount_in, reserve_native, reserve_token):
+        expected = get_amount_out(amount_in, reserve_native, reserve_token)
+        if expected == 0:
+            raise TradeError("Pool has no liquidity")
+        data = _calldata(
+            SWAP_EXACT_ETH_FOR_TOKENS,
+            ["uint256", "address[]", "address", "uint256"],
+            [
+                apply_slippage(expected, template.slippage),
+                [self.wrapped_native, template.token],
+                template.account.address,
+                int(time.time()) + SWAP_DEADLINE
+            ]
+        )
+        tx = {"to": self.router_address, "value": amount_in, "data": data, "gas": SWAP_GAS_LIMIT}
+        return _set_gas_price(tx, template.gas_price), expected
+
+    async def buy(self, template, amount_in, started):
+        """Spend ``amount_in`` wei on the template's token; returns ``(tx_hash, expected_out)``."""
+        if not template.fresh:
+            await self._refresh(template)
+        tx, expected = self._buy_tx(template, amount_in, template.reserve_native, template.reserve_token)
+        return await self._send(template, tx, started), expected
+
+    async def buy_many(self, templates, amount_in, started):
+        """Spend ``amount_in`` wei from every template's wallet in one broadcast batch.
+
+        Returns ``(tx_hash or TradeError/TransactionError, expected_out)`` per template.
+        Expected outputs assume the buys land in order, each moving the pool.
+        """
+        stale = [template for template in templates if not template.fresh]
+        if stale:
+            await asyncio.gather(*[self._refresh(template) for template in stale])
+
+        reserve_native, reserve_token = templates[0].reserve_native, templates[0].reserve_token
+        results = [None] * len(templates)
+        signed = []
+        for i, template in enumerate(templates):
+            try:
+                tx, expected = self._buy_tx(template, amount_in, reserve_native, reserve_token)
+                signed.append((i, template.account.address, await sign_transaction(template.account, tx)))
+            except Exception as e:
+                results[i] = (e, 0)
+                continue
+            reserve_native += amount_in
+            reserve_token -= expected
+            results[i] = (None, expected)
+
+        hashes = await broadcast_many([(sender, raw) for _, sender, raw in signed])
+        self.broadcast_latency.observe(time.perf_counter() - started)
+        for (i, _, _), tx_hash in zip(signed, hashes):
+            results[i] = (tx_hash, results[i][1])
+        return results
+
+    async def sell(self, template, percentage, started):
+        """Sell a percentage of the wallet's token balance; returns ``(tx_hash, expected_out)``."""
+        if not template.fresh:
+            await self._refresh(template)
+        amount_in = template.token_balance * percentage // 100
+        if amount_in == 0:
+            raise TradeError("No token balance to sell")
+        expected = get_amount_out(amount_in, template.reserve_token, template.reserve_native)
+        data = _calldata(
+            SWAP_EXACT_TOKENS_FOR_ETH,
+            ["uint256", "uint256", "address[]", "address", "uint256"],
+            [
+                amount_in,
+                apply_slippage(expected, template.slippage),
+                [template.token, self.wrapped_native],
+                template.account.address,
+                int(time.time()) + SWAP_DEADLINE
+            ]
+        )
+        tx = {"to": self.router_address, "value": 0, "data": data}
+        key = (template.account.address, template.token)
+        if template.allowance < amount_in and key not in self._approvals:
+            tx_hash = await self._send_with_approval(template, tx, started)
+        else:
+            tx_hash = await self._send(template, tx, started)
+        template.token_balance -= amount_in
+        return tx_hash, expected
+
+    async def _send_with_approval(self, template, tx, started):
+        """Broadcast a router approval and the swap after it in one batch."""
+        sender = template.account.address
+        nonce = await nonce_manager.reserve(sender)
+        approve = _set_gas_price({
+            "to": template.token,
+            "value": 0,
+            "data": _calldata(APPROVE, ["address", "uint256"], [self.router_address, MAX_UINT256]),
+            "nonce": nonce
+        }, template.gas_price)
+        tx["gas"] = SWAP_GAS_LIMIT
+        _set_gas_price(tx, template.gas_price)
+        approval_hash, tx_hash = await broadcast_many([
+            (sender, await sign_transaction(template.account, approve)),
+            (sender, await sign_transaction(template.account, tx))
+        ])
+        self.broadcast_latency.observe(time.perf_counter() - started)
+        if isinstance(approval_hash, Exception):
+            raise TradeError(f"Approval failed: {str(approval_hash)}")
+        self._track_approval((sender, template.token), approval_hash, nonce)
+        if isinstance(tx_hash, Exception):
+            raise TradeError(str(tx_hash))
+        return tx_hash
+
+    def _track_approval(self, key, tx_hash, nonce):
+        self._approvals[key] = (tx_hash, nonce)
+        task = asyncio.ensure_future(self._await_approval(key, tx_hash))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _await_approval(self, key, tx_hash):
+        """Forget a pending approval once it is mined, so later sells go by the allowance on chain."""
+        try:
+            if not await wait_for_receipt(tx_hash):
+                logger.error(f"Approval {tx_hash} reverted")
+        except Exception as e:
+            logger.error(f"Error waiting for approval {tx_hash}: {str(e)}")
+        if self._approvals.get(key, (None,))[0] == tx_hash:
+            del self._approvals[key]
+        # Reread the allowance before the next sell
+        self.invalidate_token(key[1])
+
+    async def _send(self, template, tx, started):
+        tx["gas"] = SWAP_GAS_LIMIT
+        _set_gas_price(tx, template.gas_price)
+        raw = await sign_transaction(template.account, tx)
+        tx_hash = await broadcast(template.account.address, raw)
+        self.broadcast_latency.observe(time.perf_counter() - started)
+        return tx_hash
+
+    def invalidate_token(self, token):
+        """Mark templates of a token stale so the next click rereads its reserves."""
+        for key in self._by_token.get(token.lower(), ()):
+            template = self._templates.get(key)
+            if template is not None:
+                template.prepared_at = 0.0
+
+    def invalidate_all(self):
+        """Mark every template stale, e.g. after blocks were skipped."""
+        for template in self._templates.values():
+            template.prepared_at = 0.0
+
+    def stats(self):
+        """Return click-to-broadcast latency statistics (seconds)."""
+        return self.broadcast_latency.snapshot()
+
+
+snipe_engine = SnipeEngine()
@@ -0,0 +1,219 @@
+"""
+Transaction signing, submission and receipt tracking.
+
+Nonces are handed out locally per sender, so several transactions from one
+wallet can be signed and broadcast back to back without waiting for the
+previous receipt; the counter is resynced from the node's pending nonce
+whenever signing or a submission fails. Receipts of every in-flight transaction are
+polled together in one JSON-RPC batch per interval.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from eth_abi import encode
+from eth_account import Account
+from web3 import Web3
+
+import clients
+from config import (
+    CHAIN_ID,
+    DEFAULT_GAS_LIMIT,
+    NATIVE_TRANSFER_GAS,
+    GAS_PRICE_TTL,
+    RECEIPT_POLL_INTERVAL,
+    RECEIPT_TIMEOUT
+)
+from metrics import queue_depth
+
+logger = logging.getLogger(__name__)
+
+# transfer(address,uint256)
+ERC20_TRANSFER_SELECTOR = "0xa9059cbb"
+
+
+class TransactionError(Exception):
+    """A transaction could not be submitted or did not confirm."""
+
+
+class NonceManager:
+    """Hand out consecutive nonces per sender address."""
+
+    def __init__(self):
+        self._next = {}
+        self._locks = defaultdict(asyncio.Lock)
+
+    async def _pending_nonce(self, address):
+        return int(await clients.rpc_call("eth_getTransactionCount", [address, "pending"]), 16)
+
+    async def warm(self, address):
+        """Read the pending nonce ahead of time so the next reservation is local."""
+        async with self._locks[address]:
+            if address not in self._next:
+                self._next[address] = await self._pending_nonce(address)
+
+    async def reserve(self, address):
+        """Return the next unused nonce of an address."""
+        async with self._locks[address]:
+            nonce = self._next.get(address)
+            if nonce is None:
+                nonce = await self._pending_nonce(address)
+            self._next[address] = nonce + 1
+            return nonce
+
+    def resync(self, address):
+        """Forget the local counter; the next reservation rereads the pending nonce."""
+        self._next.pop(address, None)
+
+
+class GasPriceOracle:
+    """Cache ``eth_gasPrice`` for a short time so bursts of sends share one read."""
+
+    def __init__(self, ttl=GAS_PRICE_TTL):
+        self.ttl = ttl
+        self._price = None
+        self._fetched_at = 0.0
+
+    async def get(self):
+        if self._price is None or time.monotonic() - self._fetched_at > self.ttl:
+            self._price = int(await clients.rpc_call("eth_gasPrice", []), 16)
+            self._fetched_at = time.monotonic()
+        return self._price
+
+
+class ReceiptTracker:
+    """Wait for receipts, polling all pending transactions in one batch."""
+
+    def __init__(self, interval=RECEIPT_POLL_INTERVAL, timeout=RECEIPT_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self._pending = {}
+        self._task = None
+
+    def pending(self):
+        return len(self._pending)
+
+    async def wait(self, tx_hash):
+        """Return the receipt of a transaction; raises TransactionError on timeout."""
+        future = self._pending.get(tx_hash)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[tx_hash] = future
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(tx_hash, None)
+            raise TransactionError(f"No receipt for {tx_hash} after {self.timeout}s")
+
+    async def _poll(self):
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            hashes = list(self._pending)
+            try:
+                results = await clients.rpc_batch(
+                    [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in hashes]
+                )
+            except Exception as e:
+                logger.error(f"Error polling receipts: {str(e)}")
+                continue
+            for tx_hash, receipt in zip(hashes, results):
+                if receipt is None or isinstance(receipt, clients.RPCError):
+                    continue
+                future = self._pending.pop(tx_hash, None)
+                if future is not None and not future.done():
+                    future.set_result(receipt)
+
+
+nonce_manager = NonceManager()
+gas_price_oracle = GasPriceOracle()
+receipt_tracker = ReceiptTracker()
+queue_depth.labels("pending_receipts").set_function(receipt_tracker.pending)
+
+
+async def sign_transaction(account, tx):
+    """Sign ``tx`` for a LocalAccount, filling in chain id, gas price and, unless given, the next nonce.
+
+    Returns the raw signed transaction. No RPC call is made when the sender's
+    nonce is already known and ``tx`` carries its own gas price. If signing
+    fails the sender's counter is resynced, as the nonce is never used.
+    """
+    tx = dict(tx)
+    tx.setdefault("gas", DEFAULT_GAS_LIMIT)
+    tx["chainId"] = CHAIN_ID
+    if "gasPrice" not in tx:
+        tx["gasPrice"] = await gas_price_oracle.get()
+    if "nonce" not in tx:
+        tx["nonce"] = await nonce_manager.reserve(account.address)
+    try:
+        return Web3.to_hex(account.sign_transaction(tx).rawTransaction)
+    except Exception:
+        nonce_manager.resync(account.address)
+        raise
+
+
+async def broadcast(sender, raw_transaction):
+    """Submit a signed transaction; returns its hash without waiting for it to be mined."""
+    try:
+        return await clients.rpc_call("eth_sendRawTransaction", [raw_transaction])
+    except Exception as e:
+        # The reserved nonce was not used; later sends must not leave a gap
+        nonce_manager.resync(sender)
+        raise TransactionError(str(e)) from e
+
+
+async def broadcast_many(signed):
+    """Submit ``(sender, raw_transaction)`` pairs in one JSON-RPC batch.
+
+    Returns a transaction hash or a ``TransactionError`` per transaction.
+    """
+    try:
+        results = await clients.rpc_batch([("eth_sendRawTransaction", [raw]) for _, raw in signed])
+    except Exception as e:
+        results = [e] * len(signed)
+    hashes = []
+    for (sender, _), result in zip(signed, results):
+        if isinstance(result, Exception):
+            nonce_manager.resync(sender)
+            result = TransactionError(str(result))
+        hashes.append(result)
+    return hashes
+
+
+async def send_transaction(private_key, tx):
+    """Sign ``tx`` with a private key and broadcast it; returns the transaction hash."""
+    account = Account.from_key(private_key)
+    return await broadcast(account.address, await sign_transaction(account, tx))
+
+
+async def send_native(private_key, to_address, amount_wei):
+    """Send native MON; returns the transaction hash."""
+    return await send_transaction(private_key, {
+        "to": Web3.to_checksum_address(to_address),
+        "value": amount_wei,
+        "gas": NATIVE_TRANSFER_GAS,
+    })
+
+
+async def send_erc20(private_key, token_address, to_address, amount):
+    """Call ``transfer(to, amount)`` on an ERC-20 token; returns the transaction hash."""
+    sender = Account.from_key(private_key).address
+    data = ERC20_TRANSFER_SELECTOR + encode(
+        ["address", "uint256"], [Web3.to_checksum_address(to_address), amount]
+    ).hex()
+    tx = {"to": Web3.to_checksum_address(token_address), "value": 0, "data": data}
+    try:
+        estimate = await clients.rpc_call("eth_estimateGas", [{"from": sender, "to": tx["to"], "data": data}])
+        tx["gas"] = int(int(estimate, 16) * 1.2)
+    except Exception as e:
+        # A reverting transfer (e.g. insufficient token balance) fails here, before a nonce is used
+        raise TransactionError(str(e)) from e
+    return await send_transaction(private_key, tx)
+
+
+async def wait_for_receipt(tx_hash):
+    """Wait until a transaction is mined; returns True if it succeeded."""
+    receipt = await receipt_tracker.wait(tx_hash)
+    return int(receipt.get("status", "0x0"), 16) == 1
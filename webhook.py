@@ -0,0 +1,252 @@
+"""
+Webhook ingestion mode.
+
+An embedded aiohttp server receives updates pushed by Telegram, checks the
+secret token and hands them to a fixed pool of worker tasks. Updates are
+sharded onto the workers by chat id, so every chat is processed in order
+while different chats run in parallel. Each worker has a bounded queue;
+when it is full the request is held open and finally answered with 503,
+which makes Telegram back off and retry.
+
+Sharded workers run the same server on a private port. The front process
+posts them JSON arrays of updates and is told how many were queued, so it
+can resend the rest in order.
+
+Delivery is at least once: Telegram redelivers an update whose response got
+lost, and the front resends a batch whose request timed out after the worker
+had queued part of it. The server remembers the last ``UPDATE_DEDUP_WINDOW``
+update ids it queued and acknowledges repeats without handling them again.
+
+Polling mode keeps the same per-chat order with ``ChatOrderedUpdateProcessor``.
+"""
+import asyncio
+import hmac
+import logging
+import signal
+from collections import OrderedDict
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_WORKERS,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_ENQUEUE_TIMEOUT,
+    WEBHOOK_MAX_CONNECTIONS,
+    UPDATE_DEDUP_WINDOW
+)
+from metrics import queue_depth
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_shard_key(data):
+    """Return the id used to keep updates of one chat (or user) in order."""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if field in data:
+            return data[field]["chat"]["id"]
+    callback_query = data.get("callback_query")
+    if callback_query:
+        message = callback_query.get("message")
+        if message:
+            return message["chat"]["id"]
+        return callback_query["from"]["id"]
+    for value in data.values():
+        if isinstance(value, dict) and "from" in value:
+            return value["from"]["id"]
+    return data.get("update_id", 0)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different chats concurrently but those of one chat in order.
+
+    PTB's default processor runs every update at once, so a text reply and a
+    button press of one user could race on its ``user_data``.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # chat id -> [lock, updates holding or waiting for it]
+        self._chats = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        user = getattr(update, "effective_user", None)
+        key = chat.id if chat else user.id if user else None
+        if key is None:
+            await coroutine
+            return
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class WebhookServer:
+    """Receive Telegram updates over HTTP and process them per chat in order."""
+
+    def __init__(self, process_update, bot, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT,
+                 path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, workers=WEBHOOK_WORKERS,
+                 queue_size=WEBHOOK_QUEUE_SIZE, enqueue_timeout=WEBHOOK_ENQUEUE_TIMEOUT,
+                 dedup_window=UPDATE_DEDUP_WINDOW):
+        if not secret_token:
+            raise ValueError("The webhook server needs a secret token")
+        self.process_update = process_update
+        self.bot = bot
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.enqueue_timeout = enqueue_timeout
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.dedup_window = dedup_window
+        # Ids of the most recently queued updates, oldest first
+        self._seen = OrderedDict()
+        self._workers = []
+        self._runner = None
+        self.rejected = 0
+        self.duplicates = 0
+
+    def queue_depth(self):
+        """Return the number of updates waiting in all worker queues."""
+        return sum(queue.qsize() for queue in self.queues)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        self._workers = [
+            asyncio.create_task(self._work(queue), name=f"webhook-worker-{i}")
+            for i, queue in enumerate(self.queues)
+        ]
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Stop accepting updates, finish the queued ones and stop the workers."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+        for queue in self.queues:
+            await queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def _handle(self, request):
+        received = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received, self.secret_token):
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        if not isinstance(data, list):
+            if not await self._enqueue(data):
+                # Telegram retries failed deliveries, which throttles it for us
+                return web.Response(status=503)
+            return web.Response()
+
+        # A batch from the sharding front; it resends whatever was not accepted
+        for accepted, update in enumerate(data):
+            if not await self._enqueue(update):
+                return web.json_response({"accepted": accepted}, status=503)
+        return web.json_response({"accepted": len(data)})
+
+    async def _enqueue(self, data):
+        update_id = data.get("update_id")
+        if update_id in self._seen:
+            # Already queued once; acknowledge so it is not sent again
+            self.duplicates += 1
+            return True
+        if update_id is not None:
+            # Claimed before waiting for queue space so a concurrent resend is dropped too
+            self._seen[update_id] = None
+            if len(self._seen) > self.dedup_window:
+                self._seen.popitem(last=False)
+        queue = self.queues[hash(update_shard_key(data)) % len(self.queues)]
+        try:
+            await asyncio.wait_for(queue.put(data), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self._seen.pop(update_id, None)
+            self.rejected += 1
+            return False
+        return True
+
+    async def _work(self, queue):
+        while True:
+            data = await queue.get()
+            try:
+                await self.process_update(Update.de_json(data, self.bot))
+            except Exception as e:
+                logger.error(f"Error processing webhook update: {str(e)}")
+            finally:
+                queue.task_done()
+
+
+def stop_on_signals(stop_event):
+    """Set ``stop_event`` on SIGINT/SIGTERM."""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows event loops do not support signal handlers
+            pass
+
+
+async def run_webhook(application, server=None):
+    """Run the application in webhook mode until SIGINT/SIGTERM.
+
+    With a ``server`` given, updates come from it and no webhook is registered.
+    """
+    register = server is None
+    if register:
+        server = WebhookServer(application.process_update, application.bot)
+    queue_depth.labels("webhook").set_function(server.queue_depth)
+    stop_event = asyncio.Event()
+    stop_on_signals(stop_event)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+        if register:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+
+    if application.post_shutdown:
+        await application.post_shutdown(application)